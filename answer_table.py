@@ -0,0 +1,163 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from chunker import markdown_blocks, split_front_matter
+
+logger = logging.getLogger(__name__)
+
+
+TITLE_TAG = re.compile(r"\s*\[[^\]]*\]\s*")  # "[TDS Jan 2025]" and the like
+MIN_QUESTION_WORDS = 3  # Shorter titles ("Need friends", "Course drop") are too vague to answer once for all
+
+
+# Canonical questions, {question: origin}: Discourse topic titles, and course-page headings prefixed with their page title
+def canonical_questions(discourse_dir, pages_dir):
+    questions, seen = {}, set()
+
+    def add(question, origin):
+        question = re.sub(r"\s+", " ", question).strip(" -:")
+        if len(question.split()) >= MIN_QUESTION_WORDS and question.lower() not in seen:
+            seen.add(question.lower())
+            questions[question] = origin
+
+    for path in sorted(glob.glob(os.path.join(discourse_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            topic = json.load(f)
+        add(TITLE_TAG.sub(" ", topic.get("title", "")), f"discourse:{topic.get('id')}")
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            meta, body = split_front_matter(f.read())
+        title = meta.get("title", os.path.splitext(os.path.basename(path))[0]).strip()
+        add(title, f"markdown:{title}")
+        for block in markdown_blocks(body):
+            if block["kind"] == "heading" and block["path"][-1] != title:
+                add(f"{title}: {block['path'][-1]}", f"markdown:{title}")
+    return questions
+
+
+# Fingerprint of the chunks an answer was generated from: which chunks, in what order, with what text
+def results_fingerprint(results):
+    digest = hashlib.sha1()
+    for result in results:
+        digest.update(f"{result['source']}:{result['id']}:".encode("utf-8"))
+        digest.update(hashlib.sha1(result["content"].encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+class AnswerTable:
+    """Answers precomputed for canonical questions, in a sidecar SQLite file next to the knowledge base.
+
+    Each entry keeps the question's embedding, the answer and links the full pipeline gave,
+    and the fingerprint of the chunks it was retrieved from, so a refresh only regenerates
+    answers whose chunks changed. `signature` is the database state the table was last
+    refreshed against; it should only be served while that is the current state.
+    The entries are also held in memory as one normalized matrix for matching, and
+    `reload_if_changed` picks up a refresh written by another process.
+    """
+
+    def __init__(self, conn, path):
+        self.conn = conn
+        self.path = path
+        self.mtime = None
+        self.signature = None
+        self.questions = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.entries = []
+        self.reload()
+
+    def __len__(self):
+        return len(self.questions)
+
+    @classmethod
+    def open(cls, path, create=False):
+        """Open a table, or return None if it is missing and `create` is not set."""
+        if not create and not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS answers (
+            question TEXT PRIMARY KEY,
+            origin TEXT,
+            embedding BLOB,
+            answer TEXT,
+            links TEXT,
+            fingerprint TEXT,
+            updated_at TEXT
+        )
+        ''')
+        conn.commit()
+        return cls(conn, path)
+
+    def reload(self):
+        started = time.perf_counter()
+        self.mtime = os.stat(self.path).st_mtime
+        meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        self.signature = tuple(json.loads(meta["signature"])) if "signature" in meta else None
+        rows = self.conn.execute("SELECT question, embedding, answer, links, fingerprint FROM answers").fetchall()
+        self.questions = [row[0] for row in rows]
+        self.entries = [{"answer": row[2], "links": json.loads(row[3]), "fingerprint": row[4]} for row in rows]
+        if rows:
+            embeddings = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            self.embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        else:
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        logger.info(f"Loaded {len(rows)} precomputed answers in {time.perf_counter() - started:.2f}s")
+
+    def reload_if_changed(self):
+        if os.stat(self.path).st_mtime != self.mtime:
+            self.reload()
+
+    def is_current(self, signature):
+        return self.signature is not None and list(self.signature) == list(signature)
+
+    def match(self, query_embedding, min_similarity):
+        """The entry closest to the query as {"question", "similarity", "answer", "links"}, or None below `min_similarity`."""
+        if not self.questions:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self.embeddings @ (query / np.linalg.norm(query))
+        best = int(np.argmax(similarities))
+        if similarities[best] < min_similarity:
+            return None
+        entry = self.entries[best]
+        return {"question": self.questions[best], "similarity": float(similarities[best]),
+                "answer": entry["answer"], "links": entry["links"]}
+
+    def stored_embeddings(self):
+        return dict(zip(self.questions, self.embeddings))
+
+    def fingerprints(self):
+        return {question: entry["fingerprint"] for question, entry in zip(self.questions, self.entries)}
+
+    def put(self, question, origin, embedding, answer, links, fingerprint):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (question, origin, np.asarray(embedding, dtype=np.float32).tobytes(), answer, json.dumps(links),
+             fingerprint, datetime.now(timezone.utc).isoformat()),
+        )
+        self.conn.commit()
+
+    def retain(self, questions):
+        """Delete every entry whose question is not in `questions`; returns how many were deleted."""
+        stale = [question for question in self.questions if question not in questions]
+        self.conn.executemany("DELETE FROM answers WHERE question = ?", [(question,) for question in stale])
+        self.conn.commit()
+        return len(stale)
+
+    def stamp(self, signature):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (json.dumps(list(signature)),))
+        self.conn.commit()
+        self.signature = tuple(signature)
+
+    def close(self):
+        self.conn.close()
@@ -3,19 +3,47 @@ import json
 import sqlite3
 import numpy as np
 import re
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Body
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Body, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
+from datetime import datetime, timezone
 import aiohttp
 import asyncio
+import contextvars
 import logging
 import base64
-from fastapi.responses import JSONResponse
+import binascii
+import hashlib
+import hmac
+import io
+import itertools
+import pathlib
+import time
+import random
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager, AsyncExitStack
+from PIL import Image, ImageOps
+from context_packer import pack_context, count_tokens, get_encoding, source_key
+from vector_index import (
+    VectorIndex, SectionSummaries, SOURCE_DISCOURSE, SOURCE_MARKDOWN,
+    select_top_grouped, mmr_select, batch_top_k, two_stage_top_k, hierarchical_top_k,
+)
+from sharded_search import ShardedSearcher
+from resilience import UpstreamEndpoint, UpstreamError, CircuitOpenError, is_retryable
+from local_embedding import LocalEmbedder
+from near_duplicates import find_near_duplicates
+from chunk_store import ChunkStore
+from answer_table import AnswerTable
+from request_profiler import RequestProfiler, ARTIFACTS
+from request_journal import RequestJournal
+from kb_collections import CollectionRegistry, parse_collections
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 import traceback
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 
 
@@ -25,18 +53,123 @@ logger = logging.getLogger(__name__)
 
 
 # Constants
-DB_PATH = "knowledge_base.db"
+DB_PATH = os.getenv("DB_PATH", "knowledge_base.db")
+KB_COLLECTIONS = os.getenv("KB_COLLECTIONS", "")  # name=path pairs, e.g. "2025-01=kb_2025_01.db,2025-05=kb_2025_05.db"; empty serves DB_PATH alone
+DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "")  # Served when a request names none; empty means the first collection
+INDEX_MEMORY_BUDGET_MB = int(os.getenv("INDEX_MEMORY_BUDGET_MB", 0))  # Least recently used collections are unloaded beyond this; 0 for no limit
 SIMILARITY_THRESHOLD = 0.50  # Lowered threshold for better recall
 MAX_RESULTS = 15  # Increased to get more context
 load_dotenv()
 MAX_CONTEXT_CHUNKS = 6  # Increased number of chunks per source
+MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"  # Diversify results with maximal marginal relevance
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))  # 1.0 is pure relevance, 0.0 pure diversity
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", 200))  # Top candidates MMR chooses from
+SEARCH_SHARDS = int(os.getenv("SEARCH_SHARDS", 0))  # Worker processes for exact search; 0 or 1 searches in-process
+SHARDED_SEARCH_MIN_CHUNKS = int(os.getenv("SHARDED_SEARCH_MIN_CHUNKS", 200000))  # Smaller corpora are faster in-process
+SHARD_TOP_K = max(MMR_CANDIDATES, MAX_RESULTS * MAX_CONTEXT_CHUNKS)  # Candidates each shard returns
+COARSE_DIM = int(os.getenv("COARSE_DIM", 0))  # Truncated embedding dimension scanned first (approximate); 0 scans at full dimension
+COARSE_SHORTLIST = int(os.getenv("COARSE_SHORTLIST", 1000))  # Rows per query rescored at full dimension
+HIERARCHICAL_SEARCH = os.getenv("HIERARCHICAL_SEARCH", "false").lower() == "true"  # Pick topics/pages first, then score only their chunks
+HIERARCHY_TOP_SECTIONS = int(os.getenv("HIERARCHY_TOP_SECTIONS", 50))  # Topics/pages whose chunks get scored
+HIERARCHY_MIN_SCORE = float(os.getenv("HIERARCHY_MIN_SCORE", 0.4))  # Below this best topic/page score, search every chunk
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"  # Collapse near-duplicate chunks when the index is built
+DEDUP_MIN_JACCARD = float(os.getenv("DEDUP_MIN_JACCARD", 0.8))  # Estimated word-shingle overlap of duplicates
+DEDUP_MIN_SIMILARITY = float(os.getenv("DEDUP_MIN_SIMILARITY", 0.95))  # Embedding cosine similarity of duplicates
+ANSWER_TABLE_ENABLED = os.getenv("ANSWER_TABLE_ENABLED", "true").lower() == "true"  # Serve precomputed answers (precompute_answers.py) when present
+ANSWER_TABLE_MIN_SIMILARITY = float(os.getenv("ANSWER_TABLE_MIN_SIMILARITY", 0.92))  # How close a query must be to a canonical question
+ANSWER_MODEL = os.getenv("ANSWER_MODEL", "gpt-4o-mini")
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "false").lower() == "true"  # Answer confident retrievals from a few chunks, unenriched
+FAST_PATH_MIN_SCORE = float(os.getenv("FAST_PATH_MIN_SCORE", 0.75))  # Top result similarity needed
+FAST_PATH_MIN_GAP = float(os.getenv("FAST_PATH_MIN_GAP", 0.05))  # Lead of the top result over the best other post/page
+FAST_PATH_MIN_LEXICAL = float(os.getenv("FAST_PATH_MIN_LEXICAL", 0.6))  # Share of the question's content words in the top result
+FAST_PATH_CHUNKS = int(os.getenv("FAST_PATH_CHUNKS", 3))  # Results passed to the LLM on the fast path
+FAST_PATH_TOKEN_BUDGET = int(os.getenv("FAST_PATH_TOKEN_BUDGET", 1200))  # Context tokens on the fast path
+FAST_PATH_MODEL = os.getenv("FAST_PATH_MODEL", "")  # Smaller model for the fast path; empty uses ANSWER_MODEL
+STOPWORDS = frozenset((
+    "the and for are was were what when where which who why how this that these those with from into about "
+    "can could should would will does did has have had not but you your our their there then than any all "
+    "use using get got its it's been being just also some such".split()
+))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))  # Connections kept open to the upstream
 API_KEY = os.getenv("API_KEY")  # Get API key from environment variable
+AIPIPE_BASE_URL = os.getenv("AIPIPE_BASE_URL", "https://aipipe.org/openai/v1")  # Override to point at a mock upstream
+
+
+# Image handling for multimodal queries
+MAX_IMAGE_PAYLOAD_BYTES = int(os.getenv("MAX_IMAGE_PAYLOAD_BYTES", 10 * 1024 * 1024))  # Reject larger uploads outright
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 1024 * 1024))  # Downscale images above this many pixels
+IMAGE_MAX_DECODE_PIXELS = int(os.getenv("IMAGE_MAX_DECODE_PIXELS", 40 * 1024 * 1024))  # Refuse to decode larger images at all
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 300 * 1024))  # Re-encode until the upload fits this budget
+IMAGE_JPEG_QUALITIES = (85, 75, 60, 45)  # Tried in order before shrinking dimensions further
+IMAGE_DESCRIPTION_CACHE_SIZE = 256
+IMAGE_PHASH_MAX_DISTANCE = 4  # Hamming distance at which two images count as the same screenshot
+VISION_DEADLINE_SECONDS = float(os.getenv("VISION_DEADLINE_SECONDS", 8.0))  # Serve text-only results if the image branch is slower
+
+
+# Batch questions
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", 500))  # Largest batch /api/batch accepts
+BATCH_EMBEDDING_SIZE = int(os.getenv("BATCH_EMBEDDING_SIZE", 100))  # Questions per upstream embedding call
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))  # Answers generated at once for one batch
+
+
+# Admission control and per-request deadlines
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 32))  # Queries processed at once
+MAX_QUEUED = int(os.getenv("MAX_QUEUED", 64))  # Queries allowed to wait for a slot; more are shed immediately
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("QUEUE_TIMEOUT_SECONDS", 2.0))  # Longest wait for a slot before shedding
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 30.0))  # End-to-end budget for one query
+MIN_TIME_TO_START_SECONDS = float(os.getenv("MIN_TIME_TO_START_SECONDS", 3.0))  # Shed rather than start with less time left
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", 2))  # Sent back with every 503
+
+
+# Resilient upstream calls
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", 5))  # Consecutive failures that open a breaker
+UPSTREAM_RESET_SECONDS = float(os.getenv("UPSTREAM_RESET_SECONDS", 30.0))  # How long an open breaker fails fast
+UPSTREAM_RETRY_RATIO = float(os.getenv("UPSTREAM_RETRY_RATIO", 0.2))  # Retries and hedges allowed per call, on average
+HEDGE_EMBEDDINGS = os.getenv("HEDGE_EMBEDDINGS", "true").lower() == "true"  # Duplicate embedding calls slower than p95
+
+
+# Local fallback embedding, used when the embeddings endpoint is down or too slow
+LOCAL_EMBEDDING_ENABLED = os.getenv("LOCAL_EMBEDDING_ENABLED", "true").lower() == "true"  # Fit it when the index is built
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", 256))
+EMBEDDING_ATTEMPT_SECONDS = float(os.getenv("EMBEDDING_ATTEMPT_SECONDS", 3.0))  # Per remote attempt; a slower one is retried, then falls back
+LOCAL_SIMILARITY_THRESHOLD = float(os.getenv("LOCAL_SIMILARITY_THRESHOLD", 0.1))  # Local scores run lower than remote ones
+CHUNK_STORE_ENABLED = os.getenv("CHUNK_STORE_ENABLED", "true").lower() == "true"  # Read chunk text from the compressed sidecar
+
+
+# On-demand request profiling; off unless a token is set
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # Requests sending it in PROFILE_HEADER are profiled; also guards /admin/profiles
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))  # Fraction of /api requests profiled anyway; needs PROFILE_TOKEN
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_PROFILES = int(os.getenv("PROFILE_MAX_PROFILES", 20))  # Oldest profiles are deleted beyond this
+
+
+# Request journal for replaying production traffic (benchmarks/replay_journal.py); off unless a path is set
+REQUEST_JOURNAL_PATH = os.getenv("REQUEST_JOURNAL_PATH", "")  # JSONL file /api requests are appended to
+REQUEST_JOURNAL_TEXT = os.getenv("REQUEST_JOURNAL_TEXT", "false").lower() == "true"  # Record question text, not just a hash
+REQUEST_JOURNAL_KEY = os.getenv("REQUEST_JOURNAL_KEY")  # Hash key shared across restarts; random per process if unset
 
 
 # Models
+class QueryFilters(BaseModel):
+    source: Optional[Literal["discourse", "markdown"]] = None
+    topic_id: Optional[int] = None
+    created_after: Optional[datetime] = None  # Date filters only match Discourse posts
+    created_before: Optional[datetime] = None
+    min_likes: Optional[int] = None
+
+
 class QueryRequest(BaseModel):
     question: str
     image: Optional[str] = None  # Base64 encoded image
+    filters: Optional[QueryFilters] = None  # Restrict retrieval to a slice of the corpus
+    collection: Optional[str] = None  # Knowledge base to answer from; the default collection if omitted
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    filters: Optional[QueryFilters] = None  # Applied to every question
+    collection: Optional[str] = None
 
 
 class LinkInfo(BaseModel):
@@ -49,8 +182,51 @@ class QueryResponse(BaseModel):
     links: List[LinkInfo]
 
 
+# State filled in at startup and served by the health endpoints without touching the database
+app_state = {
+    "ready": False,
+    "startup_phases": {},
+}
+
+
+# Startup: create the schema, load the index, warm caches and the HTTP client, then report readiness
+@asynccontextmanager
+async def lifespan(app):
+    phases = app_state["startup_phases"]
+   
+    def timed(name, func):
+        started = time.perf_counter()
+        result = func()
+        phases[name] = round(time.perf_counter() - started, 4)
+        return result
+   
+    try:
+        timed("schema", lambda: [ensure_schema(kb.db_path) for kb in collections])
+        # Only the default collection is loaded up front; the others load on first use
+        conn = get_db_connection()
+        try:
+            timed("index", lambda: get_vector_index(conn))
+        finally:
+            conn.close()
+        timed("tokenizer", get_encoding)
+        started = time.perf_counter()
+        await warm_up_http_client()
+        phases["http_client"] = round(time.perf_counter() - started, 4)
+        app_state["ready"] = True
+        logger.info(f"Startup finished in {sum(phases.values()):.2f}s: {phases}")
+    except Exception as e:
+        logger.error(f"Startup failed, staying unready: {e}")
+        logger.error(traceback.format_exc())
+    yield
+    app_state["ready"] = False
+    if http_session is not None:
+        await http_session.close()
+    if request_journal is not None:
+        request_journal.close()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="RAG Query API", description="API for querying the RAG knowledge base")
+app = FastAPI(title="RAG Query API", description="API for querying the RAG knowledge base", lifespan=lifespan)
 
 
 # Add CORS middleware
@@ -63,16 +239,91 @@ app.add_middleware(
 )
 
 
+# Profile opted-in /api requests. The middleware is only installed when profiling is configured,
+# so with it off requests take exactly the path they did before.
+request_profiler = RequestProfiler(PROFILE_DIR, PROFILE_MAX_PROFILES)
+
+
+def profile_authorized(token):
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+# Sampled profiles can only be downloaded with the token, so without one they would just fill the disk
+if PROFILE_SAMPLE_RATE > 0 and not PROFILE_TOKEN:
+    logger.warning("PROFILE_SAMPLE_RATE is set without PROFILE_TOKEN, which /admin/profiles requires; not sampling")
+    PROFILE_SAMPLE_RATE = 0.0
+
+
+if PROFILE_TOKEN:
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        wanted = request.url.path.startswith("/api") and (
+            profile_authorized(request.headers.get(PROFILE_HEADER)) or random.random() < PROFILE_SAMPLE_RATE
+        )
+        profile_id = request_profiler.start() if wanted else None
+        if profile_id is None:
+            return await call_next(request)
+        label = f"{request.method} {request.url.path}"
+        try:
+            response = await call_next(request)
+        except BaseException:
+            request_profiler.stop(label)
+            raise
+        body_iterator = response.body_iterator
+       
+        # The body is where a streamed response (/api/batch) does its work, so the profile ends with it
+        async def profiled_body():
+            try:
+                async for chunk in body_iterator:
+                    yield chunk
+            finally:
+                request_profiler.stop(label)
+       
+        response.body_iterator = profiled_body()
+        # In case the client disconnected before the body was read; stop() does nothing if it already ran
+        response.background = BackgroundTask(request_profiler.stop, label)
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+
+
+# Journal of /api requests. With it off no trace is kept and the stage timers do nothing.
+request_journal = RequestJournal(REQUEST_JOURNAL_PATH, REQUEST_JOURNAL_TEXT, REQUEST_JOURNAL_KEY) if REQUEST_JOURNAL_PATH else None
+# Stage timings and cache outcomes of the query being journaled, None otherwise
+request_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+# Time a stage of the current query; repeated stages add up, and concurrent ones (the vision branch) overlap
+@contextmanager
+def timed_stage(name):
+    trace = request_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = trace["stages"]
+        stages[name] = round(stages.get(name, 0.0) + time.perf_counter() - started, 4)
+
+
+# Record how the current query was served: cache outcomes, the answer path
+def note_request(key, value):
+    trace = request_trace.get()
+    if trace is not None:
+        trace[key] = value
+
+
 # Verify API key is set
 if not API_KEY:
     logger.error("API_KEY environment variable is not set. The application will not function correctly.")
 
 
-# Create a connection to the SQLite database
-def get_db_connection():
+# Create a connection to the SQLite database of the collection being served, or the one at db_path
+def get_db_connection(db_path=None):
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(db_path or current_collection().db_path)
         conn.row_factory = sqlite3.Row  # This enables column access by name
         return conn
     except sqlite3.Error as e:
@@ -83,8 +334,8 @@ def get_db_connection():
 
 
 # Make sure database exists or create it
-if not os.path.exists(DB_PATH):
-    conn = sqlite3.connect(DB_PATH)
+def ensure_schema(db_path):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     # Create discourse_chunks table
     c.execute('''
@@ -120,6 +371,130 @@ if not os.path.exists(DB_PATH):
     conn.close()
 
 
+# Shared HTTP client, so upstream calls reuse pooled keep-alive connections
+http_session = None
+
+
+def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=60))
+    return http_session
+
+
+# Open a pooled connection to the upstream before the first real request needs one
+async def warm_up_http_client():
+    session = get_http_session()
+    try:
+        async with session.get(f"{AIPIPE_BASE_URL}/models", timeout=aiohttp.ClientTimeout(total=5)) as response:
+            await response.read()
+    except Exception as e:
+        logger.warning(f"Could not warm up the upstream connection: {e}")
+
+
+# Deadline of the query being served, inherited by every task it starts
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Overloaded(Exception):
+    pass
+
+
+# Seconds left before the current query's deadline, None outside a query
+def time_remaining():
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(stage):
+    remaining = time_remaining()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
+
+
+# Timeout for an upstream call: whatever is left of the query's deadline
+def upstream_timeout(limit=None):
+    check_deadline("an upstream call")
+    remaining = time_remaining()
+    total = remaining if remaining is not None else 300
+    return aiohttp.ClientTimeout(total=min(total, limit) if limit is not None else total)
+
+
+# Back off before retrying an upstream call, giving up if the retry could not finish in time
+async def sleep_before_retry(delay):
+    remaining = time_remaining()
+    if remaining is not None and delay >= remaining:
+        raise DeadlineExceeded("Not enough time left to retry the upstream call")
+    await asyncio.sleep(delay)
+
+
+# Bounded concurrency with a short wait queue; counters are reported by /health
+admission_stats = {"in_flight": 0, "queued": 0, "shed": 0, "deadline_exceeded": 0}
+admission_slots = None
+
+
+@asynccontextmanager
+async def admission_slot():
+    global admission_slots
+    if admission_slots is None:
+        admission_slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+    if admission_slots.locked():
+        if admission_stats["queued"] >= MAX_QUEUED:
+            raise Overloaded("Server is overloaded, too many queries waiting")
+        admission_stats["queued"] += 1
+        try:
+            timeout = QUEUE_TIMEOUT_SECONDS
+            if time_remaining() is not None:
+                timeout = max(min(timeout, time_remaining()), 0)
+            with timed_stage("queue"):
+                await asyncio.wait_for(admission_slots.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded(f"Server is overloaded, no slot freed up within {timeout:.1f}s")
+        finally:
+            admission_stats["queued"] -= 1
+    else:
+        await admission_slots.acquire()
+    admission_stats["in_flight"] += 1
+    try:
+        remaining = time_remaining()
+        if remaining is not None and remaining < MIN_TIME_TO_START_SECONDS:
+            raise DeadlineExceeded(f"Only {remaining:.1f}s left after queueing, not starting the query")
+        yield
+    finally:
+        admission_stats["in_flight"] -= 1
+        admission_slots.release()
+
+
+def overloaded_response(error_msg, retry_after=RETRY_AFTER_SECONDS):
+    return JSONResponse(
+        status_code=503,
+        content={"error": error_msg},
+        headers={"Retry-After": str(max(1, round(retry_after)))}
+    )
+
+
+# One breaker, retry budget and latency window per upstream endpoint, reported by /health
+upstream_endpoints = {
+    name: UpstreamEndpoint(
+        name,
+        hedge=hedge,
+        failure_threshold=UPSTREAM_FAILURE_THRESHOLD,
+        reset_timeout=UPSTREAM_RESET_SECONDS,
+        retry_ratio=UPSTREAM_RETRY_RATIO,
+    )
+    for name, hedge in (("embeddings", HEDGE_EMBEDDINGS), ("chat/completions", False))
+}
+
+
+# Call an upstream endpoint with backoff that respects the query's deadline
+async def call_upstream(endpoint, attempt, max_attempts=None):
+    return await upstream_endpoints[endpoint].call(attempt, sleep=sleep_before_retry, max_attempts=max_attempts)
+
+
 # Vector similarity calculation with improved handling
 def cosine_similarity(vec1, vec2):
     try:
@@ -148,181 +523,434 @@ def cosine_similarity(vec1, vec2):
 
 
 # Function to get embedding from aipipe proxy with retry mechanism
-async def get_embedding(text, max_retries=3):
+async def get_embedding(text, max_retries=3, attempt_timeout=None):
     if not API_KEY:
         error_msg = "API_KEY environment variable not set"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
    
-    retries = 0
-    while retries < max_retries:
-        try:
-            logger.info(f"Getting embedding for text (length: {len(text)})")
-            # Call the embedding API through aipipe proxy
-            url = "https://aipipe.org/openai/v1/embeddings"
-            headers = {
-                "Authorization": API_KEY,
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "text-embedding-3-small",
-                "input": text
-            }
-           
-            logger.info("Sending request to embedding API")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info("Successfully received embedding")
-                        return result["data"][0]["embedding"]
-                    elif response.status == 429:  # Rate limit error
-                        error_text = await response.text()
-                        logger.warning(f"Rate limit reached, retrying after delay (retry {retries+1}): {error_text}")
-                        await asyncio.sleep(5 * (retries + 1))  # Exponential backoff
-                        retries += 1
-                    else:
-                        error_text = await response.text()
-                        error_msg = f"Error getting embedding (status {response.status}): {error_text}"
-                        logger.error(error_msg)
-                        raise HTTPException(status_code=response.status, detail=error_msg)
-        except Exception as e:
-            error_msg = f"Exception getting embedding (attempt {retries+1}/{max_retries}): {e}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            retries += 1
-            if retries >= max_retries:
-                raise HTTPException(status_code=500, detail=error_msg)
-            await asyncio.sleep(3 * retries)  # Wait before retry
+    logger.info(f"Getting embedding for text (length: {len(text)})")
+    # Call the embedding API through aipipe proxy
+    url = f"{AIPIPE_BASE_URL}/embeddings"
+    headers = {
+        "Authorization": API_KEY,
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": "text-embedding-3-small",
+        "input": text
+    }
+   
+    async def attempt():
+        session = get_http_session()
+        async with session.post(url, headers=headers, json=payload, timeout=upstream_timeout(attempt_timeout)) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise UpstreamError(response.status, f"Error getting embedding (status {response.status}): {error_text}")
+            result = await response.json()
+            return result["data"][0]["embedding"]
+   
+    try:
+        logger.info("Sending request to embedding API")
+        embedding = await call_upstream("embeddings", attempt, max_retries)
+        logger.info("Successfully received embedding")
+        return embedding
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        check_deadline("giving up on the embedding request")
+        error_msg = f"Exception getting embedding: {e}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg) from e
 
 
-# Function to find similar content in the database with improved logic
-async def find_similar_content(query_embedding, conn):
+# Function to embed many texts with one upstream call per BATCH_EMBEDDING_SIZE texts
+async def get_embeddings(texts, max_retries=3):
+    if not API_KEY:
+        error_msg = "API_KEY environment variable not set"
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+   
+    url = f"{AIPIPE_BASE_URL}/embeddings"
+    headers = {
+        "Authorization": API_KEY,
+        "Content-Type": "application/json"
+    }
+   
+    async def embed_batch(batch):
+        payload = {
+            "model": "text-embedding-3-small",
+            "input": batch
+        }
+       
+        async def attempt():
+            session = get_http_session()
+            async with session.post(url, headers=headers, json=payload, timeout=upstream_timeout()) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise UpstreamError(response.status, f"Error getting embeddings (status {response.status}): {error_text}")
+                result = await response.json()
+                # The API may return items out of order; each carries its input's index
+                return [item["embedding"] for item in sorted(result["data"], key=lambda item: item["index"])]
+       
+        return await call_upstream("embeddings", attempt, max_retries)
+   
+    logger.info(f"Getting embeddings for {len(texts)} texts")
+    batches = [texts[i:i + BATCH_EMBEDDING_SIZE] for i in range(0, len(texts), BATCH_EMBEDDING_SIZE)]
     try:
-        logger.info("Finding similar content in database")
+        embedded = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        check_deadline("giving up on the embedding request")
+        error_msg = f"Exception getting embeddings: {e}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg) from e
+    return [embedding for batch in embedded for embedding in batch]
+
+
+# Knowledge-base collections, each loading its vector index on first use and reloading it
+# whenever its database file changes. Requests pick one through current_collection.
+collection_paths = parse_collections(KB_COLLECTIONS) or {"default": DB_PATH}
+collections = CollectionRegistry(
+    collection_paths, DEFAULT_COLLECTION or next(iter(collection_paths)), INDEX_MEMORY_BUDGET_MB * 1024 * 1024
+)
+collection_name = contextvars.ContextVar("collection_name", default=None)
+retrieval_stats = {"local_fallbacks": 0}
+hierarchy_stats = {"searches": 0, "fallbacks": 0, "chunks_scored": 0}
+answer_table_stats = {"hits": 0, "misses": 0, "stale": 0}
+fast_path_stats = {path: {"answers": 0, "seconds": 0.0, "context_tokens": 0} for path in ("fast", "full")}
+
+
+def current_collection():
+    return collections.get(collection_name.get())
+
+
+def database_signature(db_path):
+    if not os.path.exists(db_path):
+        return (0.0, 0.0)
+    stat = os.stat(db_path)
+    return (stat.st_mtime, float(stat.st_size))
+
+
+# The database signature plus the settings that decide which rows the index keeps
+def index_signature(signature):
+    if not DEDUP_ENABLED:
+        return (*signature, 0.0, 0.0)
+    return (*signature, DEDUP_MIN_JACCARD, DEDUP_MIN_SIMILARITY)
+
+
+# Map the index saved next to the database if it is current, otherwise rebuild and save it
+def load_vector_index(conn, db_path, signature):
+    signature = index_signature(signature)
+    index = VectorIndex.load(db_path, signature, coarse_dim=COARSE_DIM)
+    if index is not None:
+        return index
+    index = VectorIndex.from_db(conn)
+    if DEDUP_ENABLED:
+        # Quoted replies and reposted answers would otherwise be scanned, scored and returned once per copy
+        duplicate_of = find_near_duplicates(
+            corpus_texts(conn, index), index.embeddings, index.sources, index.representative_order(),
+            DEDUP_MIN_JACCARD, DEDUP_MIN_SIMILARITY
+        )
+        index = index.collapse(duplicate_of)
+    index.build_coarse(COARSE_DIM)
+    try:
+        index.save(db_path, signature)
+    except OSError as e:
+        logger.warning(f"Could not save the vector index next to {db_path}: {e}")
+    return index
+
+
+# Chunk texts in index row order
+def corpus_texts(conn, index):
+    cursor = conn.cursor()
+    texts = {}
+    for source, table in ((SOURCE_DISCOURSE, "discourse_chunks"), (SOURCE_MARKDOWN, "markdown_chunks")):
+        cursor.execute(f"SELECT id, content FROM {table} WHERE embedding IS NOT NULL")
+        texts.update(((source, row[0]), row[1]) for row in cursor)
+    return [texts.get((int(source), int(row_id)), "") for source, row_id in zip(index.sources, index.row_ids)]
+
+
+# Map the local embedder saved next to the database if it is current, otherwise fit and save it
+def load_local_embedder(conn, db_path, index, signature):
+    # Row-aligned with the index, so it is stale whenever the index's rows are
+    signature = index_signature(signature)
+    embedder = LocalEmbedder.load(db_path, signature)
+    if embedder is not None and len(embedder) == len(index):
+        return embedder
+    embedder = LocalEmbedder.fit(corpus_texts(conn, index), dim=LOCAL_EMBEDDING_DIM)
+    try:
+        embedder.save(db_path, signature)
+    except OSError as e:
+        logger.warning(f"Could not save the local embedder next to {db_path}: {e}")
+    return embedder
+
+
+# Open the compressed chunk text store next to the database if it is current, otherwise rebuild it
+def load_chunk_store(conn, db_path, signature):
+    path = f"{db_path}.chunks"
+    try:
+        store = ChunkStore.open(path, signature)
+    except ValueError as e:
+        # Corrupt, truncated or from an older version: building writes a fresh one over it
+        logger.warning(f"{e}; rebuilding it")
+        store = None
+    if store is not None:
+        return store
+   
+    def rows():
         cursor = conn.cursor()
-        results = []
-       
-        # Search discourse chunks
-        logger.info("Querying discourse chunks")
-        cursor.execute("""
+        cursor.execute("SELECT id, post_id, chunk_index, content FROM discourse_chunks")
+        for row in cursor.fetchall():
+            yield (SOURCE_DISCOURSE, *row)
+        cursor.execute("SELECT id, doc_title, chunk_index, content FROM markdown_chunks")
+        for row in cursor.fetchall():
+            yield (SOURCE_MARKDOWN, *row)
+   
+    try:
+        return ChunkStore.build(path, rows(), signature)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not build the chunk store next to {db_path}, reading text from the database: {e}")
+        return None
+
+
+# Count the corpus once per index load, so health checks never scan the tables
+def record_corpus_stats(conn, kb):
+    index = kb.vector_index
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM discourse_chunks")
+    discourse_count = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM markdown_chunks")
+    markdown_count = cursor.fetchone()[0]
+    kb.corpus = {
+        "discourse_chunks": discourse_count,
+        "markdown_chunks": markdown_count,
+        "discourse_embeddings": int(np.count_nonzero(index.sources == SOURCE_DISCOURSE)),
+        "markdown_embeddings": int(np.count_nonzero(index.sources == SOURCE_MARKDOWN)),
+        "collapsed_duplicates": len(index.merged_rows),
+    }
+
+
+# The current collection's vector index, loading it (and evicting others over budget) if needed
+def get_vector_index(conn):
+    kb = current_collection()
+    signature = database_signature(kb.db_path)
+    if kb.vector_index is None or signature != kb.signature:
+        kb.stats["misses"] += 1
+        started = time.perf_counter()
+        # Requests still using the old chunk store or workers keep them until they finish
+        kb.unload()
+        kb.vector_index = load_vector_index(conn, kb.db_path, signature)
+        kb.signature = signature
+        record_corpus_stats(conn, kb)
+        if LOCAL_EMBEDDING_ENABLED:
+            kb.local_embedder = load_local_embedder(conn, kb.db_path, kb.vector_index, signature)
+        if CHUNK_STORE_ENABLED:
+            kb.chunk_store = load_chunk_store(conn, kb.db_path, signature)
+        if ANSWER_TABLE_ENABLED:
+            kb.answer_table = AnswerTable.open(f"{kb.db_path}.answers")
+        if HIERARCHICAL_SEARCH:
+            kb.vector_index.sections = SectionSummaries.build(kb.vector_index)
+        if SEARCH_SHARDS > 1 and len(kb.vector_index) >= SHARDED_SEARCH_MIN_CHUNKS:
+            kb.sharded_searcher = ShardedSearcher(kb.vector_index.embeddings, SEARCH_SHARDS)
+            # Share the workers' copy of the matrix instead of keeping a private one
+            kb.vector_index.embeddings = kb.sharded_searcher.embeddings
+            # Searches go to the shard workers, which score exactly; the coarse matrix would never be read
+            kb.vector_index.coarse = None
+            kb.sharded_searcher.warm_up()
+        kb.record_load(time.perf_counter() - started)
+        logger.info(f"Loaded collection {kb.name} in {kb.stats['last_load_seconds']}s")
+    else:
+        kb.stats["hits"] += 1
+    collections.touch(kb)
+    collections.enforce_budget(keep=kb)
+    return kb.vector_index
+
+
+# Ensure a discourse URL is properly formatted
+def discourse_url(url):
+    if not url.startswith("http"):
+        # Fix missing protocol
+        url = f"https://discourse.onlinedegree.iitm.ac.in/t/{url}"
+    return url
+
+
+# Ensure a documentation URL is properly formatted
+def markdown_url(url, doc_title):
+    if not url or not url.startswith("http"):
+        # Use a default URL if missing
+        url = f"https://docs.onlinedegree.iitm.ac.in/{doc_title}"
+    return url
+
+
+# URLs of the chunks folded into each selected row at index time, {row: [url, ...]}
+def merged_urls(conn, index, rows):
+    merged = {row: index.merged_chunks(row) for row in rows}
+    wanted = {source: sorted({row_id for chunks in merged.values() for s, row_id in chunks if s == source})
+              for source in (SOURCE_DISCOURSE, SOURCE_MARKDOWN)}
+    urls = {}
+    cursor = conn.cursor()
+    if wanted[SOURCE_DISCOURSE]:
+        cursor.execute(f"""
+        SELECT id, url FROM discourse_chunks WHERE id IN ({",".join("?" * len(wanted[SOURCE_DISCOURSE]))})
+        """, wanted[SOURCE_DISCOURSE])
+        urls.update(((SOURCE_DISCOURSE, row[0]), discourse_url(row[1])) for row in cursor.fetchall())
+    if wanted[SOURCE_MARKDOWN]:
+        cursor.execute(f"""
+        SELECT id, original_url, doc_title FROM markdown_chunks WHERE id IN ({",".join("?" * len(wanted[SOURCE_MARKDOWN]))})
+        """, wanted[SOURCE_MARKDOWN])
+        urls.update(((SOURCE_MARKDOWN, row[0]), markdown_url(row[1], row[2])) for row in cursor.fetchall())
+    return {row: list(dict.fromkeys(urls[chunk] for chunk in chunks if chunk in urls)) for row, chunks in merged.items()}
+
+
+# Fetch the display columns for the selected chunk rows and build result dicts
+def fetch_results(conn, index, chunk_store, rows, scores):
+    cursor = conn.cursor()
+    discourse_ids = [int(index.row_ids[row]) for row in rows if index.sources[row] == SOURCE_DISCOURSE]
+    markdown_ids = [int(index.row_ids[row]) for row in rows if index.sources[row] == SOURCE_MARKDOWN]
+    discourse_chunks, markdown_chunks = {}, {}
+    # With the chunk store, text comes decompressed from there and the tables only give metadata
+    content_column = "" if chunk_store is not None else "content,"
+   
+    if discourse_ids:
+        cursor.execute(f"""
         SELECT id, post_id, topic_id, topic_title, post_number, author, created_at,
-               likes, chunk_index, content, url, embedding
+               likes, chunk_index, {content_column} url
         FROM discourse_chunks
-        WHERE embedding IS NOT NULL
-        """)
-       
-        discourse_chunks = cursor.fetchall()
-        logger.info(f"Processing {len(discourse_chunks)} discourse chunks")
-        processed_count = 0
-       
-        for chunk in discourse_chunks:
-            try:
-                embedding = json.loads(chunk["embedding"])
-                similarity = cosine_similarity(query_embedding, embedding)
-               
-                if similarity >= SIMILARITY_THRESHOLD:
-                    # Ensure URL is properly formatted
-                    url = chunk["url"]
-                    if not url.startswith("http"):
-                        # Fix missing protocol
-                        url = f"https://discourse.onlinedegree.iitm.ac.in/t/{url}"
-                   
-                    results.append({
-                        "source": "discourse",
-                        "id": chunk["id"],
-                        "post_id": chunk["post_id"],
-                        "topic_id": chunk["topic_id"],
-                        "title": chunk["topic_title"],
-                        "url": url,
-                        "content": chunk["content"],
-                        "author": chunk["author"],
-                        "created_at": chunk["created_at"],
-                        "chunk_index": chunk["chunk_index"],
-                        "similarity": float(similarity)
-                    })
-               
-                processed_count += 1
-                if processed_count % 1000 == 0:
-                    logger.info(f"Processed {processed_count}/{len(discourse_chunks)} discourse chunks")
-                   
-            except Exception as e:
-                logger.error(f"Error processing discourse chunk {chunk['id']}: {e}")
-       
-        # Search markdown chunks
-        logger.info("Querying markdown chunks")
-        cursor.execute("""
-        SELECT id, doc_title, original_url, downloaded_at, chunk_index, content, embedding
+        WHERE id IN ({",".join("?" * len(discourse_ids))})
+        """, discourse_ids)
+        discourse_chunks = {chunk["id"]: chunk for chunk in cursor.fetchall()}
+   
+    if markdown_ids:
+        cursor.execute(f"""
+        SELECT id, doc_title, original_url, downloaded_at, {content_column} chunk_index
         FROM markdown_chunks
-        WHERE embedding IS NOT NULL
-        """)
-       
-        markdown_chunks = cursor.fetchall()
-        logger.info(f"Processing {len(markdown_chunks)} markdown chunks")
-        processed_count = 0
-       
-        for chunk in markdown_chunks:
-            try:
-                embedding = json.loads(chunk["embedding"])
-                similarity = cosine_similarity(query_embedding, embedding)
-               
-                if similarity >= SIMILARITY_THRESHOLD:
-                    # Ensure URL is properly formatted
-                    url = chunk["original_url"]
-                    if not url or not url.startswith("http"):
-                        # Use a default URL if missing
-                        url = f"https://docs.onlinedegree.iitm.ac.in/{chunk['doc_title']}"
-                   
-                    results.append({
-                        "source": "markdown",
-                        "id": chunk["id"],
-                        "title": chunk["doc_title"],
-                        "url": url,
-                        "content": chunk["content"],
-                        "chunk_index": chunk["chunk_index"],
-                        "similarity": float(similarity)
-                    })
-               
-                processed_count += 1
-                if processed_count % 1000 == 0:
-                    logger.info(f"Processed {processed_count}/{len(markdown_chunks)} markdown chunks")
-                   
-            except Exception as e:
-                logger.error(f"Error processing markdown chunk {chunk['id']}: {e}")
-       
-        # Sort by similarity (descending)
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        logger.info(f"Found {len(results)} relevant results above threshold")
-       
-        # Group by source document and keep most relevant chunks
-        grouped_results = {}
-       
-        for result in results:
-            # Create a unique key for the document/post
-            if result["source"] == "discourse":
-                key = f"discourse_{result['post_id']}"
-            else:
-                key = f"markdown_{result['title']}"
+        WHERE id IN ({",".join("?" * len(markdown_ids))})
+        """, markdown_ids)
+        markdown_chunks = {chunk["id"]: chunk for chunk in cursor.fetchall()}
+   
+    if chunk_store is not None:
+        texts = chunk_store.texts(
+            [(SOURCE_DISCOURSE, chunk_id) for chunk_id in discourse_ids]
+            + [(SOURCE_MARKDOWN, chunk_id) for chunk_id in markdown_ids]
+        )
+    else:
+        texts = {(SOURCE_DISCOURSE, chunk_id): chunk["content"] for chunk_id, chunk in discourse_chunks.items()}
+        texts.update({(SOURCE_MARKDOWN, chunk_id): chunk["content"] for chunk_id, chunk in markdown_chunks.items()})
+    duplicate_urls = merged_urls(conn, index, rows) if len(index.merged_rows) else {}
+   
+    results = []
+    for row, score in zip(rows, scores):
+        row_id = int(index.row_ids[row])
+        similarity = float(score)
+        if index.sources[row] == SOURCE_DISCOURSE:
+            chunk = discourse_chunks.get(row_id)
+            if chunk is None:
+                continue
+            url = discourse_url(chunk["url"])
            
-            if key not in grouped_results:
-                grouped_results[key] = []
+            results.append({
+                "source": "discourse",
+                "id": chunk["id"],
+                "post_id": chunk["post_id"],
+                "topic_id": chunk["topic_id"],
+                "title": chunk["topic_title"],
+                "url": url,
+                "content": texts.get((SOURCE_DISCOURSE, row_id), ""),
+                "author": chunk["author"],
+                "created_at": chunk["created_at"],
+                "chunk_index": chunk["chunk_index"],
+                "similarity": similarity,
+                "duplicate_urls": [u for u in duplicate_urls.get(row, []) if u != url]
+            })
+        else:
+            chunk = markdown_chunks.get(row_id)
+            if chunk is None:
+                continue
+            url = markdown_url(chunk["original_url"], chunk["doc_title"])
            
-            grouped_results[key].append(result)
-       
-        # For each source, keep only the most relevant chunks
-        final_results = []
-        for key, chunks in grouped_results.items():
-            # Sort chunks by similarity
-            chunks.sort(key=lambda x: x["similarity"], reverse=True)
-            # Keep top chunks
-            final_results.extend(chunks[:MAX_CONTEXT_CHUNKS])
+            results.append({
+                "source": "markdown",
+                "id": chunk["id"],
+                "title": chunk["doc_title"],
+                "url": url,
+                "content": texts.get((SOURCE_MARKDOWN, row_id), ""),
+                "chunk_index": chunk["chunk_index"],
+                "similarity": similarity,
+                "duplicate_urls": [u for u in duplicate_urls.get(row, []) if u != url]
+            })
+    return results
+
+
+# Convert request filters into the vector index's row selection arguments
+def filter_arguments(filters):
+    if filters is None:
+        return {}
+   
+    def epoch(value):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+   
+    return {
+        "source": filters.source,
+        "topic_id": filters.topic_id,
+        "created_after": epoch(filters.created_after),
+        "created_before": epoch(filters.created_before),
+        "min_likes": filters.min_likes,
+    }
+
+
+# Function to find similar content in the database with improved logic
+async def find_similar_content(query_embedding, conn, use_mmr=None, filters=None, local=False):
+    try:
+        logger.info("Finding similar content in database")
+        index = get_vector_index(conn)
+        kb = current_collection()
+        local_embedder, sharded_searcher, chunk_store = kb.local_embedder, kb.sharded_searcher, kb.chunk_store
        
-        # Sort again by similarity
-        final_results.sort(key=lambda x: x["similarity"], reverse=True)
+        # Mask rows on the metadata columns first, then score only the selected ones
+        rows = index.select_rows(**filter_arguments(filters))
+        found = hierarchical_search(index, query_embedding, hierarchy_stats) if not local and rows is None else None
+        if found is not None:
+            candidates, scores, scanned = found
+        elif local:
+            # query_embedding came from the local embedder; score it against the corpus in that space
+            similarities = local_embedder.similarities(query_embedding, rows)
+            candidates = np.flatnonzero(similarities >= LOCAL_SIMILARITY_THRESHOLD)
+            candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+            scores = similarities[candidates]
+            scanned = len(index) if rows is None else len(rows)
+        elif sharded_searcher is not None and rows is None:
+            # Unfiltered scans of a large corpus fan out to the shard workers
+            candidates, scores = await sharded_searcher.search(
+                index.normalize_query(query_embedding), SIMILARITY_THRESHOLD, SHARD_TOP_K
+            )
+            scanned = len(index)
+        elif index.coarse is not None and sharded_searcher is None:
+            # Scan the truncated matrix, then rescore the shortlist with the full vectors
+            candidates, scores = two_stage_top_k(
+                index.embeddings, index.coarse, [index.normalize_query(query_embedding)],
+                SIMILARITY_THRESHOLD, SHARD_TOP_K, COARSE_SHORTLIST, rows
+            )[0]
+            scanned = len(index) if rows is None else len(rows)
+        else:
+            similarities = index.similarities(query_embedding, rows)
+            candidates = np.flatnonzero(similarities >= SIMILARITY_THRESHOLD)
+            candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+            scores = similarities[candidates]
+            scanned = len(index) if rows is None else len(rows)
+        logger.info(f"Found {len(candidates)} relevant results above threshold ({scanned} of {len(index)} chunks scanned)")
        
-        # Return top results, limited by MAX_RESULTS
-        logger.info(f"Returning {len(final_results[:MAX_RESULTS])} final results after grouping")
-        return final_results[:MAX_RESULTS]
+        vectors = local_embedder.embeddings if local else index.embeddings
+        final_results = select_results(conn, index, chunk_store, vectors, candidates, scores, use_mmr)
+        logger.info(f"Returning {len(final_results)} final results after grouping")
+        return final_results
     except Exception as e:
         error_msg = f"Error in find_similar_content: {e}"
         logger.error(error_msg)
@@ -330,67 +958,190 @@ async def find_similar_content(query_embedding, conn):
         raise
 
 
+# Function to search only the chunks of the best topics/pages, counting into `stats`; None if two-level search is off or finds nothing good
+def hierarchical_search(index, query_embedding, stats):
+    if index.sections is None:
+        return None
+    stats["searches"] += 1
+    found = hierarchical_top_k(
+        index.embeddings, index.sections, index.normalize_query(query_embedding),
+        SIMILARITY_THRESHOLD, SHARD_TOP_K, HIERARCHY_TOP_SECTIONS, HIERARCHY_MIN_SCORE
+    )
+    if found is None:
+        stats["fallbacks"] += 1
+        logger.info("No topic or page matched well, searching every chunk")
+        return None
+    stats["chunks_scored"] += found[2]
+    return found
+
+
+# Pick the final results from candidates sorted best first, and fetch their rows
+def select_results(conn, index, chunk_store, vectors, candidates, scores, use_mmr=None):
+    use_mmr = MMR_ENABLED if use_mmr is None else use_mmr
+    if use_mmr and len(candidates) > MAX_RESULTS:
+        # Diversify the strongest candidates instead of taking near-duplicates in score order
+        pool = candidates[:MMR_CANDIDATES]
+        picks = mmr_select(
+            vectors[pool], scores[:MMR_CANDIDATES], MAX_RESULTS, MMR_LAMBDA,
+            group_ids=index.group_ids[pool], per_group=MAX_CONTEXT_CHUNKS
+        )
+    else:
+        # Group by source document and keep the most relevant chunks of each
+        picks = select_top_grouped(candidates, index.group_ids, MAX_RESULTS, MAX_CONTEXT_CHUNKS)
+    return fetch_results(conn, index, chunk_store, candidates[picks], scores[picks])
+
+
+# Function to find similar content for many query embeddings with one matrix product per block.
+# Scores with the local embedder's vectors if one is given; two-level search counts go into `stats`
+def find_similar_content_batch(query_embeddings, conn, index, chunk_store, stats, filters=None, local_embedder=None):
+    local = local_embedder is not None
+    rows = index.select_rows(**filter_arguments(filters))
+    if local:
+        vectors, threshold = local_embedder.embeddings, LOCAL_SIMILARITY_THRESHOLD
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+    else:
+        vectors, threshold = index.embeddings, SIMILARITY_THRESHOLD
+        queries = np.vstack([index.normalize_query(query) for query in query_embeddings])
+    # The top SHARD_TOP_K candidates per question are all grouping or MMR ever looks at
+    started = time.perf_counter()
+    top = [None] * len(queries)
+    if not local and rows is None:
+        for i, query in enumerate(queries):
+            found = hierarchical_search(index, query, stats)
+            if found is not None:
+                top[i] = found[:2]
+    # Whatever two-level search did not answer is scored against every chunk
+    exhaustive = [i for i, found in enumerate(top) if found is None]
+    if exhaustive:
+        # The coarse matrix is dropped when shard workers are started, so with them the batch scores exactly as /api does
+        if not local and index.coarse is not None:
+            scored = two_stage_top_k(vectors, index.coarse, queries[exhaustive], threshold, SHARD_TOP_K, COARSE_SHORTLIST, rows)
+        else:
+            scored = batch_top_k(vectors, queries[exhaustive], threshold, SHARD_TOP_K, rows)
+        for i, found in zip(exhaustive, scored):
+            top[i] = found
+    logger.info(f"Scored {len(queries)} questions against {len(index)} chunks in {time.perf_counter() - started:.3f}s")
+    return [select_results(conn, index, chunk_store, vectors, candidates, scores) for candidates, scores in top]
+
+
+# Function to retrieve for a batch on a worker thread. The index and chunk store are resolved on the event loop,
+# which owns the collection registry; the thread only scores and reads rows, on a database connection of its own.
+# Returns (results, two-level search counts) for the event loop to add to hierarchy_stats
+def retrieve_batch(db_path, index, chunk_store, query_embeddings, filters=None, local_embedder=None):
+    stats = {"searches": 0, "fallbacks": 0, "chunks_scored": 0}
+    conn = get_db_connection(db_path)
+    try:
+        return find_similar_content_batch(query_embeddings, conn, index, chunk_store, stats, filters, local_embedder), stats
+    finally:
+        conn.close()
+
+
+# Function to embed a question, with the local embedder if the embeddings endpoint is down or too slow; returns (embedding, local)
+async def embed_question(question, conn):
+    try:
+        with timed_stage("embedding"):
+            return await get_embedding(question, attempt_timeout=EMBEDDING_ATTEMPT_SECONDS), False
+    except (CircuitOpenError, HTTPException) as e:
+        if not remote_embedding_unavailable(e):
+            raise
+        # The local embedder is loaded with the collection, which may not be yet (first use, or after eviction)
+        get_vector_index(conn)
+        local_embedder = current_collection().local_embedder
+        if local_embedder is None:
+            raise
+        retrieval_stats["local_fallbacks"] += 1
+        logger.warning(f"Remote embedding unavailable ({e!r}), retrieving with the local embedder")
+        return local_embedder.encode(question), True
+
+
+# Whether an embedding failure means the upstream is down or overloaded (open circuit, timeouts, 5xx, 429),
+# as opposed to a request it will never accept, such as a bad API key
+def remote_embedding_unavailable(error):
+    if isinstance(error, CircuitOpenError):
+        return True
+    return error.__cause__ is not None and is_retryable(error.__cause__)
+
+
+# Function to retrieve for a question, on the local embedder if the embeddings endpoint can't answer in time; returns (results, local)
+async def retrieve_for_question(question, conn, filters=None):
+    query_embedding, local = await embed_question(question, conn)
+    return await find_similar_content(query_embedding, conn, filters=filters, local=local), local
+
+
+# Function to answer from the precomputed table when a canonical question is close enough; None otherwise
+def precomputed_answer(query_embedding, conn):
+    # The table is part of the collection's loaded state, so unload() closes it with the rest
+    get_vector_index(conn)
+    kb = current_collection()
+    if kb.answer_table is None and ANSWER_TABLE_ENABLED and kb.loaded:
+        # precompute_answers.py may have created the table since the collection was loaded
+        kb.answer_table = AnswerTable.open(f"{kb.db_path}.answers")
+    table = kb.answer_table
+    if table is None:
+        return None
+    table.reload_if_changed()
+    if not len(table):
+        return None
+    # Answers generated from an older state of the database may cite chunks that changed since
+    if not table.is_current(database_signature(kb.db_path)):
+        answer_table_stats["stale"] += 1
+        note_request("answer_table", "stale")
+        return None
+    match = table.match(query_embedding, ANSWER_TABLE_MIN_SIMILARITY)
+    if match is None:
+        answer_table_stats["misses"] += 1
+        note_request("answer_table", "miss")
+        return None
+    answer_table_stats["hits"] += 1
+    note_request("answer_table", "hit")
+    note_request("answer_path", "precomputed")
+    logger.info(f"Serving the precomputed answer to '{match['question'][:50]}' (similarity {match['similarity']:.3f})")
+    return {"answer": match["answer"], "links": match["links"]}
+
+
+# Function to fetch the chunks either side of a result, as {chunk_index: text}
+def adjacent_chunks(conn, result):
+    current_chunk_index = result["chunk_index"]
+    wanted = [i for i in (current_chunk_index - 1, current_chunk_index + 1) if i >= 0]
+    if result["source"] == "discourse":
+        source, group_key, table, group_column = SOURCE_DISCOURSE, result["post_id"], "discourse_chunks", "post_id"
+    else:
+        source, group_key, table, group_column = SOURCE_MARKDOWN, result["title"], "markdown_chunks", "doc_title"
+   
+    chunk_store = current_collection().chunk_store
+    if chunk_store is not None:
+        return chunk_store.neighbours(source, group_key, wanted)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT chunk_index, content FROM {table}
+    WHERE {group_column} = ? AND chunk_index IN ({",".join("?" * len(wanted))})
+    """, (group_key, *wanted))
+    return {row["chunk_index"]: row["content"] for row in cursor.fetchall()}
+
+
 # Function to enrich content with adjacent chunks
 async def enrich_with_adjacent_chunks(conn, results):
     try:
         logger.info(f"Enriching {len(results)} results with adjacent chunks")
-        cursor = conn.cursor()
         enriched_results = []
        
         for result in results:
             enriched_result = result.copy()
-            additional_content = ""
+            current_chunk_index = result["chunk_index"]
+            neighbours = adjacent_chunks(conn, result)
+            # Keep each chunk separately too, so the context packer can merge spans exactly
+            chunks = {current_chunk_index: result["content"], **neighbours}
            
-            # Try to get adjacent chunks for context
-            if result["source"] == "discourse":
-                post_id = result["post_id"]
-                current_chunk_index = result["chunk_index"]
-               
-                # Try to get previous chunk
-                if current_chunk_index > 0:
-                    cursor.execute("""
-                    SELECT content FROM discourse_chunks
-                    WHERE post_id = ? AND chunk_index = ?
-                    """, (post_id, current_chunk_index - 1))
-                    prev_chunk = cursor.fetchone()
-                    if prev_chunk:
-                        additional_content = prev_chunk["content"] + " "
-               
-                # Try to get next chunk
-                cursor.execute("""
-                SELECT content FROM discourse_chunks
-                WHERE post_id = ? AND chunk_index = ?
-                """, (post_id, current_chunk_index + 1))
-                next_chunk = cursor.fetchone()
-                if next_chunk:
-                    additional_content += " " + next_chunk["content"]
-               
-            elif result["source"] == "markdown":
-                title = result["title"]
-                current_chunk_index = result["chunk_index"]
-               
-                # Try to get previous chunk
-                if current_chunk_index > 0:
-                    cursor.execute("""
-                    SELECT content FROM markdown_chunks
-                    WHERE doc_title = ? AND chunk_index = ?
-                    """, (title, current_chunk_index - 1))
-                    prev_chunk = cursor.fetchone()
-                    if prev_chunk:
-                        additional_content = prev_chunk["content"] + " "
-               
-                # Try to get next chunk
-                cursor.execute("""
-                SELECT content FROM markdown_chunks
-                WHERE doc_title = ? AND chunk_index = ?
-                """, (title, current_chunk_index + 1))
-                next_chunk = cursor.fetchone()
-                if next_chunk:
-                    additional_content += " " + next_chunk["content"]
+            additional_content = ""
+            if current_chunk_index - 1 in neighbours:
+                additional_content = neighbours[current_chunk_index - 1] + " "
+            if current_chunk_index + 1 in neighbours:
+                additional_content += " " + neighbours[current_chunk_index + 1]
            
             # Add the enriched content
             if additional_content:
                 enriched_result["content"] = f"{result['content']} {additional_content}"
+            enriched_result["chunks"] = chunks
            
             enriched_results.append(enriched_result)
        
@@ -403,147 +1154,309 @@ async def enrich_with_adjacent_chunks(conn, results):
         raise
 
 
-# Function to generate an answer using LLM with improved prompt
-async def generate_answer(question, relevant_results, max_retries=2):
+# Function to generate an answer using LLM with improved prompt; `usage`, if given, receives the context token count
+async def generate_answer(question, relevant_results, max_retries=2, model=None, token_budget=None, usage=None):
     if not API_KEY:
         error_msg = "API_KEY environment variable not set"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
    
-    retries = 0
-    while retries < max_retries:    
-        try:
-            logger.info(f"Generating answer for question: '{question[:50]}...'")
-            context = ""
-            for result in relevant_results:
-                source_type = "Discourse post" if result["source"] == "discourse" else "Documentation"
-                context += f"\n\n{source_type} (URL: {result['url']}):\n{result['content'][:1500]}"
-           
-            # Prepare improved prompt
-            prompt = f"""Answer the following question based ONLY on the provided context.
-            If you cannot answer the question based on the context, say "I don't have enough information to answer this question."
-           
-            Context:
-            {context}
-           
-            Question: {question}
-           
-            Return your response in this exact format:
-            1. A comprehensive yet concise answer
-            2. A "Sources:" section that lists the URLs and relevant text snippets you used to answer
-           
-            Sources must be in this exact format:
-            Sources:
-            1. URL: [exact_url_1], Text: [brief quote or description]
-            2. URL: [exact_url_2], Text: [brief quote or description]
-           
-            Make sure the URLs are copied exactly from the context without any changes.
-            """
-           
-            logger.info("Sending request to LLM API")
-            # Call OpenAI API through aipipe proxy
-            url = "https://aipipe.org/openai/v1/chat/completions"
-            headers = {
-                "Authorization": API_KEY,
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "gpt-4o-mini",
-                "messages": [
-                    {"role": "system", "content": "You are a helpful assistant that provides accurate answers based only on the provided context. Always include sources in your response with exact URLs."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.3  # Lower temperature for more deterministic outputs
+    logger.info(f"Generating answer for question: '{question[:50]}...'")
+    # Merge overlapping chunks, drop repeated text and fit the context to the token budget
+    context, context_tokens = pack_context(relevant_results, token_budget)
+    if usage is not None:
+        usage["context_tokens"] = context_tokens
+   
+    # Prepare improved prompt
+    prompt = f"""Answer the following question based ONLY on the provided context.
+    If you cannot answer the question based on the context, say "I don't have enough information to answer this question."
+   
+    Context:
+    {context}
+   
+    Question: {question}
+   
+    Return your response in this exact format:
+    1. A comprehensive yet concise answer
+    2. A "Sources:" section that lists the URLs and relevant text snippets you used to answer
+   
+    Sources must be in this exact format:
+    Sources:
+    1. URL: [exact_url_1], Text: [brief quote or description]
+    2. URL: [exact_url_2], Text: [brief quote or description]
+   
+    Make sure the URLs are copied exactly from the context without any changes.
+    """
+   
+    logger.info(f"Sending request to LLM API (context tokens: {context_tokens}, prompt tokens: {count_tokens(prompt)})")
+    # Call OpenAI API through aipipe proxy
+    url = f"{AIPIPE_BASE_URL}/chat/completions"
+    headers = {
+        "Authorization": API_KEY,
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": model or ANSWER_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant that provides accurate answers based only on the provided context. Always include sources in your response with exact URLs."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.3  # Lower temperature for more deterministic outputs
+    }
+   
+    async def attempt():
+        session = get_http_session()
+        async with session.post(url, headers=headers, json=payload, timeout=upstream_timeout()) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise UpstreamError(response.status, f"Error generating answer (status {response.status}): {error_text}")
+            result = await response.json()
+            return result["choices"][0]["message"]["content"]
+   
+    try:
+        answer = await call_upstream("chat/completions", attempt, max_retries)
+        logger.info("Successfully received answer from LLM")
+        return answer
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        check_deadline("giving up on the answer request")
+        error_msg = f"Exception generating answer: {e}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=error_msg)
+
+
+# Estimate the decoded size of a base64 payload without decoding it
+def estimate_base64_size(image_base64):
+    payload = image_base64.split(",", 1)[1] if image_base64.startswith("data:") else image_base64
+    return len(payload) * 3 // 4
+
+
+# 64-bit difference hash: survives re-compression and small resizes of the same screenshot
+def perceptual_hash(image):
+    pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+# Pillow refuses outright to open images twice this size, and warns above it
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_DECODE_PIXELS
+
+
+# Decode, downscale and re-encode an uploaded image so it fits the pixel and byte budgets
+def prepare_image(image_base64):
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(image_base64, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Image is not valid base64: {e}")
+    if len(raw) > MAX_IMAGE_PAYLOAD_BYTES:
+        raise ValueError(f"Image is {len(raw)} bytes, above the {MAX_IMAGE_PAYLOAD_BYTES} byte limit")
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e))
+    image_format = image.format
+    # The header gives the size before anything is decoded; a few KB of PNG can expand to gigabytes
+    original_pixels = image.width * image.height
+    if original_pixels > IMAGE_MAX_DECODE_PIXELS:
+        raise ValueError(f"Image is {image.width}x{image.height}, above the {IMAGE_MAX_DECODE_PIXELS} pixel limit")
+    if image_format == "JPEG" and original_pixels > IMAGE_MAX_PIXELS:
+        # Let the JPEG decoder downscale by a power of two instead of decoding every pixel
+        scale = (IMAGE_MAX_PIXELS / original_pixels) ** 0.5
+        image.draft("RGB", (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+    image = ImageOps.exif_transpose(image)
+    exact_hash = hashlib.sha256(raw).hexdigest()
+    phash = perceptual_hash(image)
+
+    # Small enough already: send the original bytes untouched
+    if original_pixels <= IMAGE_MAX_PIXELS and len(raw) <= IMAGE_MAX_BYTES and image_format in ("JPEG", "PNG", "WEBP", "GIF"):
+        return {
+            "base64": image_base64,
+            "mime_type": f"image/{image_format.lower()}",
+            "exact_hash": exact_hash,
+            "phash": phash,
+            "original_bytes": len(raw),
+            "upload_bytes": len(raw),
+        }
+
+    if image.mode != "RGB":
+        # Flatten transparency onto white, which is what screenshots are usually shown on
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+
+    if image.width * image.height > IMAGE_MAX_PIXELS:
+        scale = (IMAGE_MAX_PIXELS / (image.width * image.height)) ** 0.5
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.Resampling.LANCZOS)
+
+    while True:
+        for quality in IMAGE_JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            encoded = buffer.getvalue()
+            if len(encoded) <= IMAGE_MAX_BYTES:
+                break
+        if len(encoded) <= IMAGE_MAX_BYTES or min(image.size) <= 64:
+            break
+        image = image.resize((image.width // 2, image.height // 2), Image.Resampling.LANCZOS)
+
+    return {
+        "base64": base64.b64encode(encoded).decode("ascii"),
+        "mime_type": "image/jpeg",
+        "exact_hash": exact_hash,
+        "phash": phash,
+        "original_bytes": len(raw),
+        "upload_bytes": len(encoded),
+    }
+
+
+# Cache of vision descriptions, keyed by question + exact image hash, with a perceptual-hash fallback
+image_description_cache = OrderedDict()
+
+
+def get_cached_image_description(question, exact_hash, phash):
+    key = (question, exact_hash)
+    if key in image_description_cache:
+        image_description_cache.move_to_end(key)
+        return image_description_cache[key][1]
+    for cached_key, (cached_phash, description) in image_description_cache.items():
+        if cached_key[0] == question and bin(cached_phash ^ phash).count("1") <= IMAGE_PHASH_MAX_DISTANCE:
+            image_description_cache.move_to_end(cached_key)
+            return description
+    return None
+
+
+def cache_image_description(question, exact_hash, phash, description):
+    image_description_cache[(question, exact_hash)] = (phash, description)
+    image_description_cache.move_to_end((question, exact_hash))
+    while len(image_description_cache) > IMAGE_DESCRIPTION_CACHE_SIZE:
+        image_description_cache.popitem(last=False)
+
+
+# Function to describe an image with the vision model, reusing cached descriptions
+async def describe_image(question, image_base64):
+    prepared = await asyncio.to_thread(prepare_image, image_base64)
+    cached = get_cached_image_description(question, prepared["exact_hash"], prepared["phash"])
+    if cached is not None:
+        logger.info("Using cached image description")
+        note_request("image_description", "cached")
+        return cached
+    note_request("image_description", "described")
+
+    # Call the GPT-4o Vision API to process the image and question
+    url = f"{AIPIPE_BASE_URL}/chat/completions"
+    headers = {
+        "Authorization": API_KEY,
+        "Content-Type": "application/json"
+    }
+   
+    # Format the image for the API
+    image_content = f"data:{prepared['mime_type']};base64,{prepared['base64']}"
+   
+    payload = {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": f"Look at this image and tell me what you see related to this question: {question}"},
+                    {"type": "image_url", "image_url": {"url": image_content}}
+                ]
             }
-           
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info("Successfully received answer from LLM")
-                        return result["choices"][0]["message"]["content"]
-                    elif response.status == 429:  # Rate limit error
-                        error_text = await response.text()
-                        logger.warning(f"Rate limit reached, retrying after delay (retry {retries+1}): {error_text}")
-                        await asyncio.sleep(3 * (retries + 1))  # Exponential backoff
-                        retries += 1
-                    else:
-                        error_text = await response.text()
-                        error_msg = f"Error generating answer (status {response.status}): {error_text}"
-                        logger.error(error_msg)
-                        raise HTTPException(status_code=response.status, detail=error_msg)
-        except Exception as e:
-            error_msg = f"Exception generating answer: {e}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            retries += 1
-            if retries >= max_retries:
-                raise HTTPException(status_code=500, detail=error_msg)
-            await asyncio.sleep(2)  # Wait before retry
+        ]
+    }
+   
+    logger.info(f"Sending request to Vision API (image bytes: {prepared['original_bytes']} -> {prepared['upload_bytes']})")
+    started = time.perf_counter()
+   
+    async def attempt():
+        session = get_http_session()
+        async with session.post(url, headers=headers, json=payload, timeout=upstream_timeout()) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise UpstreamError(response.status, f"Error processing image (status {response.status}): {error_text}")
+            result = await response.json()
+            return result["choices"][0]["message"]["content"]
+   
+    # One attempt: the text-only results are already on their way if this fails
+    image_description = await call_upstream("chat/completions", attempt, max_attempts=1)
+    logger.info(f"Received image description in {time.perf_counter() - started:.2f}s: '{image_description[:50]}...'")
+    cache_image_description(question, prepared["exact_hash"], prepared["phash"], image_description)
+    return image_description
+
+
+# Merge candidate lists, keeping the best similarity seen for each chunk, then group them as one search would.
+# Lists scored in different embedding spaces can't be compared by similarity, so those are interleaved by rank
+def fuse_results(*result_lists, comparable=True):
+    fused = {}
+    if comparable:
+        for results in result_lists:
+            for result in results:
+                key = (result["source"], result["id"])
+                if key not in fused or result["similarity"] > fused[key]["similarity"]:
+                    fused[key] = result
+        ranked = sorted(fused.values(), key=lambda x: x["similarity"], reverse=True)
+    else:
+        for results in itertools.zip_longest(*result_lists):
+            for result in filter(None, results):
+                fused.setdefault((result["source"], result["id"]), result)
+        ranked = list(fused.values())
+    # No post or page may take more than MAX_CONTEXT_CHUNKS of the context, whichever branch found it
+    picks = select_top_grouped(range(len(ranked)), [source_key(result) for result in ranked], MAX_RESULTS, MAX_CONTEXT_CHUNKS)
+    return [ranked[i] for i in picks]
 
 
-# Function to process multimodal content (text + image)
-async def process_multimodal_query(question, image_base64):
+# Function to embed the question together with the image description
+async def embed_with_image_context(question, image_base64):
+    with timed_stage("vision"):
+        image_description = await describe_image(question, image_base64)
+    # Combine the original question with the image description
+    combined_query = f"{question}\nImage context: {image_description}"
+    return await get_embedding(combined_query)
+
+
+# Function to retrieve content for a multimodal query (text + image)
+async def retrieve_multimodal(question, image_base64, conn, filters=None):
     if not API_KEY:
         error_msg = "API_KEY environment variable not set"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
-       
+   
+    logger.info(f"Processing multimodal query: '{question[:50]}...'")
+    started = time.perf_counter()
+    # Start the vision branch and speculatively retrieve with the text alone meanwhile
+    image_task = asyncio.create_task(embed_with_image_context(question, image_base64))
     try:
-        logger.info(f"Processing query: '{question[:50]}...', image provided: {image_base64 is not None}")
-        if not image_base64:
-            logger.info("No image provided, processing as text-only query")
-            return await get_embedding(question)
-       
-        logger.info("Processing multimodal query with image")
-        # Call the GPT-4o Vision API to process the image and question
-        url = "https://aipipe.org/openai/v1/chat/completions"
-        headers = {
-            "Authorization": API_KEY,
-            "Content-Type": "application/json"
-        }
-       
-        # Format the image for the API
-        image_content = f"data:image/jpeg;base64,{image_base64}"
-       
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": f"Look at this image and tell me what you see related to this question: {question}"},
-                        {"type": "image_url", "image_url": {"url": image_content}}
-                    ]
-                }
-            ]
-        }
-       
-        logger.info("Sending request to Vision API")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    image_description = result["choices"][0]["message"]["content"]
-                    logger.info(f"Received image description: '{image_description[:50]}...'")
-                   
-                    # Combine the original question with the image description
-                    combined_query = f"{question}\nImage context: {image_description}"
-                   
-                    # Get embedding for the combined query
-                    return await get_embedding(combined_query)
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Error processing image (status {response.status}): {error_text}")
-                    # Fall back to text-only query
-                    logger.info("Falling back to text-only query")
-                    return await get_embedding(question)
+        text_results, text_local = await retrieve_for_question(question, conn, filters)
+    except Exception:
+        image_task.cancel()
+        raise
+   
+    try:
+        remaining = VISION_DEADLINE_SECONDS - (time.perf_counter() - started)
+        # Leave the rest of the query's budget for enrichment and the answer
+        if time_remaining() is not None:
+            remaining = min(remaining, time_remaining() - MIN_TIME_TO_START_SECONDS)
+        image_embedding = await asyncio.wait_for(image_task, timeout=max(remaining, 0))
+    except asyncio.TimeoutError:
+        logger.warning(f"Image branch missed the {VISION_DEADLINE_SECONDS}s deadline, using text-only results")
+        return text_results
     except Exception as e:
-        logger.error(f"Exception processing multimodal query: {e}")
+        logger.error(f"Exception processing image, using text-only results: {e}")
         logger.error(traceback.format_exc())
-        # Fall back to text-only query
-        logger.info("Falling back to text-only query due to exception")
-        return await get_embedding(question)
+        return text_results
+   
+    image_results = await find_similar_content(image_embedding, conn, filters=filters)
+    # Local embedder similarities are on another scale than the remote ones
+    return fuse_results(image_results, text_results, comparable=not text_local)
 
 
 # Function to parse LLM response and extract answer and sources with improved reliability
@@ -614,9 +1527,202 @@ def parse_llm_response(response):
         }
 
 
+# Function to answer one admitted query
+async def answer_query(request):
+    conn = get_db_connection()
+   
+    try:
+        # Process the query (handle text and optional image) and find similar content
+        if request.image:
+            with timed_stage("retrieval"):
+                relevant_results = await retrieve_multimodal(request.question, request.image, conn, request.filters)
+            # Fused text and image scores don't say how closely the text alone matched
+            fast_path_eligible = False
+        else:
+            logger.info("Processing query and finding similar content")
+            query_embedding, local = await embed_question(request.question, conn)
+            # Precomputed answers were retrieved unfiltered and matched in the remote embedding space
+            if not local and request.filters is None:
+                precomputed = precomputed_answer(query_embedding, conn)
+                if precomputed is not None:
+                    return precomputed
+            with timed_stage("retrieval"):
+                relevant_results = await find_similar_content(query_embedding, conn, filters=request.filters, local=local)
+            # Local embedder scores are on another scale than the fast path thresholds
+            fast_path_eligible = not local
+       
+        return await answer_from_results(request.question, relevant_results, conn, fast_path_eligible)
+    except DeadlineExceeded as e:
+        admission_stats["deadline_exceeded"] += 1
+        logger.warning(f"Giving up on query: {e}")
+        return overloaded_response(str(e))
+    except CircuitOpenError as e:
+        logger.warning(f"Failing fast: {e}")
+        return overloaded_response(str(e), e.retry_after)
+    except Exception as e:
+        error_msg = f"Error processing query: {e}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        return JSONResponse(
+            status_code=500,
+            content={"error": error_msg}
+        )
+    finally:
+        conn.close()
+
+
+# Function to score how sure retrieval is: top similarity, its lead over the best other post/page, and the question's word overlap with it
+def retrieval_confidence(question, relevant_results):
+    ranked = sorted(relevant_results, key=lambda result: result["similarity"], reverse=True)
+    top = ranked[0]
+    # Other chunks of the same post or page score alike, so the gap is measured to a different source
+    runner_up = next((result["similarity"] for result in ranked[1:] if source_key(result) != source_key(top)), None)
+    question_words = {word for word in re.findall(r"\w+", question.lower()) if len(word) > 2 and word not in STOPWORDS}
+    top_words = set(re.findall(r"\w+", f"{top.get('title') or ''} {top['content']}".lower()))
+    confidence = {
+        "top_score": top["similarity"],
+        "gap": top["similarity"] - runner_up if runner_up is not None else 1.0,
+        "lexical": len(question_words & top_words) / len(question_words) if question_words else 0.0,
+    }
+    confidence["confident"] = (confidence["top_score"] >= FAST_PATH_MIN_SCORE and confidence["gap"] >= FAST_PATH_MIN_GAP
+                               and confidence["lexical"] >= FAST_PATH_MIN_LEXICAL)
+    return confidence
+
+
+# Count one answered query for the fast path metrics
+def record_answer_path(path, seconds, context_tokens):
+    fast_path_stats[path]["answers"] += 1
+    fast_path_stats[path]["seconds"] += seconds
+    fast_path_stats[path]["context_tokens"] += context_tokens
+
+
+def fast_path_snapshot():
+    fast, full = fast_path_stats["fast"], fast_path_stats["full"]
+    answers = fast["answers"] + full["answers"]
+   
+    def mean(path, key):
+        return round(path[key] / path["answers"], 4) if path["answers"] else None
+   
+    snapshot = {
+        "enabled": FAST_PATH_ENABLED,
+        "share": round(fast["answers"] / answers, 4) if answers else None,
+        **{f"{name}_answers": path["answers"] for name, path in (("fast", fast), ("full", full))},
+        **{f"{name}_mean_seconds": mean(path, "seconds") for name, path in (("fast", fast), ("full", full))},
+        **{f"{name}_mean_context_tokens": mean(path, "context_tokens") for name, path in (("fast", fast), ("full", full))},
+    }
+    if fast["answers"] and full["answers"]:
+        snapshot["seconds_saved_per_fast_answer"] = round(snapshot["full_mean_seconds"] - snapshot["fast_mean_seconds"], 4)
+        snapshot["context_tokens_saved_per_fast_answer"] = round(
+            snapshot["full_mean_context_tokens"] - snapshot["fast_mean_context_tokens"], 1
+        )
+    return snapshot
+
+
+# Function to turn retrieved results into an answer with links
+async def answer_from_results(question, relevant_results, conn, fast_path_eligible=False):
+    if not relevant_results:
+        logger.info("No relevant results found")
+        note_request("answer_path", "no_results")
+        return {
+            "answer": "I'm sorry, I doesn't know the answer because this information is not available yet.",
+            "links": []
+        }
+   
+    started = time.perf_counter()
+    usage = {}
+    confidence = retrieval_confidence(question, relevant_results) if FAST_PATH_ENABLED and fast_path_eligible else None
+    if confidence is not None and confidence["confident"]:
+        # A near-exact match: its own chunks answer it, so skip enrichment and send a short context
+        logger.info(f"Taking the fast path (top {confidence['top_score']:.3f}, gap {confidence['gap']:.3f}, "
+                    f"lexical {confidence['lexical']:.2f})")
+        path = "fast"
+        top_results = sorted(relevant_results, key=lambda result: result["similarity"], reverse=True)[:FAST_PATH_CHUNKS]
+        with timed_stage("generation"):
+            llm_response = await generate_answer(
+                question, top_results, model=FAST_PATH_MODEL or ANSWER_MODEL, token_budget=FAST_PATH_TOKEN_BUDGET, usage=usage
+            )
+    else:
+        path = "full"
+        # Enrich results with adjacent chunks for better context
+        logger.info("Enriching results with adjacent chunks")
+        with timed_stage("enrichment"):
+            enriched_results = await enrich_with_adjacent_chunks(conn, relevant_results)
+       
+        # Generate answer
+        logger.info("Generating answer")
+        with timed_stage("generation"):
+            llm_response = await generate_answer(question, enriched_results, usage=usage)
+    record_answer_path(path, time.perf_counter() - started, usage.get("context_tokens", 0))
+    note_request("answer_path", path)
+   
+    # Parse the response
+    logger.info("Parsing LLM response")
+    result = parse_llm_response(llm_response)
+   
+    # If links extraction failed, create them from the relevant results
+    if not result["links"]:
+        logger.info("No links extracted, creating from relevant results")
+        # Create a dict to deduplicate links from the same source
+        links = []
+        unique_urls = set()
+       
+        for res in relevant_results[:5]:  # Use top 5 results
+            snippet = res["content"][:100] + "..." if len(res["content"]) > 100 else res["content"]
+            # Copies of the chunk collapsed at index time link to their own posts too
+            for url in [res["url"], *res.get("duplicate_urls", [])]:
+                if url not in unique_urls:
+                    unique_urls.add(url)
+                    links.append({"url": url, "text": snippet})
+       
+        result["links"] = links
+   
+    # Log the final result structure (without full content for brevity)
+    logger.info(f"Returning result: answer_length={len(result['answer'])}, num_links={len(result['links'])}")
+   
+    # Return the response in the exact format required
+    return result
+
+
 # Define API routes
 @app.post("/api")
 async def query_knowledge_base(request: QueryRequest):
+    if request_journal is None:
+        return await handle_query(request)
+    trace = {"stages": {}}
+    token = request_trace.set(trace)
+    arrived = time.time()
+    started = time.perf_counter()
+    try:
+        response = await handle_query(request)
+    finally:
+        request_trace.reset(token)
+    journal_request(request, arrived, time.perf_counter() - started, response, trace)
+    return response
+
+
+# Function to append a served query to the request journal; a journal failure never fails the query
+def journal_request(request, arrived, seconds, response, trace):
+    try:
+        entry = {"ts": round(arrived, 3), **request_journal.question_fields(request.question)}
+        if request.image:
+            payload = request.image.split(",", 1)[1] if request.image.startswith("data:") else request.image
+            entry["image_bytes"] = estimate_base64_size(request.image)
+            entry["image_hash"] = request_journal.digest(payload)
+        if request.collection is not None:
+            entry["collection"] = request.collection
+        if request.filters is not None:
+            entry["filters"] = request.filters.model_dump(mode="json", exclude_none=True)
+        entry["status"] = response.status_code if isinstance(response, JSONResponse) else 200
+        entry["seconds"] = round(seconds, 4)
+        entry.update(trace)
+        request_journal.record(entry)
+    except Exception as e:
+        logger.warning(f"Could not journal request: {e}")
+
+
+# Function to answer one /api query: validate it, wait for admission, answer
+async def handle_query(request):
+    request_deadline.set(time.monotonic() + REQUEST_DEADLINE_SECONDS)
     try:
         # Log the incoming request
         logger.info(f"Received query request: question='{request.question[:50]}...', image_provided={request.image is not None}")
@@ -628,71 +1734,37 @@ async def query_knowledge_base(request: QueryRequest):
                 status_code=500,
                 content={"error": error_msg}
             )
-           
-        conn = get_db_connection()
        
-        try:
-            # Process the query (handle text and optional image)
-            logger.info("Processing query and generating embedding")
-            query_embedding = await process_multimodal_query(
-                request.question,
-                request.image
+        # Reject oversized images before paying for decoding or any upstream call
+        if request.image and estimate_base64_size(request.image) > MAX_IMAGE_PAYLOAD_BYTES:
+            error_msg = f"Image too large: limit is {MAX_IMAGE_PAYLOAD_BYTES} bytes"
+            logger.warning(error_msg)
+            return JSONResponse(
+                status_code=413,
+                content={"error": error_msg}
             )
            
-            # Find similar content
-            logger.info("Finding similar content")
-            relevant_results = await find_similar_content(query_embedding, conn)
-           
-            if not relevant_results:
-                logger.info("No relevant results found")
-                return {
-                    "answer": "I'm sorry, I doesn't know the answer because this information is not available yet.",
-                    "links": []
-                }
-           
-            # Enrich results with adjacent chunks for better context
-            logger.info("Enriching results with adjacent chunks")
-            enriched_results = await enrich_with_adjacent_chunks(conn, relevant_results)
-           
-            # Generate answer
-            logger.info("Generating answer")
-            llm_response = await generate_answer(request.question, enriched_results)
-           
-            # Parse the response
-            logger.info("Parsing LLM response")
-            result = parse_llm_response(llm_response)
-           
-            # If links extraction failed, create them from the relevant results
-            if not result["links"]:
-                logger.info("No links extracted, creating from relevant results")
-                # Create a dict to deduplicate links from the same source
-                links = []
-                unique_urls = set()
-               
-                for res in relevant_results[:5]:  # Use top 5 results
-                    url = res["url"]
-                    if url not in unique_urls:
-                        unique_urls.add(url)
-                        snippet = res["content"][:100] + "..." if len(res["content"]) > 100 else res["content"]
-                        links.append({"url": url, "text": snippet})
-               
-                result["links"] = links
-           
-            # Log the final result structure (without full content for brevity)
-            logger.info(f"Returning result: answer_length={len(result['answer'])}, num_links={len(result['links'])}")
-           
-            # Return the response in the exact format required
-            return result
-        except Exception as e:
-            error_msg = f"Error processing query: {e}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
+        if request.collection is not None and request.collection not in collections:
+            error_msg = f"Unknown collection: {request.collection}"
+            logger.warning(error_msg)
             return JSONResponse(
-                status_code=500,
+                status_code=404,
                 content={"error": error_msg}
             )
-        finally:
-            conn.close()
+        collection_name.set(request.collection)
+           
+        # Held for the whole query, so an eviction or reload meanwhile doesn't close what it is reading
+        with current_collection().in_use():
+            async with admission_slot():
+                return await answer_query(request)
+    except Overloaded as e:
+        admission_stats["shed"] += 1
+        logger.warning(f"Shedding query: {e}")
+        return overloaded_response(str(e))
+    except DeadlineExceeded as e:
+        admission_stats["deadline_exceeded"] += 1
+        logger.warning(f"Shedding query: {e}")
+        return overloaded_response(str(e))
     except Exception as e:
         # Catch any exceptions at the top level
         error_msg = f"Unhandled exception in query_knowledge_base: {e}"
@@ -704,45 +1776,192 @@ async def query_knowledge_base(request: QueryRequest):
         )
 
 
-# Health check endpoint
+# Answer many questions: one embedding pass, one scoring pass, answers streamed back as NDJSON as they finish
+@app.post("/api/batch")
+async def query_knowledge_base_batch(request: BatchQueryRequest):
+    request_deadline.set(time.monotonic() + REQUEST_DEADLINE_SECONDS)
+    logger.info(f"Received batch request with {len(request.questions)} questions")
+    if not API_KEY:
+        error_msg = "API_KEY environment variable not set"
+        logger.error(error_msg)
+        return JSONResponse(status_code=500, content={"error": error_msg})
+    if not request.questions or len(request.questions) > MAX_BATCH_QUESTIONS:
+        error_msg = f"A batch must have between 1 and {MAX_BATCH_QUESTIONS} questions"
+        logger.warning(error_msg)
+        return JSONResponse(status_code=400, content={"error": error_msg})
+    if request.collection is not None and request.collection not in collections:
+        error_msg = f"Unknown collection: {request.collection}"
+        logger.warning(error_msg)
+        return JSONResponse(status_code=404, content={"error": error_msg})
+    collection_name.set(request.collection)
+   
+    # Retrieval for the whole batch takes one admission slot; each answer then takes its own, as a query does
+    stack = AsyncExitStack()
+    try:
+        kb = stack.enter_context(current_collection().in_use())
+        conn = get_db_connection()
+        stack.callback(conn.close)
+        async with admission_slot():
+            # Load the index on the event loop and hand what was loaded to the worker thread that scores the batch;
+            # in_use keeps the chunk store open even if the collection is reloaded or evicted meanwhile
+            index = get_vector_index(conn)
+            chunk_store, local_embedder = kb.chunk_store, kb.local_embedder
+            try:
+                query_embeddings = await get_embeddings(request.questions)
+                batch_results, searched = await asyncio.to_thread(
+                    retrieve_batch, kb.db_path, index, chunk_store, query_embeddings, request.filters
+                )
+                fast_path_eligible = True
+            except (CircuitOpenError, HTTPException) as e:
+                if local_embedder is None or not remote_embedding_unavailable(e):
+                    raise
+                retrieval_stats["local_fallbacks"] += 1
+                logger.warning(f"Remote embeddings unavailable ({e!r}), retrieving the batch with the local embedder")
+                query_embeddings = [local_embedder.encode(question) for question in request.questions]
+                batch_results, searched = await asyncio.to_thread(
+                    retrieve_batch, kb.db_path, index, chunk_store, query_embeddings, request.filters, local_embedder
+                )
+                fast_path_eligible = False
+            for key, count in searched.items():
+                hierarchy_stats[key] += count
+    except Overloaded as e:
+        await stack.aclose()
+        admission_stats["shed"] += 1
+        logger.warning(f"Shedding batch: {e}")
+        return overloaded_response(str(e))
+    except DeadlineExceeded as e:
+        await stack.aclose()
+        admission_stats["deadline_exceeded"] += 1
+        logger.warning(f"Giving up on batch: {e}")
+        return overloaded_response(str(e))
+    except CircuitOpenError as e:
+        await stack.aclose()
+        logger.warning(f"Failing fast: {e}")
+        return overloaded_response(str(e), e.retry_after)
+    except Exception as e:
+        await stack.aclose()
+        error_msg = f"Error processing batch: {e}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        return JSONResponse(status_code=500, content={"error": error_msg})
+   
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+   
+    async def answer(i, question, relevant_results):
+        async with semaphore:
+            # Each answer gets the full per-request budget from when it starts
+            request_deadline.set(time.monotonic() + REQUEST_DEADLINE_SECONDS)
+            collection_name.set(request.collection)
+            try:
+                async with admission_slot():
+                    result = await answer_from_results(question, relevant_results, conn, fast_path_eligible)
+            except (Overloaded, DeadlineExceeded) as e:
+                admission_stats["shed" if isinstance(e, Overloaded) else "deadline_exceeded"] += 1
+                logger.warning(f"Shedding batch question {i}: {e}")
+                return {"index": i, "question": question, "error": str(e)}
+            except Exception as e:
+                logger.error(f"Error answering batch question {i}: {e}")
+                return {"index": i, "question": question, "error": str(e)}
+            return {"index": i, "question": question, **result}
+   
+    async def stream():
+        tasks = [
+            asyncio.create_task(answer(i, question, relevant_results))
+            for i, (question, relevant_results) in enumerate(zip(request.questions, batch_results))
+        ]
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                yield json.dumps(await next_answer) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            await stack.aclose()
+   
+    # The background task releases the slot even if the client disconnects before streaming starts
+    return StreamingResponse(stream(), media_type="application/x-ndjson", background=BackgroundTask(stack.aclose))
+
+
+# Liveness probe: the process is up and serving
+@app.get("/livez")
+async def liveness_check():
+    return {"status": "alive"}
+
+
+# Readiness probe: startup finished and the index is loaded
+@app.get("/readyz")
+async def readiness_check():
+    if not app_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+
+# Function to check the database can still be opened and read, without scanning any table
+def check_database(db_path):
+    # Read-only, so a missing file is an error instead of a new empty database
+    conn = sqlite3.connect(f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=1.0)
+    try:
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    finally:
+        conn.close()
+
+
+# Health check endpoint, served from the stats recorded when the index was loaded
 @app.get("/health")
 async def health_check():
+    if not app_state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "api_key_set": bool(API_KEY), "startup_phases": app_state["startup_phases"]}
+        )
+    default_kb = collections.get()
     try:
-        # Try to connect to the database as part of health check
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-       
-        # Check if tables exist and have data
-        cursor.execute("SELECT COUNT(*) FROM discourse_chunks")
-        discourse_count = cursor.fetchone()[0]
-       
-        cursor.execute("SELECT COUNT(*) FROM markdown_chunks")
-        markdown_count = cursor.fetchone()[0]
-       
-        # Check if any embeddings exist
-        cursor.execute("SELECT COUNT(*) FROM discourse_chunks WHERE embedding IS NOT NULL")
-        discourse_embeddings = cursor.fetchone()[0]
-       
-        cursor.execute("SELECT COUNT(*) FROM markdown_chunks WHERE embedding IS NOT NULL")
-        markdown_embeddings = cursor.fetchone()[0]
-       
-        conn.close()
-       
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "api_key_set": bool(API_KEY),
-            "discourse_chunks": discourse_count,
-            "markdown_chunks": markdown_count,
-            "discourse_embeddings": discourse_embeddings,
-            "markdown_embeddings": markdown_embeddings
-        }
-    except Exception as e:
+        await asyncio.to_thread(check_database, default_kb.db_path)
+    except sqlite3.Error as e:
         logger.error(f"Health check failed: {e}")
         return JSONResponse(
             status_code=500,
-            content={"status": "unhealthy", "error": str(e), "api_key_set": bool(API_KEY)}
+            content={"status": "unhealthy", "database": "error", "error": str(e), "api_key_set": bool(API_KEY)}
         )
+    return {
+        "status": "healthy",
+        "database": "connected",
+        "api_key_set": bool(API_KEY),
+        **default_kb.corpus,
+        "admission": admission_stats,
+        "upstream": {name: endpoint.snapshot() for name, endpoint in upstream_endpoints.items()},
+        "local_embedding": {"available": default_kb.local_embedder is not None, **retrieval_stats},
+        "hierarchical_search": hierarchy_stats if HIERARCHICAL_SEARCH else None,
+        "fast_path": fast_path_snapshot(),
+        "answer_table": {"entries": len(default_kb.answer_table),
+                         "current": default_kb.answer_table.is_current(database_signature(default_kb.db_path)),
+                         **answer_table_stats}
+        if default_kb.answer_table is not None else None,
+        "coarse_search": {"dim": default_kb.vector_index.coarse.shape[1], "shortlist": COARSE_SHORTLIST}
+        if default_kb.loaded and default_kb.vector_index.coarse is not None else None,
+        "chunk_store": {"codec": default_kb.chunk_store.codec, "bytes_read": default_kb.chunk_store.bytes_read}
+        if default_kb.chunk_store else None,
+        "collections": collections.snapshot(),
+        "startup_phases": app_state["startup_phases"],
+    }
+
+
+# List the saved request profiles, newest first
+@app.get("/admin/profiles")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    if not profile_authorized(x_profile_token):
+        return JSONResponse(status_code=403, content={"error": "Profiling is disabled or the token is wrong"})
+    return {"profiles": request_profiler.list(), "artifacts": list(ARTIFACTS)}
+
+
+# Download one artifact of a saved request profile
+@app.get("/admin/profiles/{profile_id}/{artifact}")
+async def download_profile(profile_id: str, artifact: str, x_profile_token: Optional[str] = Header(None)):
+    if not profile_authorized(x_profile_token):
+        return JSONResponse(status_code=403, content={"error": "Profiling is disabled or the token is wrong"})
+    path = request_profiler.artifact_path(profile_id, artifact)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "No such profile artifact"})
+    return FileResponse(path, media_type=ARTIFACTS[artifact], filename=f"{profile_id}-{artifact}")
 
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
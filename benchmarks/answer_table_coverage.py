@@ -0,0 +1,119 @@
+"""Share of replayed questions the precomputed answer table would serve, by match threshold.
+
+    python benchmarks/answer_table_coverage.py --thresholds 0.2 0.25 0.3 0.35
+    python benchmarks/answer_table_coverage.py --replay questions.jsonl --remote
+
+Canonical questions are built exactly as precompute_answers.py builds them. The replayed
+traffic is a JSONL file with a "question" per line (or plain lines of text) if given;
+otherwise it is the opening post of every Discourse topic plus the promptfoo sample
+questions. An opening post trivially matches its own topic's title, so coverage is also
+reported with each post's own title left out of the table, which is closer to a question
+the table has not seen. By default both sides are embedded with the local embedder, so
+its thresholds are not the remote model's; --remote embeds with the configured upstream
+(API_KEY, AIPIPE_BASE_URL) for numbers that carry over to ANSWER_TABLE_MIN_SIMILARITY.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from answer_table import canonical_questions  # noqa: E402
+from benchmarks.chunking_compare import sample_questions  # noqa: E402
+from local_embedding import LocalEmbedder  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# (question, origin of the canonical question it came from, or None)
+def default_replay(discourse_dir, max_chars):
+    replay = []
+    for path in sorted(glob.glob(os.path.join(discourse_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            topic = json.load(f)
+        posts = topic["post_stream"]["posts"]
+        if posts:
+            text = re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", posts[0]["cooked"])).strip()
+            if text:
+                replay.append((text[:max_chars], f"discourse:{topic['id']}"))
+    replay.extend((question, None) for question, _ in sample_questions())
+    return replay
+
+
+def load_replay(path):
+    replay = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                replay.append((json.loads(line)["question"], None))
+            except (ValueError, KeyError, TypeError):
+                replay.append((line, None))
+    return replay
+
+
+async def remote_embeddings(texts):
+    import app
+    try:
+        return np.asarray(await app.get_embeddings(texts), dtype=np.float32)
+    finally:
+        if app.http_session is not None:
+            await app.http_session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replay", default=None, help="JSONL with a \"question\" per line, or plain text lines")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=None,
+                        help="Default 0.2-0.35 for local embeddings, 0.8-0.95 for remote ones")
+    parser.add_argument("--remote", action="store_true", help="Embed with the upstream model instead of the local embedder")
+    parser.add_argument("--max-chars", type=int, default=300, help="Opening posts are cut to this length, like a typed question")
+    parser.add_argument("--examples", type=int, default=5)
+    args = parser.parse_args()
+    thresholds = args.thresholds or ([0.8, 0.85, 0.9, 0.92, 0.95] if args.remote else [0.2, 0.25, 0.3, 0.35])
+
+    canonical = canonical_questions(os.path.join(ROOT, "discourse_json"), os.path.join(ROOT, "tds_pages_md"))
+    replay = load_replay(args.replay) if args.replay else default_replay(os.path.join(ROOT, "discourse_json"), args.max_chars)
+    names, origins = list(canonical), list(canonical.values())
+    texts = names + [question for question, _ in replay]
+    if args.remote:
+        vectors = asyncio.run(remote_embeddings(texts))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        vectors = LocalEmbedder.fit(texts).embeddings
+    table, queries = vectors[:len(names)], vectors[len(names):]
+    similarities = queries @ table.T
+    kinds = Counter(origin.split(":")[0] for origin in origins)
+    print(f"{len(names)} canonical questions ({dict(kinds)}), {len(replay)} replayed questions, "
+          f"{'remote' if args.remote else 'local'} embeddings")
+
+    best = similarities.max(axis=1)
+    # The same, with the canonical question derived from each replayed post's own topic removed
+    held_out = similarities.copy()
+    for i, (_, origin) in enumerate(replay):
+        if origin is not None:
+            held_out[i, [j for j, other in enumerate(origins) if other == origin]] = -np.inf
+    best_held_out = held_out.max(axis=1)
+    print(f"best match similarity p50={np.percentile(best, 50):.3f} p90={np.percentile(best, 90):.3f}  "
+          f"own topic left out p50={np.percentile(best_held_out, 50):.3f} p90={np.percentile(best_held_out, 90):.3f}")
+    for threshold in thresholds:
+        print(f"  threshold {threshold:.2f}: served {100 * np.mean(best >= threshold):5.1f}%  "
+              f"own topic left out {100 * np.mean(best_held_out >= threshold):5.1f}%")
+
+    print("closest matches with the own topic left out:")
+    for i in np.argsort(-best_held_out)[:args.examples]:
+        match = names[int(np.argmax(held_out[i]))]
+        print(f"  {best_held_out[i]:.3f}  {replay[i][0][:70]!r} -> {match[:70]!r}")
+
+
+if __name__ == "__main__":
+    main()
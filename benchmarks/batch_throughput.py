@@ -0,0 +1,88 @@
+"""Throughput of /api/batch vs the same questions sent one by one through /api.
+
+    python benchmarks/batch_throughput.py --questions 100 --chunks 2000 --latency-scale 0.2
+
+Runs against an in-process mock upstream and a synthetic knowledge base, so no API key or
+network is needed. The batch streams answers as they finish; time to the first answer is
+reported alongside the total.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ["AIPIPE_BASE_URL"] = "http://127.0.0.1:9105"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from benchmarks.mock_upstream import start_mock_upstream  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+
+
+async def sequential(questions):
+    for question in questions:
+        await app.query_knowledge_base(app.QueryRequest(question=question))
+
+
+async def batch(questions):
+    started = time.perf_counter()
+    first = None
+    answered = 0
+    response = await app.query_knowledge_base_batch(app.BatchQueryRequest(questions=questions))
+    async for line in response.body_iterator:
+        if first is None:
+            first = time.perf_counter() - started
+        answered += "error" not in json.loads(line)
+    await response.background()
+    return first, answered
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "knowledge_base.db")
+        app.collections.register(app.collections.default, db_path)
+        build_synthetic_db(db_path, n_discourse=args.chunks, n_markdown=args.chunks // 4)
+        # Random embeddings barely correlate; keep every candidate so retrieval does real work
+        app.SIMILARITY_THRESHOLD = -1.0
+        app.LOCAL_EMBEDDING_ENABLED = False
+        conn = app.get_db_connection()
+        app.get_vector_index(conn)
+        conn.close()
+        upstream, runner = await start_mock_upstream(port=9105, latency_scale=args.latency_scale)
+        questions = [f"How do I submit assignment {i}?" for i in range(args.questions)]
+        try:
+            started = time.perf_counter()
+            await sequential(questions)
+            elapsed = time.perf_counter() - started
+            print(f"{'sequential':10} {elapsed:7.2f}s  {len(questions) / elapsed:6.2f} questions/s  "
+                  f"embedding calls={upstream.calls['embedding']}")
+
+            calls_before = upstream.calls["embedding"]
+            started = time.perf_counter()
+            first, answered = await batch(questions)
+            elapsed = time.perf_counter() - started
+            print(f"{'batch':10} {elapsed:7.2f}s  {len(questions) / elapsed:6.2f} questions/s  "
+                  f"embedding calls={upstream.calls['embedding'] - calls_before}  "
+                  f"first answer={first:.2f}s  answered={answered}")
+        finally:
+            await app.get_http_session().close()
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--chunks", type=int, default=2000, help="Discourse chunks in the synthetic corpus")
+    parser.add_argument("--latency-scale", type=float, default=0.2, help="Scale the mock upstream's latencies")
+    parser.add_argument("--concurrency", type=int, default=app.BATCH_CONCURRENCY, help="BATCH_CONCURRENCY")
+    args = parser.parse_args()
+    app.BATCH_CONCURRENCY = args.concurrency
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Database size and per-request bytes read, with chunk text in the tables vs the compressed store.
+
+    python benchmarks/chunk_store_io.py --queries 200
+
+Chunk texts are real: tds_pages_md split into 1000-character chunks and the posts in
+discourse_json. Bytes read are the process's read() bytes (/proc/self/io rchar) while
+fetching the top results and enriching them with their neighbours, on a fresh database
+connection per request as /api does.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = 1000
+
+
+def corpus_texts():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "tds_pages_md", "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        texts.extend(text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE))
+    for path in sorted(glob.glob(os.path.join(ROOT, "discourse_json", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            posts = json.load(f)["post_stream"]["posts"]
+        texts.extend(re.sub(r"<[^>]+>", " ", post["cooked"])[:CHUNK_SIZE] for post in posts)
+    return [text for text in texts if text.strip()]
+
+
+def read_bytes():
+    with open("/proc/self/io") as f:
+        return int(next(line for line in f if line.startswith("rchar:")).split()[1])
+
+
+def megabytes(n):
+    return f"{n / 1024 / 1024:7.2f} MB"
+
+
+async def bytes_per_request(queries, rng):
+    total = 0
+    for _ in range(queries):
+        conn = app.get_db_connection()
+        index = app.get_vector_index(conn)
+        rows = rng.sample(range(len(index)), app.MAX_RESULTS)
+        before = read_bytes()
+        results = app.fetch_results(conn, index, app.current_collection().chunk_store, rows, [1.0] * len(rows))
+        await app.enrich_with_adjacent_chunks(conn, results)
+        total += read_bytes() - before
+        conn.close()
+    return total / queries
+
+
+async def main_async(args):
+    texts = corpus_texts()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "knowledge_base.db")
+        app.collections.register(app.collections.default, db_path)
+        n = len(texts) * args.scale
+        build_synthetic_db(db_path, n_discourse=n * 4 // 5, n_markdown=n // 5, texts=texts)
+        app.LOCAL_EMBEDDING_ENABLED = False
+
+        conn = sqlite3.connect(db_path)
+        text_bytes = sum(conn.execute(f"SELECT SUM(LENGTH(CAST(content AS BLOB))) FROM {table}").fetchone()[0]
+                         for table in ("discourse_chunks", "markdown_chunks"))
+        conn.close()
+        db_size = os.path.getsize(db_path)
+
+        app.CHUNK_STORE_ENABLED = False
+        before = await bytes_per_request(args.queries, random.Random(0))
+
+        app.CHUNK_STORE_ENABLED = True
+        app.current_collection().unload()
+        conn = app.get_db_connection()
+        app.get_vector_index(conn)
+        conn.close()
+        store_size = os.path.getsize(f"{db_path}.chunks")
+        after = await bytes_per_request(args.queries, random.Random(0))
+
+        # What the database would weigh once the tables no longer carry the text
+        stripped = os.path.join(tmp, "stripped.db")
+        shutil.copy(db_path, stripped)
+        conn = sqlite3.connect(stripped)
+        for table in ("discourse_chunks", "markdown_chunks"):
+            conn.execute(f"UPDATE {table} SET content = NULL")
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        stripped_size = os.path.getsize(stripped)
+
+        print(f"{n} chunks, {megabytes(text_bytes)} of text, codec={app.current_collection().chunk_store.codec}")
+        print(f"before: database {megabytes(db_size)}                                "
+              f"read/request {before / 1024:9.1f} KB")
+        print(f"after:  database {megabytes(stripped_size)} + store {megabytes(store_size)} "
+              f"(text x{text_bytes / store_size:.1f} smaller)  read/request {after / 1024:9.1f} KB")
+        app.current_collection().unload()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=1, help="Repeat the corpus this many times")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
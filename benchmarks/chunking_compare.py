@@ -0,0 +1,133 @@
+"""Structure-aware chunking (chunker.py) vs fixed-size character chunking of the same corpus.
+
+    python benchmarks/chunking_compare.py --k 5
+
+Chunks tds_pages_md and every post in discourse_json both ways and reports chunk count,
+tokens per chunk and index size. Recall@k is measured on the promptfoo sample questions
+whose expected link is in the corpus. The remote embedding model needs an API key, so
+recall uses the local embedder fitted on each chunk set; it ranks lexically, which
+shows how well each chunking keeps answers together, not what the production model scores.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from chunker import chunk_discourse_post, chunk_markdown, split_front_matter  # noqa: E402
+from context_packer import count_tokens  # noqa: E402
+from local_embedding import LocalEmbedder  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DISCOURSE_URL = "https://discourse.onlinedegree.iitm.ac.in/t/{slug}/{topic_id}/{post_number}"
+EMBEDDING_BYTES = 1536 * 4  # text-embedding-3-small, float32
+
+
+def load_corpus():
+    pages, topics = [], []
+    for path in sorted(glob.glob(os.path.join(ROOT, "tds_pages_md", "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    for path in sorted(glob.glob(os.path.join(ROOT, "discourse_json", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            topics.append(json.load(f))
+    return pages, topics
+
+
+def post_url(topic, post):
+    return DISCOURSE_URL.format(slug=topic["slug"], topic_id=topic["id"], post_number=post["post_number"])
+
+
+# Fixed windows of characters, as the knowledge base has been built so far
+def fixed_chunks(pages, topics, size, overlap):
+    chunks = []
+    step = size - overlap
+    for text in pages:
+        meta, body = split_front_matter(text)
+        chunks.extend((meta.get("original_url", ""), body[i:i + size]) for i in range(0, len(body), step))
+    for topic in topics:
+        for post in topic["post_stream"]["posts"]:
+            text = re.sub(r"<[^>]+>", " ", post["cooked"])
+            text = re.sub(r"\s+", " ", text).strip()
+            chunks.extend((post_url(topic, post), text[i:i + size]) for i in range(0, len(text), step))
+    return [(url, text) for url, text in chunks if text.strip()]
+
+
+def structured_chunks(pages, topics, max_tokens, overlap_tokens):
+    chunks = []
+    for text in pages:
+        meta, page_chunks = chunk_markdown(text, max_tokens, overlap_tokens)
+        chunks.extend((meta.get("original_url", ""), chunk["text"]) for chunk in page_chunks)
+    indexed_posts = {(topic["id"], post["post_number"]) for topic in topics for post in topic["post_stream"]["posts"]}
+    for topic in topics:
+        for post in topic["post_stream"]["posts"]:
+            post_chunks = chunk_discourse_post(post["cooked"], topic["title"], topic["id"], indexed_posts,
+                                               max_tokens, overlap_tokens)
+            chunks.extend((post_url(topic, post), chunk["text"]) for chunk in post_chunks)
+    return chunks
+
+
+# Questions from the promptfoo config, with the links their answers must cite
+def sample_questions():
+    with open(os.path.join(ROOT, "project-tds-virtual-ta-promptfoo.yaml"), encoding="utf-8") as f:
+        config = f.read()
+    questions = []
+    for test in config.split("  - vars:")[1:]:
+        question = re.search(r"question: (.*)", test).group(1).strip()
+        links = re.findall(r"value: (https?://\S+)", test)
+        if links:
+            questions.append((question, links))
+    return questions
+
+
+# A chunk's URL satisfies an expected link if it is the same topic or the same page route
+def same_source(url, link):
+    topic = re.search(r"/t/[^/]+/(\d+)", link)
+    if topic:
+        return re.search(rf"/t/[^/]+/{topic.group(1)}(/|$)", url) is not None
+    return url.split("?")[0].rstrip("/") == link.split("?")[0].rstrip("/")
+
+
+def report(name, chunks, questions, k):
+    tokens = [count_tokens(text) for _, text in chunks]
+    text_bytes = sum(len(text.encode("utf-8")) for _, text in chunks)
+    embedder = LocalEmbedder.fit([text for _, text in chunks])
+    hits, evaluable = 0, 0
+    ranks = []
+    for question, links in questions:
+        if not any(same_source(url, link) for url, _ in chunks for link in links):
+            continue
+        evaluable += 1
+        order = np.argsort(-embedder.similarities(embedder.encode(question)))
+        rank = next(r for r, row in enumerate(order, 1) if any(same_source(chunks[row][0], link) for link in links))
+        ranks.append(rank)
+        hits += rank <= k
+    print(f"{name:11} chunks={len(chunks):6}  tokens/chunk mean={statistics.mean(tokens):6.1f} "
+          f"p95={np.percentile(tokens, 95):6.0f} max={max(tokens):5}  "
+          f"index={len(chunks) * EMBEDDING_BYTES / 1024 / 1024:6.1f} MB + text {text_bytes / 1024 / 1024:5.1f} MB  "
+          f"recall@{k}={hits}/{evaluable}  first relevant rank={ranks}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="Fixed-size chunk length in characters")
+    parser.add_argument("--overlap-chars", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=None, help="CHUNK_MAX_TOKENS")
+    parser.add_argument("--overlap-tokens", type=int, default=None, help="CHUNK_OVERLAP_TOKENS")
+    args = parser.parse_args()
+
+    pages, topics = load_corpus()
+    questions = sample_questions()
+    report("fixed", fixed_chunks(pages, topics, args.chunk_chars, args.overlap_chars), questions, args.k)
+    report("structured", structured_chunks(pages, topics, args.max_tokens, args.overlap_tokens), questions, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Latency and recall of two-stage (truncated, then full-dimension) search vs exact search.
+
+    python benchmarks/coarse_search.py --rows 200000 --dims 128 256 512 --shortlists 250 1000 4000
+
+Random Gaussian vectors have no useful prefix, so the corpus is synthetic but shaped like
+text-embedding-3 output: chunks cluster around topics, and the per-dimension variance
+decays so the leading dimensions carry most of the signal. Queries are noisy copies of
+chunks. Recall@k is the overlap of the top k with exact search's top k.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from vector_index import batch_top_k, truncate_embeddings, two_stage_top_k  # noqa: E402
+
+
+def normalized(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_corpus(rows, dim, topics, queries, decay, seed=0):
+    rng = np.random.default_rng(seed)
+    scale = (np.arange(dim, dtype=np.float32) + 1) ** -decay
+    centres = rng.standard_normal((topics, dim), dtype=np.float32) * scale
+    matrix = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 50000):
+        n = min(50000, rows - start)
+        block = centres[rng.integers(0, topics, n)] + 0.8 * rng.standard_normal((n, dim), dtype=np.float32) * scale
+        matrix[start:start + n] = normalized(block)
+    sources = matrix[rng.integers(0, rows, queries)]
+    noise = 0.8 * rng.standard_normal((queries, dim), dtype=np.float32) * scale
+    return matrix, normalized(sources + noise)
+
+
+def timed(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query[None, :])[0][0])
+        latencies.append(time.perf_counter() - started)
+    latencies = np.asarray(latencies) * 1000
+    return results, f"p50={np.percentile(latencies, 50):7.2f}ms  p99={np.percentile(latencies, 99):7.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--decay", type=float, default=0.5, help="Per-dimension std falls as (i + 1) ** -decay")
+    parser.add_argument("--dims", type=int, nargs="+", default=[128, 256, 512], help="COARSE_DIM values")
+    parser.add_argument("--shortlists", type=int, nargs="+", default=[250, 1000, 4000], help="COARSE_SHORTLIST values")
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"Building {args.rows} x {args.dim} corpus...")
+    matrix, queries = synthetic_corpus(args.rows, args.dim, args.topics, args.queries, args.decay)
+    # Warm the matrix into the page cache before timing anything
+    batch_top_k(matrix, queries[:1], -1.0, args.k)
+
+    exact, summary = timed(lambda query: batch_top_k(matrix, query, -1.0, args.k), queries)
+    print(f"{'exact':>8} {args.dim:5}d {'':>15}  scan={matrix.nbytes / 1024 / 1024:7.1f} MB  {summary}")
+    for dim in args.dims:
+        coarse = truncate_embeddings(matrix, dim)
+        for shortlist in args.shortlists:
+            found, summary = timed(
+                lambda query: two_stage_top_k(matrix, coarse, query, -1.0, args.k, shortlist), queries
+            )
+            recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(found, exact)])
+            scanned = coarse.nbytes + shortlist * args.dim * 4
+            print(f"{'2-stage':>8} {dim:5}d shortlist={shortlist:5}  scan={scanned / 1024 / 1024:7.1f} MB  "
+                  f"{summary}  recall@{args.k}={recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare prompt-context tokens: old per-result concatenation vs the context packer.
+
+    python benchmarks/context_tokens.py --queries 200
+
+Splits tds_pages_md/*.md into fixed-size overlapping chunks. For each simulated query it
+takes MAX_RESULTS hits: runs of neighbouring chunks from a few documents, which is what
+retrieval usually returns. It then builds the context both ways.
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_packer import count_tokens, pack_context  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+MAX_RESULTS = 15
+
+
+def chunk_text(text):
+    chunks, start = [], 0
+    while start < len(text):
+        chunks.append(text[start:start + CHUNK_SIZE])
+        start += CHUNK_SIZE - CHUNK_OVERLAP
+    return chunks
+
+
+def load_docs():
+    docs = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "tds_pages_md", "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            chunks = chunk_text(f.read())
+        if len(chunks) >= 3:
+            docs[os.path.basename(path)] = chunks
+    return docs
+
+
+# Mirror enrich_with_adjacent_chunks: each hit carries its previous and next chunk
+def enriched_hit(title, chunks, index, similarity):
+    neighbours = {i: chunks[i] for i in (index - 1, index, index + 1) if 0 <= i < len(chunks)}
+    return {
+        "source": "markdown", "title": title, "url": f"https://tds.s-anand.net/#/{title}",
+        "chunk_index": index, "similarity": similarity, "chunks": neighbours,
+        "content": " ".join(neighbours[i] for i in sorted(neighbours)),
+    }
+
+
+def old_context(results):
+    context = ""
+    for result in results:
+        context += f"\n\nDocumentation (URL: {result['url']}):\n{result['content'][:1500]}"
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    docs = load_docs()
+    titles = list(docs)
+    old_total = new_total = 0
+    for _ in range(args.queries):
+        hits = []
+        while len(hits) < MAX_RESULTS:
+            title = rng.choice(titles)
+            chunks = docs[title]
+            start = rng.randrange(len(chunks))
+            for index in range(start, min(start + rng.randint(1, 4), len(chunks))):
+                hits.append(enriched_hit(title, chunks, index, rng.uniform(0.5, 0.9)))
+        hits = sorted(hits[:MAX_RESULTS], key=lambda r: r["similarity"], reverse=True)
+        old_total += count_tokens(old_context(hits))
+        new_total += pack_context(hits)[1]
+
+    print(f"{args.queries} queries over {len(docs)} docs")
+    print(f"old context:    {old_total / args.queries:8.0f} tokens/request")
+    print(f"packed context: {new_total / args.queries:8.0f} tokens/request "
+          f"({100 * (1 - new_total / old_total):.0f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Share of traffic on the confidence-based fast path, and its latency and context-token savings.
+
+    python benchmarks/fast_path.py --queries 200 --confident-share 0.4 --latency-scale 1.0
+
+Builds a synthetic knowledge base whose chunk texts are the course pages cut by chunker.py,
+and sends the same mixed traffic through /api with FAST_PATH_ENABLED off and on. A
+--confident-share of the questions are a chunk's opening words, and that chunk is given the
+question's mock embedding, so it comes back as a near-exact match. The rest are unrelated
+questions whose results are only loosely similar. The mock upstream's chat latency does
+not grow with the prompt, so the latency saved here is enrichment and request overhead
+only; a shorter prompt (and FAST_PATH_MODEL) also speeds up a real model.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ["AIPIPE_BASE_URL"] = "http://127.0.0.1:9104"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.mock_upstream import start_mock_upstream, text_embedding  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+from chunker import chunk_markdown  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def page_chunks():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "tds_pages_md", "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            texts.extend(chunk["text"] for chunk in chunk_markdown(f.read())[1])
+    return texts
+
+
+# Give some chunks the embedding of a question made from their own opening words
+def plant_questions(db_path, n, rng):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, content FROM discourse_chunks").fetchall()
+    questions = []
+    for row_id, content in (rows[i] for i in rng.choice(len(rows), n, replace=False)):
+        body = content.split("\n\n", 1)[-1]  # Past the "Title > Section" header
+        question = " ".join(body.split()[:12])
+        conn.execute("UPDATE discourse_chunks SET embedding = ? WHERE id = ?",
+                     (np.asarray(text_embedding(question), dtype=np.float32).tobytes(), row_id))
+        questions.append(question)
+    conn.commit()
+    conn.close()
+    return questions
+
+
+async def run(questions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def ask(question):
+        async with semaphore:
+            started = time.perf_counter()
+            await app.query_knowledge_base(app.QueryRequest(question=question))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(ask(question) for question in questions))
+    return np.asarray(latencies) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--confident-share", type=float, default=0.4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply the mock upstream's latencies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = page_chunks()
+    upstream, runner = await start_mock_upstream(port=9104, latency_scale=args.latency_scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "knowledge_base.db")
+        build_synthetic_db(db_path, n_discourse=len(texts), n_markdown=200, texts=texts, seed=args.seed)
+        n_confident = int(args.queries * args.confident_share)
+        questions = plant_questions(db_path, n_confident, rng)
+        questions += [f"Question {i} about something the course never covered" for i in range(args.queries - n_confident)]
+        rng.shuffle(questions)
+        app.collections.register(app.collections.default, db_path)
+        # Random chunk embeddings barely correlate with anything; let every query get results
+        app.SIMILARITY_THRESHOLD = -1.0
+        app.ANSWER_TABLE_ENABLED = False
+
+        print(f"{len(texts)} chunks, {args.queries} queries, {n_confident} of them near-exact matches")
+        for enabled in (False, True):
+            app.FAST_PATH_ENABLED = enabled
+            for stats in app.fast_path_stats.values():
+                stats.update(answers=0, seconds=0.0, context_tokens=0)
+            latencies = await run(questions, args.concurrency)
+            snapshot = app.fast_path_snapshot()
+            print(f"\nfast path {'on' if enabled else 'off'}: /api p50={np.percentile(latencies, 50):6.0f}ms "
+                  f"p90={np.percentile(latencies, 90):6.0f}ms  share on fast path={snapshot['share']}")
+            for path in ("fast", "full"):
+                print(f"  {path:4}: {snapshot[f'{path}_answers']:4} answers, answer stage "
+                      f"{snapshot[f'{path}_mean_seconds'] or 0:.3f}s, "
+                      f"{snapshot[f'{path}_mean_context_tokens'] or 0:.0f} context tokens")
+            if "context_tokens_saved_per_fast_answer" in snapshot:
+                print(f"  saved per fast answer: {snapshot['seconds_saved_per_fast_answer']:.3f}s, "
+                      f"{snapshot['context_tokens_saved_per_fast_answer']:.0f} context tokens")
+    await app.http_session.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
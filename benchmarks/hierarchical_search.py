@@ -0,0 +1,120 @@
+"""Candidate-set reduction, latency and recall of two-level (topic/page, then chunk) search vs flat search.
+
+    python benchmarks/hierarchical_search.py --rows 25000 100000 200000 --top-sections 50
+
+The corpus is synthetic but nested the way the knowledge base is: chunks belong to
+topics or pages (sizes drawn from a geometric distribution), and topics share broader
+themes. Queries are noisy copies of random chunks. Recall@k is the overlap of the top k
+with flat exact search's top k; each summary choice is run separately to compare them.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from vector_index import (  # noqa: E402
+    SOURCE_DISCOURSE, SOURCE_MARKDOWN, SectionSummaries, VectorIndex, batch_top_k, hierarchical_top_k,
+)
+
+
+def unit(rng, n, dim):
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_index(rows, dim, mean_section_size, themes, query_noise, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = []
+    while sum(sizes) < rows:
+        sizes.append(int(rng.geometric(1 / mean_section_size)))
+    sizes[-1] -= sum(sizes) - rows
+    section_of_row = np.repeat(np.arange(len(sizes)), sizes)
+    theme_vectors = unit(rng, themes, dim)
+    section_vectors = 0.6 * theme_vectors[rng.integers(0, themes, len(sizes))] + 0.8 * unit(rng, len(sizes), dim)
+
+    embeddings = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 50000):
+        block = section_vectors[section_of_row[start:start + 50000]]
+        block = block + 0.9 * unit(rng, len(block), dim)
+        embeddings[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+
+    # One section in ten is a course page, the rest are Discourse topics
+    is_page = (section_of_row % 10) == 0
+    index = VectorIndex(
+        embeddings,
+        np.where(is_page, SOURCE_MARKDOWN, SOURCE_DISCOURSE).astype(np.int8),
+        np.arange(rows, dtype=np.int64),
+        section_of_row.astype(np.int32),
+        [f"section_{i}" for i in range(len(sizes))],
+        np.where(is_page, -1, section_of_row).astype(np.int64),
+        np.full(rows, np.nan),
+        np.zeros(rows, dtype=np.int32),
+    )
+    queries = embeddings[rng.integers(0, rows, 200)] + query_noise * unit(rng, 200, dim)
+    return index, queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return f"p50={np.percentile(latencies, 50):7.2f}ms p99={np.percentile(latencies, 99):7.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[25000, 100000, 200000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--section-size", type=float, default=20, help="Mean chunks per topic/page")
+    parser.add_argument("--themes", type=int, default=200)
+    parser.add_argument("--top-sections", type=int, nargs="+", default=[20, 50, 200], help="HIERARCHY_TOP_SECTIONS")
+    parser.add_argument("--min-score", type=float, default=-1.0, help="HIERARCHY_MIN_SCORE; -1 never falls back")
+    parser.add_argument("--query-noise", type=float, default=1.0, help="Norm of the noise added to a chunk to make a query")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=15)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        index, queries = synthetic_index(rows, args.dim, args.section_size, args.themes, args.query_noise)
+        queries = queries[:args.queries]
+        started = time.perf_counter()
+        sections = SectionSummaries.build(index)
+        build_seconds = time.perf_counter() - started
+        print(f"\n{rows} chunks in {len(sections)} sections (summaries built in {build_seconds:.2f}s)")
+
+        flat, latencies = [], []
+        for query in queries:
+            started = time.perf_counter()
+            flat.append(batch_top_k(index.embeddings, query[None, :], -1.0, args.k)[0][0])
+            latencies.append(time.perf_counter() - started)
+        print(f"  {'flat':24} scored 100.0%  {percentiles(latencies)}")
+
+        variants = {
+            "centroid": SectionSummaries(sections.section_ids, sections.centroids, sections.centroids,
+                                         sections.order, sections.offsets),
+            "max-pooled": SectionSummaries(sections.section_ids, sections.maxima, sections.maxima,
+                                           sections.order, sections.offsets),
+            "centroid+max": sections,
+        }
+        for top_sections in args.top_sections:
+            for name, summaries in variants.items():
+                recalls, scored, latencies, fallbacks = [], [], [], 0
+                for query, exact in zip(queries, flat):
+                    started = time.perf_counter()
+                    found = hierarchical_top_k(index.embeddings, summaries, query, -1.0, args.k, top_sections,
+                                               args.min_score)
+                    if found is None:
+                        # The app falls back to flat search
+                        fallbacks += 1
+                        found = (*batch_top_k(index.embeddings, query[None, :], -1.0, args.k)[0], rows)
+                    latencies.append(time.perf_counter() - started)
+                    scored.append(found[2] + len(sections))
+                    recalls.append(len(np.intersect1d(found[0], exact)) / args.k)
+                print(f"  {f'top {top_sections} by {name}':24} scored {100 * np.mean(scored) / rows:5.1f}%  "
+                      f"{percentiles(latencies)}  recall@{args.k}={np.mean(recalls):.3f}  fallbacks={fallbacks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Report upload bytes and vision-call latency for a directory of screenshots.
+
+    python benchmarks/image_upload_report.py path/to/screenshots [--call-vision]
+
+Without --call-vision only the local prepare step is measured. With it, every image is
+described twice through app.describe_image (set API_KEY, and AIPIPE_BASE_URL to use a
+mock upstream), so the second column shows the cached path.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+
+
+async def report(directory, call_vision):
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    total_original = total_upload = 0
+    print(f"{'image':40} {'original':>10} {'upload':>10} {'prep ms':>8} {'vision s':>9} {'cached s':>9}")
+    for path in paths:
+        with open(path, "rb") as f:
+            image_base64 = base64.b64encode(f.read()).decode("ascii")
+
+        started = time.perf_counter()
+        prepared = app.prepare_image(image_base64)
+        prep_ms = (time.perf_counter() - started) * 1000
+        total_original += prepared["original_bytes"]
+        total_upload += prepared["upload_bytes"]
+
+        vision_s = cached_s = float("nan")
+        if call_vision:
+            question = "What does this screenshot show?"
+            started = time.perf_counter()
+            await app.describe_image(question, image_base64)
+            vision_s = time.perf_counter() - started
+            started = time.perf_counter()
+            await app.describe_image(question, image_base64)
+            cached_s = time.perf_counter() - started
+
+        print(f"{os.path.basename(path)[:40]:40} {prepared['original_bytes']:>10} {prepared['upload_bytes']:>10} "
+              f"{prep_ms:>8.1f} {vision_s:>9.2f} {cached_s:>9.3f}")
+
+    if paths:
+        print(f"\n{len(paths)} images: {total_original} -> {total_upload} bytes "
+              f"({100 * total_upload / total_original:.0f}% of original)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", help="Directory of screenshot fixtures")
+    parser.add_argument("--call-vision", action="store_true", help="Also time the vision model call")
+    args = parser.parse_args()
+    asyncio.run(report(args.directory, args.call_vision))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Open-loop load against /api with and without admission control.
+
+    python benchmarks/load_driver.py --rate 20 --duration 30 --capacity 16 --latency-scale 1.0
+
+Queries arrive as a Poisson process at --rate per second whether or not earlier ones have
+finished, the way real clients behave. The mock upstream serves only --capacity calls at a
+time, so a rate above what it can sustain builds a backlog. A client gives up after
+--client-timeout seconds, but the server keeps working on an abandoned query, as it would
+behind a real HTTP server.
+
+Goodput counts answers delivered within the client timeout, per second of the run.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ["AIPIPE_BASE_URL"] = "http://127.0.0.1:9102"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.mock_upstream import start_mock_upstream  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+
+
+def configure(admission, args):
+    app.admission_slots = None
+    app.admission_stats.update(in_flight=0, queued=0, shed=0, deadline_exceeded=0)
+    if admission:
+        app.MAX_IN_FLIGHT = args.max_in_flight
+        app.MAX_QUEUED = args.max_queued
+        app.REQUEST_DEADLINE_SECONDS = args.deadline
+    else:
+        # What the server did before: take everything, never give up
+        app.MAX_IN_FLIGHT = app.MAX_QUEUED = 10**9
+        app.REQUEST_DEADLINE_SECONDS = 10**9
+
+
+async def run(args):
+    rng = np.random.default_rng(args.seed)
+    outcomes = []
+    server_tasks = []
+
+    async def client(i):
+        started = time.perf_counter()
+        request = app.QueryRequest(question=f"How do I submit project {i}?")
+        task = asyncio.create_task(app.query_knowledge_base(request))
+        server_tasks.append(task)
+        done, _ = await asyncio.wait({task}, timeout=args.client_timeout)
+        elapsed = time.perf_counter() - started
+        if not done:
+            outcomes.append(("timeout", elapsed))
+        elif isinstance(task.result(), dict):
+            outcomes.append(("ok", elapsed))
+        else:
+            outcomes.append((str(task.result().status_code), elapsed))
+
+    clients = []
+    started = time.perf_counter()
+    i = 0
+    while time.perf_counter() - started < args.duration:
+        clients.append(asyncio.create_task(client(i)))
+        i += 1
+        await asyncio.sleep(rng.exponential(1 / args.rate))
+    await asyncio.gather(*clients)
+    # Let abandoned queries finish so the next run starts with an idle upstream
+    await asyncio.gather(*server_tasks, return_exceptions=True)
+    return outcomes
+
+
+def report(name, outcomes, duration):
+    kinds = {}
+    for kind, elapsed in outcomes:
+        kinds.setdefault(kind, []).append(elapsed)
+    ok = np.asarray(kinds.get("ok", [0.0]))
+    all_latencies = np.asarray([elapsed for _, elapsed in outcomes])
+    counts = "  ".join(f"{kind}={len(latencies)}" for kind, latencies in sorted(kinds.items()))
+    print(f"{name:10} goodput={len(kinds.get('ok', [])) / duration:6.2f}/s  "
+          f"ok p50={np.percentile(ok, 50):6.2f}s p99={np.percentile(ok, 99):6.2f}s  "
+          f"all p99={np.percentile(all_latencies, 99):6.2f}s  {counts}")
+    if "503" in kinds:
+        print(f"{'':10} 503 p50={np.percentile(kinds['503'], 50):6.3f}s  stats={app.admission_stats}")
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "knowledge_base.db")
+        app.collections.register(app.collections.default, db_path)
+        build_synthetic_db(db_path, n_discourse=args.chunks, n_markdown=args.chunks // 4)
+        # Random embeddings barely correlate; keep every candidate so each query reaches the LLM
+        app.SIMILARITY_THRESHOLD = -1.0
+        upstream, runner = await start_mock_upstream(port=9102, latency_scale=args.latency_scale,
+                                                     capacity=args.capacity)
+        try:
+            for name, admission in (("unbounded", False), ("admission", True)):
+                configure(admission, args)
+                outcomes = await run(args)
+                report(name, outcomes, args.duration)
+        finally:
+            await app.get_http_session().close()
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=20.0, help="Queries per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals per run")
+    parser.add_argument("--client-timeout", type=float, default=10.0)
+    parser.add_argument("--capacity", type=int, default=16, help="Upstream calls served at once")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Scale the mock upstream's latencies")
+    parser.add_argument("--chunks", type=int, default=2000, help="Discourse chunks in the synthetic corpus")
+    parser.add_argument("--max-in-flight", type=int, default=app.MAX_IN_FLIGHT)
+    parser.add_argument("--max-queued", type=int, default=app.MAX_QUEUED)
+    parser.add_argument("--deadline", type=float, default=app.REQUEST_DEADLINE_SECONDS, help="REQUEST_DEADLINE_SECONDS")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Recall@k of the local fallback embedder against the remote embedding model.
+
+    API_KEY=... python benchmarks/local_embedding_recall.py --db knowledge_base.db --k 5 10 20
+
+Needs a knowledge base embedded with the remote model and a working API key: each
+sample question is embedded remotely once, and recall@k is the share of the remote
+top k that the local embedder also puts in its top k. Questions come from the promptfoo
+config unless --questions points at a file with one question per line.
+"""
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import app  # noqa: E402
+from local_embedding import LocalEmbedder  # noqa: E402
+from vector_index import VectorIndex  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_questions(path):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    with open(os.path.join(ROOT, "project-tds-virtual-ta-promptfoo.yaml"), encoding="utf-8") as f:
+        return [match.strip() for match in re.findall(r"^\s*question:\s*(.+)$", f.read(), re.MULTILINE)]
+
+
+def top_k(similarities, k):
+    return set(np.argsort(-similarities, kind="stable")[:k].tolist())
+
+
+async def main_async(args):
+    conn = sqlite3.connect(args.db)
+    index = VectorIndex.from_db(conn)
+    started = time.perf_counter()
+    embedder = LocalEmbedder.fit(app.corpus_texts(conn, index), dim=args.dim)
+    print(f"Fitted on {len(index)} chunks in {time.perf_counter() - started:.2f}s, dim={args.dim}")
+    conn.close()
+
+    questions = load_questions(args.questions)
+    recalls = {k: [] for k in args.k}
+    encode_seconds = []
+    for question in questions:
+        remote = index.similarities(await app.get_embedding(question))
+        started = time.perf_counter()
+        local = embedder.similarities(embedder.encode(question))
+        encode_seconds.append(time.perf_counter() - started)
+        for k in args.k:
+            recalls[k].append(len(top_k(remote, k) & top_k(local, k)) / k)
+    await app.get_http_session().close()
+
+    print(f"{len(questions)} questions, local encode + scan {np.mean(encode_seconds) * 1000:.1f}ms")
+    for k in args.k:
+        print(f"recall@{k:<3} {np.mean(recalls[k]):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.path.join(ROOT, "knowledge_base.db"))
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--dim", type=int, default=app.LOCAL_EMBEDDING_DIM)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
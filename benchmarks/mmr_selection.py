@@ -0,0 +1,74 @@
+"""Latency and result quality of MMR selection vs plain top-k.
+
+    python benchmarks/mmr_selection.py --lambdas 0.5 0.7 0.9
+
+Candidates are built as clusters of near-duplicates (quoted replies, reposted answers)
+around distinct "answers". Quality is reported as distinct clusters in the top k,
+mean query similarity of the picks and mean pairwise similarity between picks.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from vector_index import mmr_select  # noqa: E402
+
+DIM = 1536
+K = 15
+
+
+def make_candidates(n, rng, cluster_size=8, noise=0.15):
+    n_clusters = max(1, n // cluster_size)
+    query = rng.standard_normal(DIM).astype(np.float32)
+    query /= np.linalg.norm(query)
+    # Cluster centres at varying relevance to the query
+    centres = rng.standard_normal((n_clusters, DIM)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    mix = rng.uniform(0.2, 0.8, (n_clusters, 1)).astype(np.float32)
+    centres = mix * query + (1 - mix) * centres
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centres[labels] + noise * rng.standard_normal((n, DIM)).astype(np.float32) / np.sqrt(DIM)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, vectors @ query, labels
+
+
+def quality(vectors, relevance, labels, picks):
+    picked = vectors[picks]
+    gram = picked @ picked.T
+    off_diagonal = gram[~np.eye(len(picks), dtype=bool)]
+    return len(set(labels[picks].tolist())), float(relevance[picks].mean()), float(off_diagonal.mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 5000])
+    parser.add_argument("--lambdas", type=float, nargs="+", default=[0.5, 0.7, 0.9])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'n':>5} {'method':>10} {'ms':>8} {'clusters':>9} {'relevance':>10} {'redundancy':>11}")
+    for n in args.sizes:
+        vectors, relevance, labels = make_candidates(n, rng)
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            picks = np.argsort(-relevance)[:K]
+        elapsed_ms = (time.perf_counter() - started) * 1000 / args.repeats
+        clusters, mean_relevance, redundancy = quality(vectors, relevance, labels, picks)
+        print(f"{n:>5} {'top-k':>10} {elapsed_ms:>8.2f} {clusters:>9} {mean_relevance:>10.3f} {redundancy:>11.3f}")
+        for lambda_mult in args.lambdas:
+            started = time.perf_counter()
+            for _ in range(args.repeats):
+                picks = mmr_select(vectors, relevance, K, lambda_mult)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / args.repeats
+            clusters, mean_relevance, redundancy = quality(vectors, relevance, labels, picks)
+            print(f"{n:>5} {f'mmr {lambda_mult}':>10} {elapsed_ms:>8.2f} {clusters:>9} "
+                  f"{mean_relevance:>10.3f} {redundancy:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
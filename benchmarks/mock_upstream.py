@@ -0,0 +1,131 @@
+"""A stand-in for the aipipe OpenAI proxy with realistic, configurable latencies.
+
+Serves /embeddings and /chat/completions. Embeddings are deterministic pseudo-random unit
+vectors derived from the input text, so the same text always embeds the same way. Run it
+standalone and point the app at it:
+
+    python benchmarks/mock_upstream.py --port 9100
+    AIPIPE_BASE_URL=http://localhost:9100 API_KEY=test uvicorn app:app
+
+or start it in-process from a benchmark with `start_mock_upstream()`.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+import numpy as np
+from aiohttp import web
+
+EMBEDDING_DIM = 1536
+
+# Median and spread (lognormal sigma) of each call's latency, in seconds
+DEFAULT_LATENCIES = {
+    "embedding": (0.25, 0.4),
+    "vision": (3.0, 0.5),
+    "chat": (2.0, 0.4),
+}
+
+
+def text_embedding(text, dim=EMBEDDING_DIM):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class MockUpstream:
+    def __init__(self, latencies=None, latency_scale=1.0, failure_rate=0.0, capacity=None,
+                 straggler_rate=0.0, seed=0):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.latency_scale = latency_scale
+        self.failure_rate = failure_rate
+        # Fraction of calls that stall for 10x their usual latency (GC pauses, a slow replica)
+        self.straggler_rate = straggler_rate
+        # Calls served at once; more wait their turn, like a saturated proxy
+        self.capacity = asyncio.Semaphore(capacity) if capacity else None
+        self.random = random.Random(seed)
+        self.calls = {kind: 0 for kind in self.latencies}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def delay(self, kind):
+        self.calls[kind] += 1
+        median, sigma = self.latencies[kind]
+        latency = self.random.lognormvariate(0, sigma) * median * self.latency_scale
+        if self.straggler_rate and self.random.random() < self.straggler_rate:
+            latency *= 10
+        if self.capacity is None:
+            await asyncio.sleep(latency)
+            return
+        async with self.capacity:
+            await asyncio.sleep(latency)
+
+    def should_fail(self):
+        return self.failure_rate and self.random.random() < self.failure_rate
+
+    async def embeddings(self, request):
+        payload = await request.json()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self.delay("embedding")
+            if self.should_fail():
+                return web.json_response({"error": "rate limited"}, status=429)
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            dim = payload.get("dimensions", EMBEDDING_DIM)
+            data = [{"index": i, "embedding": text_embedding(text, dim)} for i, text in enumerate(inputs)]
+            return web.json_response({"data": data, "model": payload.get("model")})
+        finally:
+            self.in_flight -= 1
+
+    async def chat_completions(self, request):
+        payload = await request.json()
+        content = payload["messages"][-1]["content"]
+        is_vision = isinstance(content, list) and any(part.get("type") == "image_url" for part in content)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self.delay("vision" if is_vision else "chat")
+            if self.should_fail():
+                return web.json_response({"error": "upstream unavailable"}, status=503)
+            if is_vision:
+                answer = "A terminal screenshot showing a Python traceback: ModuleNotFoundError for numpy."
+            else:
+                answer = ("Use the model named in the question.\n\nSources:\n"
+                          "1. URL: [https://discourse.onlinedegree.iitm.ac.in/t/mock/1], Text: [mock source]")
+            return web.json_response({
+                "choices": [{"message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0},
+            })
+        finally:
+            self.in_flight -= 1
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/embeddings", self.embeddings)
+        app.router.add_post("/chat/completions", self.chat_completions)
+        return app
+
+
+async def start_mock_upstream(port=9100, **kwargs):
+    """Start a mock upstream on localhost; returns (MockUpstream, aiohttp AppRunner)."""
+    upstream = MockUpstream(**kwargs)
+    runner = web.AppRunner(upstream.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return upstream, runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock aipipe upstream.")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every latency by this")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls that fail")
+    parser.add_argument("--capacity", type=int, default=None, help="Calls served concurrently; the rest queue")
+    args = parser.parse_args()
+    upstream = MockUpstream(latency_scale=args.latency_scale, failure_rate=args.failure_rate, capacity=args.capacity)
+    web.run_app(upstream.make_app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
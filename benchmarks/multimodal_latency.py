@@ -0,0 +1,102 @@
+"""End-to-end latency of image queries: serial pipeline vs speculative parallel retrieval.
+
+    python benchmarks/multimodal_latency.py --requests 50 --concurrency 5 --latency-scale 0.5
+
+Runs against an in-process mock upstream and a synthetic knowledge base, so no API key or
+network is needed. Every request carries a distinct image so the description cache never hits.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ["AIPIPE_BASE_URL"] = "http://127.0.0.1:9101"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.mock_upstream import start_mock_upstream  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+
+
+def random_screenshot(seed):
+    pixels = np.random.default_rng(seed).integers(0, 255, (360, 640, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+# The pre-speculation pipeline: vision -> combined embedding -> retrieval, strictly in series
+async def serial_request(question, image_base64):
+    conn = app.get_db_connection()
+    try:
+        try:
+            description = await app.describe_image(question, image_base64)
+            embedding = await app.get_embedding(f"{question}\nImage context: {description}")
+        except Exception:
+            embedding = await app.get_embedding(question)
+        results = await app.find_similar_content(embedding, conn)
+        enriched = await app.enrich_with_adjacent_chunks(conn, results)
+        return await app.generate_answer(question, enriched)
+    finally:
+        conn.close()
+
+
+async def speculative_request(question, image_base64):
+    return await app.query_knowledge_base(app.QueryRequest(question=question, image=image_base64))
+
+
+async def run(pipeline, requests, concurrency, seed_offset):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        image = random_screenshot(seed_offset + i)
+        async with semaphore:
+            started = time.perf_counter()
+            await pipeline(f"Why does my script fail? (request {i})", image)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return np.array(latencies)
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "knowledge_base.db")
+        app.collections.register(app.collections.default, db_path)
+        build_synthetic_db(db_path, n_discourse=args.chunks, n_markdown=args.chunks // 4)
+        # Random embeddings barely correlate; keep every candidate so retrieval does real work
+        app.SIMILARITY_THRESHOLD = -1.0
+        app.VISION_DEADLINE_SECONDS = args.deadline
+        upstream, runner = await start_mock_upstream(port=9101, latency_scale=args.latency_scale,
+                                                     failure_rate=args.failure_rate)
+        try:
+            for name, pipeline, offset in (("serial", serial_request, 0), ("speculative", speculative_request, 10**6)):
+                latencies = await run(pipeline, args.requests, args.concurrency, offset)
+                print(f"{name:12} p50={np.percentile(latencies, 50):6.2f}s  p99={np.percentile(latencies, 99):6.2f}s  "
+                      f"mean={latencies.mean():6.2f}s  n={len(latencies)}")
+        finally:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=2000, help="Discourse chunks in the synthetic corpus")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Scale the mock upstream's latencies")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--deadline", type=float, default=app.VISION_DEADLINE_SECONDS, help="VISION_DEADLINE_SECONDS")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
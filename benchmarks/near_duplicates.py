@@ -0,0 +1,101 @@
+"""Rows removed and retrieval impact of collapsing near-duplicate Discourse chunks.
+
+    python benchmarks/near_duplicates.py --min-jaccard 0.6 0.8 0.9 --k 5
+
+Chunks every post in discourse_json with both fixed-size and structure-aware chunking, finds
+near-duplicates (MinHash/LSH on word shingles, then an embedding check) and collapses them
+as the index build does. Reports rows before and after and group sizes. With every topic
+title as a query, it counts how many of the top k results were copies of a higher-ranked
+result; recall@k is measured on the promptfoo sample questions that cite a topic. The remote
+embedding model needs an API key, so the embedding check and the rankings use the local
+embedder, fitted once on the uncollapsed chunks; a collapsed row counts as relevant if
+its own or any folded chunk's URL matches an expected link.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from benchmarks.chunking_compare import (  # noqa: E402
+    fixed_chunks, load_corpus, same_source, sample_questions, structured_chunks,
+)
+from local_embedding import LocalEmbedder  # noqa: E402
+from near_duplicates import find_near_duplicates  # noqa: E402
+from vector_index import SOURCE_DISCOURSE  # noqa: E402
+
+
+def ranking_report(embedder, urls, duplicate_of, titles, questions, k):
+    kept = np.flatnonzero(duplicate_of < 0)
+    # Each kept row links to its own URL and those of the chunks folded into it
+    row_urls = {row: {urls[row]} for row in kept}
+    for row in np.flatnonzero(duplicate_of >= 0):
+        row_urls[duplicate_of[row]].add(urls[row])
+    representative = np.where(duplicate_of < 0, np.arange(len(urls)), duplicate_of)
+
+    redundant = []
+    for title in titles:
+        order = np.argsort(-embedder.similarities(embedder.encode(title)), kind="stable")
+        redundant.append(k - len(set(representative[order[:k]].tolist())))
+    ranks_before, ranks_after = [], []
+    for question, links in questions:
+        order = np.argsort(-embedder.similarities(embedder.encode(question)), kind="stable")
+        collapsed = order[duplicate_of[order] < 0]
+        ranks_before.append(next((r for r, row in enumerate(order, 1)
+                                  if any(same_source(urls[row], link) for link in links)), None))
+        ranks_after.append(next((r for r, row in enumerate(collapsed, 1)
+                                 if any(same_source(url, link) for url in row_urls[row] for link in links)), None))
+    hits_before = sum(rank is not None and rank <= k for rank in ranks_before)
+    hits_after = sum(rank is not None and rank <= k for rank in ranks_after)
+    return (f"copies in top {k}: {sum(redundant)} over {len(titles)} title queries, "
+            f"{np.count_nonzero(redundant)} queries affected  "
+            f"recall@{k} {hits_before}/{len(questions)} -> {hits_after}/{len(questions)}  "
+            f"first relevant rank {ranks_before} -> {ranks_after}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-jaccard", type=float, nargs="+", default=[0.6, 0.8, 0.9], help="DEDUP_MIN_JACCARD")
+    parser.add_argument("--min-similarity", type=float, nargs="+", default=[0.9, 0.95], help="DEDUP_MIN_SIMILARITY")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--examples", type=int, default=2, help="Largest groups to print per chunking")
+    args = parser.parse_args()
+
+    _, topics = load_corpus()
+    titles = [topic["title"] for topic in topics]
+    questions = [(question, links) for question, links in sample_questions()
+                 if any("/t/" in link for link in links)]
+    chunkings = {
+        "fixed": fixed_chunks([], topics, 1000, 200),
+        "structured": structured_chunks([], topics, None, None),
+    }
+    for name, chunks in chunkings.items():
+        urls = [url for url, _ in chunks]
+        texts = [text for _, text in chunks]
+        embedder = LocalEmbedder.fit(texts)
+        sources = np.full(len(texts), SOURCE_DISCOURSE, dtype=np.int8)
+        print(f"\n{name}: {len(texts)} chunks from {len(topics)} topics")
+        for min_similarity in args.min_similarity:
+            for min_jaccard in args.min_jaccard:
+                started = time.perf_counter()
+                # Chunks are in topic then post order, so the earliest copy becomes the representative
+                duplicate_of = find_near_duplicates(texts, embedder.embeddings, sources, np.arange(len(texts)),
+                                                    min_jaccard, min_similarity)
+                seconds = time.perf_counter() - started
+                folded = np.flatnonzero(duplicate_of >= 0)
+                sizes = Counter(Counter(duplicate_of[folded].tolist()).values())
+                print(f"  jaccard>={min_jaccard:.2f} cosine>={min_similarity:.2f}: {len(texts)} -> "
+                      f"{len(texts) - len(folded)} rows (-{100 * len(folded) / len(texts):.1f}%) in {seconds:.2f}s, "
+                      f"groups by copies folded {dict(sorted(sizes.items()))}")
+                print(f"    {ranking_report(embedder, urls, duplicate_of, titles, questions, args.k)}")
+        groups = Counter(duplicate_of[folded].tolist()).most_common(args.examples)
+        for representative, copies in groups:
+            print(f"    e.g. {copies} copies of {urls[representative]}: {texts[representative][:100]!r}")
+
+
+if __name__ == "__main__":
+    main()
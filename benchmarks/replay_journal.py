@@ -0,0 +1,165 @@
+"""Replay a request journal against the app and the mock upstream, at the original or a scaled arrival rate.
+
+    python benchmarks/replay_journal.py requests.jsonl --speed 2.0 --latency-scale 1.0
+
+The journal is what the app writes with REQUEST_JOURNAL_PATH set. Each entry is sent to
+/api in-process at its original offset from the first arrival divided by --speed, whether
+or not earlier ones have finished (open loop). Questions journaled only as a hash are
+replaced by stand-in text of the recorded length, derived from the hash, so a question
+asked twice is replayed twice identically and repeats still reach the caches; images are
+replaced by noise JPEGs of about the recorded size, one per image hash. The replay itself
+is journaled to a temporary file, and the report is read from it: latency percentiles
+overall and per stage, status codes, answer-table and image-description cache hit rates,
+and how answers were served. If the journal has latencies, they are printed alongside.
+
+The knowledge base is synthetic unless --db points at a real one; the mock upstream's
+embeddings are random per text either way, so which chunks come back says nothing, but the
+work done per request does.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ["AIPIPE_BASE_URL"] = "http://127.0.0.1:9106"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.mock_upstream import start_mock_upstream  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+from request_journal import RequestJournal, read_journal  # noqa: E402
+
+WORDS = ("how", "do", "I", "submit", "the", "project", "assignment", "deadline", "docker", "python",
+         "error", "when", "running", "graded", "score", "week", "notebook", "api", "key", "install")
+
+
+def rng_for(digest):
+    return np.random.default_rng(int.from_bytes(hashlib.sha256(digest.encode("utf-8")).digest()[:8], "big"))
+
+
+# Stand-in for a question journaled as a hash: same hash, same text, about the same length
+def stand_in_question(question_hash, chars):
+    words = rng_for(question_hash).choice(WORDS, size=max(chars // 4, 1))
+    return " ".join(words)[:max(chars, 1)]
+
+
+# Noise JPEG of about `size` bytes; noise barely compresses, so its size follows the pixel count
+def stand_in_image(image_hash, size):
+    side = int(np.clip(np.sqrt(size / 0.8), 16, 2048))
+    pixels = rng_for(image_hash).integers(0, 255, (side, side, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def build_requests(entries):
+    images = {}
+    requests = []
+    for entry in entries:
+        question = entry.get("question") or stand_in_question(entry.get("question_hash", ""), entry.get("question_chars", 40))
+        image = None
+        if entry.get("image_bytes"):
+            image_hash = entry.get("image_hash", str(len(requests)))
+            if image_hash not in images:
+                images[image_hash] = stand_in_image(image_hash, entry["image_bytes"])
+            image = images[image_hash]
+        filters = app.QueryFilters(**entry["filters"]) if entry.get("filters") else None
+        # Only the default collection is loaded for the replay
+        requests.append(app.QueryRequest(question=question, image=image, filters=filters))
+    return requests
+
+
+async def replay(entries, requests, speed):
+    first = entries[0]["ts"]
+    started = time.perf_counter()
+
+    async def send(entry, request):
+        delay = (entry["ts"] - first) / speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await app.query_knowledge_base(request)
+
+    await asyncio.gather(*(send(entry, request) for entry, request in zip(entries, requests)))
+    return time.perf_counter() - started
+
+
+def percentiles(values):
+    values = np.asarray(values) * 1000
+    return f"p50={np.percentile(values, 50):7.0f}ms p90={np.percentile(values, 90):7.0f}ms p99={np.percentile(values, 99):7.0f}ms"
+
+
+def hit_rate(entries, key, hit):
+    outcomes = Counter(entry[key] for entry in entries if key in entry)
+    total = sum(outcomes.values())
+    if not total:
+        return "n/a"
+    return f"{100 * outcomes[hit] / total:.1f}% of {total} ({dict(outcomes)})"
+
+
+def report(original, replayed, seconds):
+    print(f"replayed {len(replayed)} requests in {seconds:.1f}s "
+          f"(journal spans {original[-1]['ts'] - original[0]['ts']:.1f}s)")
+    print(f"  status: {dict(Counter(entry['status'] for entry in replayed))}")
+    print(f"  total       {percentiles([entry['seconds'] for entry in replayed])}")
+    recorded = [entry["seconds"] for entry in original if "seconds" in entry]
+    if recorded:
+        print(f"  journaled   {percentiles(recorded)}")
+    stages = sorted({stage for entry in replayed for stage in entry["stages"]})
+    for stage in stages:
+        times = [entry["stages"][stage] for entry in replayed if stage in entry["stages"]]
+        print(f"  {stage:11} {percentiles(times)}  in {len(times)} requests")
+    print(f"  answer table hits: {hit_rate(replayed, 'answer_table', 'hit')}")
+    print(f"  image description cache hits: {hit_rate(replayed, 'image_description', 'cached')}")
+    print(f"  answered by: {dict(Counter(entry.get('answer_path', 'not answered') for entry in replayed))}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("journal", help="JSONL journal written with REQUEST_JOURNAL_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Divide the original inter-arrival times by this")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N requests")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply the mock upstream's latencies")
+    parser.add_argument("--capacity", type=int, default=None, help="Upstream calls the mock serves at once")
+    parser.add_argument("--db", default=None, help="Knowledge base to replay against instead of a synthetic one")
+    parser.add_argument("--chunks", type=int, default=2000, help="Discourse chunks in the synthetic corpus")
+    args = parser.parse_args()
+
+    original = sorted(read_journal(args.journal), key=lambda entry: entry["ts"])[:args.limit]
+    if not original:
+        sys.exit(f"No requests in {args.journal}")
+    requests = build_requests(original)
+    upstream_options = {"latency_scale": args.latency_scale}
+    if args.capacity is not None:
+        upstream_options["capacity"] = args.capacity
+    upstream, runner = await start_mock_upstream(port=9106, **upstream_options)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp, "knowledge_base.db")
+            build_synthetic_db(db_path, n_discourse=args.chunks, n_markdown=args.chunks // 4)
+            # Random embeddings barely correlate; keep every candidate so each query reaches the LLM
+            app.SIMILARITY_THRESHOLD = -1.0
+        app.collections.register(app.collections.default, db_path)
+        replay_path = os.path.join(tmp, "replay.jsonl")
+        app.request_journal = RequestJournal(replay_path)
+        try:
+            seconds = await replay(original, requests, args.speed)
+        finally:
+            app.request_journal.close()
+            await app.get_http_session().close()
+            await runner.cleanup()
+        report(original, read_journal(replay_path), seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,185 @@
+"""Kill discourse_scraper.py partway through a run against a mock Discourse, then --resume it.
+
+    python benchmarks/scraper_resume.py --topics 60 --kill-after 20
+
+The mock serves a paginated category listing and topics whose posts need the extra
+posts.json batches, and injects failures: a 503 on the second listing page, a 429 on
+each seventh topic's first request, a dropped connection on each ninth topic's first
+posts batch, and a permanent 404 on each eleventh topic. The first run is SIGKILLed once
+the journal shows --kill-after finished topics. The check is that the resumed run ends
+with every topic saved as complete, valid JSON, and that it never fetches a listing page
+or a topic the journal had already recorded.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPICS_PER_PAGE = 30
+POSTS_PER_TOPIC = 25
+POSTS_IN_FIRST_RESPONSE = 20  # Discourse only embeds the first 20 posts in t/{id}.json
+
+
+class MockDiscourse(BaseHTTPRequestHandler):
+    topic_ids = []
+    requests = Counter()  # (phase, path kind, key) -> count
+    phase = "first"
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def count(self, kind, key):
+        with self.lock:
+            self.requests[(self.phase, kind, key)] += 1
+            return sum(n for (_, k, item), n in self.requests.items() if k == kind and item == key)
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def post(topic_id, number):
+        return {
+            "id": topic_id * 1000 + number,
+            "post_number": number,
+            "created_at": "2025-02-10T10:00:00.000Z",
+            "cooked": f"<p>Post {number} of topic {topic_id}</p>",
+            "username": f"user{number}",
+        }
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if url.path.startswith("/c/"):
+            page = int(parse_qs(url.query).get("page", ["0"])[0])
+            if self.count("listing", page) == 1 and page == 1:
+                return self.send_json({"errors": ["busy"]}, status=503)
+            topics = self.topic_ids[page * TOPICS_PER_PAGE:(page + 1) * TOPICS_PER_PAGE]
+            more = (page + 1) * TOPICS_PER_PAGE < len(self.topic_ids)
+            return self.send_json({"topic_list": {
+                "topics": [{"id": topic_id, "created_at": "2025-02-01T00:00:00.000Z",
+                            "last_posted_at": "2025-02-10T00:00:00.000Z"} for topic_id in topics],
+                "more_topics_url": f"/c/courses/tds-kb/34?page={page + 1}" if more else None,
+            }})
+        topic_id = int(parts[1].removesuffix(".json"))
+        if len(parts) == 2:
+            attempt = self.count("topic", topic_id)
+            if topic_id % 11 == 0:
+                return self.send_json({"errors": ["not found"]}, status=404)
+            if topic_id % 7 == 0 and attempt == 1:
+                return self.send_json({"errors": ["slow down"]}, status=429, headers={"Retry-After": "1"})
+            stream = [self.post(topic_id, n)["id"] for n in range(1, POSTS_PER_TOPIC + 1)]
+            posts = [self.post(topic_id, n) for n in range(1, POSTS_IN_FIRST_RESPONSE + 1)]
+            return self.send_json({"id": topic_id, "title": f"Topic {topic_id}",
+                                   "post_stream": {"posts": posts, "stream": stream}})
+        attempt = self.count("posts", topic_id)
+        if topic_id % 9 == 0 and attempt == 1:
+            # Drop the connection without answering
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        wanted = {int(post_id) for post_id in parse_qs(url.query).get("post_ids[]", [])}
+        posts = [self.post(topic_id, n) for n in range(1, POSTS_PER_TOPIC + 1) if topic_id * 1000 + n in wanted]
+        return self.send_json({"post_stream": {"posts": posts}})
+
+
+def read_journal(path):
+    entries = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    return entries
+
+
+def run_scraper(port, output_dir, resume, delay):
+    command = [sys.executable, os.path.join(ROOT, "discourse_scraper.py"), "--base-url", f"http://127.0.0.1:{port}/",
+               "--output-dir", output_dir, "--delay", str(delay), "--retry-wait", "0"]
+    if resume:
+        command.append("--resume")
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", type=int, default=60)
+    parser.add_argument("--kill-after", type=int, default=20, help="Finished topics before the first run is killed")
+    parser.add_argument("--delay", type=float, default=0.05, help="Scraper --delay between topics")
+    args = parser.parse_args()
+
+    MockDiscourse.topic_ids = list(range(1001, 1001 + args.topics))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockDiscourse)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        journal_path = os.path.join(output_dir, "scrape_journal.jsonl")
+        started = time.perf_counter()
+        first = run_scraper(port, output_dir, resume=False, delay=args.delay)
+        while first.poll() is None:
+            if sum(entry["event"] == "topic_done" for entry in read_journal(journal_path)) >= args.kill_after:
+                first.send_signal(signal.SIGKILL)
+                break
+            time.sleep(0.01)
+        first.wait()
+        before_kill = read_journal(journal_path)
+        done_before = {entry["topic_id"] for entry in before_kill if entry["event"] == "topic_done"}
+        pages_before = {entry["page"] for entry in before_kill if entry["event"] == "listing_page"}
+        print(f"first run killed after {time.perf_counter() - started:.1f}s: {len(done_before)} topics finished, "
+              f"listing pages journaled {sorted(pages_before)}")
+
+        MockDiscourse.phase = "resume"
+        started = time.perf_counter()
+        second = run_scraper(port, output_dir, resume=True, delay=args.delay)
+        second.wait()
+        print(f"resumed run exited {second.returncode} after {time.perf_counter() - started:.1f}s")
+        server.shutdown()
+
+        expected = {topic_id for topic_id in MockDiscourse.topic_ids if topic_id % 11 != 0}
+        saved, broken = set(), []
+        for topic_id in expected:
+            path = os.path.join(output_dir, f"topic_{topic_id}.json")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    if len(json.load(f)["post_stream"]["posts"]) == POSTS_PER_TOPIC:
+                        saved.add(topic_id)
+                    else:
+                        broken.append(topic_id)
+            except (OSError, ValueError):
+                broken.append(topic_id)
+        leftovers = [name for name in os.listdir(output_dir) if name.endswith(".tmp")]
+        refetched = sorted(topic_id for (phase, kind, topic_id) in MockDiscourse.requests
+                           if phase == "resume" and kind == "topic" and topic_id in done_before)
+        relisted = sorted(page for (phase, kind, page) in MockDiscourse.requests
+                          if phase == "resume" and kind == "listing" and page in pages_before)
+        failures = Counter(entry["reason"] for entry in read_journal(journal_path) if entry["event"] == "topic_failed")
+
+        print(f"saved {len(saved)}/{len(expected)} topics complete, broken={broken}, temp files left={leftovers}")
+        print(f"resumed run refetched finished topics={refetched}, journaled listing pages={relisted}")
+        print(f"journaled topic failures by reason: {dict(failures)}")
+        ok = saved == expected and not broken and not leftovers and not refetched and not relisted
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
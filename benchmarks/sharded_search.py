@@ -0,0 +1,77 @@
+"""Query latency of exact search vs number of shards.
+
+    python benchmarks/sharded_search.py --rows 1000000 --shards 1 2 4 8 16
+
+A 1M x 1536 float32 matrix takes about 6 GB, and the shared-memory copy needs the same
+again while it is built, so size --rows to the machine. The in-process row is one
+matrix-vector product in the parent with numpy's default BLAS threading.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from sharded_search import ShardedSearcher  # noqa: E402
+
+TOP_K = 200
+
+
+def random_matrix(rows, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 100000):
+        block = rng.standard_normal((min(100000, rows - start), dim), dtype=np.float32)
+        matrix[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return matrix
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return f"p50={np.percentile(latencies, 50):8.1f}ms  p99={np.percentile(latencies, 99):8.1f}ms"
+
+
+async def bench_sharded(searcher, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        await searcher.search(query, -1.0, TOP_K)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"Building {args.rows} x {args.dim} matrix on {os.cpu_count()} CPUs...")
+    matrix = random_matrix(args.rows, args.dim)
+    queries = random_matrix(args.queries, args.dim, seed=1)
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        scores = matrix @ query
+        np.argpartition(-scores, TOP_K)[:TOP_K]
+        latencies.append(time.perf_counter() - started)
+    print(f"{'in-process':>12}  {percentiles(latencies)}")
+
+    for n_shards in args.shards:
+        searcher = ShardedSearcher(matrix, n_shards)
+        wait(searcher.warm_up())
+        latencies = asyncio.run(bench_sharded(searcher, queries))
+        print(f"{f'{n_shards} shards':>12}  {percentiles(latencies)}")
+        searcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Build a throwaway knowledge_base.db with random embeddings for benchmarks.
+
+The schema matches the tables app.py creates. Chunks are grouped into topics/docs so that
+neighbour lookups, per-source grouping and metadata filters behave as they do on real data.
+"""
+import json
+import sqlite3
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+
+
+def build_synthetic_db(path, n_discourse=2000, n_markdown=500, dim=EMBEDDING_DIM, chunks_per_post=3, seed=0, texts=None):
+    """`texts`, if given, are cycled through as chunk contents instead of repeated filler."""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("DROP TABLE IF EXISTS discourse_chunks")
+    c.execute("DROP TABLE IF EXISTS markdown_chunks")
+    c.execute('''
+    CREATE TABLE discourse_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER,
+        topic_id INTEGER,
+        topic_title TEXT,
+        post_number INTEGER,
+        author TEXT,
+        created_at TEXT,
+        likes INTEGER,
+        chunk_index INTEGER,
+        content TEXT,
+        url TEXT,
+        embedding BLOB
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE markdown_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doc_title TEXT,
+        original_url TEXT,
+        downloaded_at TEXT,
+        chunk_index INTEGER,
+        content TEXT,
+        embedding BLOB
+    )
+    ''')
+
+    def random_unit_vectors(n):
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    vectors = random_unit_vectors(n_discourse)
+    rows = []
+    for i in range(n_discourse):
+        post_id = i // chunks_per_post
+        topic_id = 100000 + post_id // 5
+        rows.append((
+            post_id, topic_id, f"Topic {topic_id}", post_id % 5 + 1, f"user{post_id % 97}",
+            f"2025-{1 + post_id % 4:02d}-{1 + post_id % 28:02d}T10:00:00.000Z", int(rng.integers(0, 10)),
+            i % chunks_per_post, texts[i % len(texts)] if texts else f"Discourse chunk {i} of post {post_id}. " * 20,
+            f"https://discourse.onlinedegree.iitm.ac.in/t/topic/{topic_id}/{post_id % 5 + 1}",
+            json.dumps(vectors[i].tolist()),
+        ))
+    c.executemany('''
+    INSERT INTO discourse_chunks (post_id, topic_id, topic_title, post_number, author, created_at,
+                                  likes, chunk_index, content, url, embedding)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    vectors = random_unit_vectors(n_markdown)
+    rows = []
+    for i in range(n_markdown):
+        doc = i // 10
+        rows.append((
+            f"Doc {doc}", f"https://tds.s-anand.net/#/doc-{doc}", "2025-06-14T21:44:57",
+            i % 10, texts[(n_discourse + i) % len(texts)] if texts else f"Markdown chunk {i} of doc {doc}. " * 20,
+            json.dumps(vectors[i].tolist()),
+        ))
+    c.executemany('''
+    INSERT INTO markdown_chunks (doc_title, original_url, downloaded_at, chunk_index, content, embedding)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
@@ -0,0 +1,117 @@
+"""Embedding tail latency with and without hedging, and fail-fast behaviour during an outage.
+
+    python benchmarks/upstream_resilience.py --calls 400 --concurrency 8 --straggler-rate 0.03
+
+Runs get_embedding against an in-process mock upstream where a few calls straggle. The
+hedging rows compare p50/p99 and how many upstream calls were made. The outage row
+switches the mock to fail every call and reports how long callers wait once the breaker
+has opened. The fallback row then embeds a question for a collection that is already
+loaded and for one that is not, and checks both degrade to the local embedder.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("API_KEY", "benchmark")
+os.environ["AIPIPE_BASE_URL"] = "http://127.0.0.1:9103"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.mock_upstream import start_mock_upstream  # noqa: E402
+from benchmarks.synthetic_kb import build_synthetic_db  # noqa: E402
+from resilience import UpstreamEndpoint  # noqa: E402
+
+
+def reset_endpoint(hedge):
+    app.upstream_endpoints["embeddings"] = UpstreamEndpoint(
+        "embeddings", hedge=hedge, failure_threshold=app.UPSTREAM_FAILURE_THRESHOLD,
+        reset_timeout=app.UPSTREAM_RESET_SECONDS, retry_ratio=app.UPSTREAM_RETRY_RATIO,
+    )
+
+
+async def run(calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await app.get_embedding(f"question {i}")
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return np.asarray(latencies), errors
+
+
+# With the upstream down, embed a question in a loaded collection and in one never loaded; both should go local
+async def local_fallback(tmp):
+    for name in ("loaded", "unloaded"):
+        db_path = os.path.join(tmp, f"{name}.db")
+        build_synthetic_db(db_path, n_discourse=500, n_markdown=100)
+        app.collections.register(name, db_path)
+    outcomes = {}
+    for name in ("loaded", "unloaded"):
+        app.collection_name.set(name)
+        conn = app.get_db_connection()
+        try:
+            if name == "loaded":
+                app.get_vector_index(conn)
+            _, local = await app.embed_question("How do I submit the project?", conn)
+            outcomes[name] = "local" if local else "remote"
+        except Exception as e:
+            outcomes[name] = f"failed ({type(e).__name__})"
+        finally:
+            conn.close()
+    app.collection_name.set(None)
+    return outcomes
+
+
+async def main_async(args):
+    upstream, runner = await start_mock_upstream(port=9103, latency_scale=args.latency_scale,
+                                                 straggler_rate=args.straggler_rate)
+    try:
+        for name, hedge in (("no hedging", False), ("hedging", True)):
+            reset_endpoint(hedge)
+            before = upstream.calls["embedding"]
+            latencies, errors = await run(args.calls, args.concurrency)
+            stats = app.upstream_endpoints["embeddings"].snapshot()
+            print(f"{name:12} p50={np.percentile(latencies, 50) * 1000:7.1f}ms  "
+                  f"p99={np.percentile(latencies, 99) * 1000:7.1f}ms  errors={errors}  "
+                  f"upstream calls={upstream.calls['embedding'] - before}  "
+                  f"hedges={stats['hedges']} won={stats['hedge_wins']}")
+
+        upstream.failure_rate = 1.0
+        latencies, errors = await run(args.calls // 4, args.concurrency)
+        stats = app.upstream_endpoints["embeddings"].snapshot()
+        print(f"{'outage':12} p50={np.percentile(latencies, 50) * 1000:7.1f}ms  "
+              f"p99={np.percentile(latencies, 99) * 1000:7.1f}ms  errors={errors}  "
+              f"breaker={stats['state']} rejected={stats['rejected']} retries={stats['retries']}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            outcomes = await local_fallback(tmp)
+        print(f"{'fallback':12} " + "  ".join(f"{name}={outcome}" for name, outcome in outcomes.items()))
+    finally:
+        await app.get_http_session().close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Scale the mock upstream's latencies")
+    parser.add_argument("--straggler-rate", type=float, default=0.03, help="Fraction of calls that take 10x longer")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zlib with a preset dictionary is the stdlib fallback
+    zstandard = None
+
+# What a corrupt, truncated or older-format store fails with when it is opened
+UNREADABLE_ERRORS = (sqlite3.Error, KeyError, TypeError, ValueError) + ((zstandard.ZstdError,) if zstandard else ())
+
+logger = logging.getLogger(__name__)
+
+
+ZSTD_DICTIONARY_SIZE = 64 * 1024
+ZLIB_DICTIONARY_SIZE = 32 * 1024  # zlib only looks back 32 KB, so a bigger preset dictionary is wasted
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 9
+
+
+class ChunkStore:
+    """Chunk text, compressed one chunk at a time with a dictionary trained on the corpus,
+    in a sidecar SQLite file next to the knowledge base.
+
+    Rows are keyed by (source, chunk id) and indexed by (source, group key, chunk index),
+    so a request fetches and decompresses only its top results and their neighbours, never
+    a whole table. The group key is the post id for discourse chunks and the document title
+    for markdown chunks. Uses zstd when the zstandard package is installed, zlib otherwise.
+    Reads may come from several threads (batch retrieval runs off the event loop), so they
+    take turns on the one connection and decompressor.
+    """
+
+    def __init__(self, conn, codec, dictionary):
+        self.conn = conn
+        self.codec = codec
+        if codec == "zstd":
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+            self.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        self.dictionary = dictionary
+        self.bytes_read = 0
+        self.lock = threading.Lock()
+
+    def compress(self, text):
+        data = text.encode("utf-8")
+        if self.codec == "zstd":
+            return self.compressor.compress(data)
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=self.dictionary) if self.dictionary else zlib.compressobj(ZLIB_LEVEL)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, body):
+        self.bytes_read += len(body)
+        if self.codec == "zstd":
+            return self.decompressor.decompress(body).decode("utf-8")
+        decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+        return (decompressor.decompress(body) + decompressor.flush()).decode("utf-8")
+
+    @staticmethod
+    def train_dictionary(codec, texts):
+        samples = [text.encode("utf-8") for text in texts if text]
+        if codec == "zstd":
+            try:
+                return zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, samples).as_bytes()
+            except zstandard.ZstdError as e:
+                # Too few samples to train on; compress without a dictionary
+                logger.warning(f"Could not train a zstd dictionary: {e}")
+                return b""
+        # zlib favours the end of its dictionary, so put an even spread of chunks there
+        step = max(1, len(samples) // 256)
+        return b"".join(samples[::step])[-ZLIB_DICTIONARY_SIZE:]
+
+    @classmethod
+    def build(cls, path, rows, signature):
+        """Write a fresh store from (source, chunk id, group key, chunk index, text) rows."""
+        started = time.perf_counter()
+        rows = list(rows)
+        codec = "zstd" if zstandard is not None else "zlib"
+        dictionary = cls.train_dictionary(codec, [row[4] for row in rows])
+
+        # Build into a temp file and rename, so a crash never leaves a half-written store
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+        conn = sqlite3.connect(f"{path}.tmp")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value BLOB)")
+        conn.execute('''
+        CREATE TABLE chunks (
+            source INTEGER,
+            chunk_id INTEGER,
+            group_key TEXT,
+            chunk_index INTEGER,
+            body BLOB,
+            PRIMARY KEY (source, chunk_id)
+        )
+        ''')
+        store = cls(conn, codec, dictionary)
+        conn.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+            ((source, chunk_id, str(group_key), chunk_index, store.compress(text or ""))
+             for source, chunk_id, group_key, chunk_index, text in rows),
+        )
+        conn.execute("CREATE INDEX chunks_by_position ON chunks (source, group_key, chunk_index)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("codec", codec), ("dictionary", dictionary), ("signature", json.dumps(list(signature))),
+        ])
+        conn.commit()
+        conn.close()
+        os.replace(f"{path}.tmp", path)
+        logger.info(f"Built {codec} chunk store with {len(rows)} chunks in {time.perf_counter() - started:.2f}s")
+        return cls.open(path, signature)
+
+    @classmethod
+    def open(cls, path, signature):
+        """Open a store, or return None if it is missing or was built from another database state.
+
+        Raises ValueError if the file is there but can't be read as a store.
+        """
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            if json.loads(meta["signature"]) != list(signature) or (meta["codec"] == "zstd" and zstandard is None):
+                conn.close()
+                return None
+            return cls(conn, meta["codec"], meta["dictionary"])
+        except UNREADABLE_ERRORS as e:
+            conn.close()
+            raise ValueError(f"Unreadable chunk store {path}: {e}") from e
+
+    def texts(self, keys):
+        """Text of each (source, chunk id) key found, as a dict."""
+        texts = {}
+        for source in {source for source, _ in keys}:
+            ids = [chunk_id for key_source, chunk_id in keys if key_source == source]
+            with self.lock:
+                cursor = self.conn.execute(
+                    f"SELECT chunk_id, body FROM chunks WHERE source = ? AND chunk_id IN ({','.join('?' * len(ids))})",
+                    [source, *ids],
+                )
+                texts.update(((source, chunk_id), self.decompress(body)) for chunk_id, body in cursor)
+        return texts
+
+    def neighbours(self, source, group_key, chunk_indexes):
+        """Text of the given chunk indexes of one post or document, as {chunk_index: text}."""
+        with self.lock:
+            cursor = self.conn.execute(
+                f"SELECT chunk_index, body FROM chunks WHERE source = ? AND group_key = ? "
+                f"AND chunk_index IN ({','.join('?' * len(chunk_indexes))})",
+                [source, str(group_key), *chunk_indexes],
+            )
+            return {chunk_index: self.decompress(body) for chunk_index, body in cursor}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,220 @@
+import os
+import re
+
+from bs4 import BeautifulSoup, NavigableString
+
+from context_packer import count_tokens, truncate_to_tokens
+
+
+# Constants
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 350))  # Target size of a chunk, heading path included
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 50))  # Prose carried into the next chunk of a section
+CHUNK_MIN_TOKENS = 80  # Chunks smaller than this absorb the next section instead of ending at its heading
+MAX_CODE_BLOCK_TOKENS = 4 * CHUNK_MAX_TOKENS  # Code blocks are kept whole up to this size, then split by lines
+
+ATX_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+SETEXT_UNDERLINE = re.compile(r"^(=+|-+)\s*$")
+FENCE = re.compile(r"^\s*(`{3,}|~{3,})")
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def block(text, kind, path=()):
+    return {"text": text, "kind": kind, "path": tuple(path)}
+
+
+# Split the YAML-ish front matter the website scraper writes from the markdown body
+def split_front_matter(text):
+    match = re.match(r"^---\n(.*?)\n---\n", text, re.DOTALL)
+    if not match:
+        return {}, text
+    meta = {}
+    for line in match.group(1).splitlines():
+        key, _, value = line.partition(":")
+        meta[key.strip()] = value.strip().strip('"')
+    return meta, text[match.end():]
+
+
+def heading_text(text):
+    return MARKDOWN_LINK.sub(r"\1", text).strip()
+
+
+# Markdown body -> heading, code and prose blocks, each tagged with its heading path
+def markdown_blocks(text):
+    blocks, path, paragraph = [], [], []
+    lines = text.splitlines()
+
+    def flush():
+        if paragraph and any(line.strip() for line in paragraph):
+            blocks.append(block("\n".join(paragraph).strip(), "prose", [title for _, title in path]))
+        paragraph.clear()
+
+    def open_heading(level, title):
+        flush()
+        while path and path[-1][0] >= level:
+            path.pop()
+        path.append((level, title))
+        blocks.append(block(f"{'#' * level} {title}", "heading", [title for _, title in path]))
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        fence = FENCE.match(line)
+        if fence:
+            # Everything up to the matching closing fence is one code block
+            flush()
+            marker = fence.group(1)
+            end = i + 1
+            while end < len(lines) and not lines[end].strip().startswith(marker):
+                end += 1
+            blocks.append(block("\n".join(lines[i:end + 1]), "code", [title for _, title in path]))
+            i = end + 1
+            continue
+        atx = ATX_HEADING.match(line)
+        if atx:
+            open_heading(len(atx.group(1)), heading_text(atx.group(2)))
+        elif (line.strip() and i + 1 < len(lines) and SETEXT_UNDERLINE.match(lines[i + 1])
+              and not paragraph):
+            open_heading(1 if lines[i + 1].strip().startswith("=") else 2, heading_text(line))
+            i += 1
+        elif not line.strip():
+            flush()
+        else:
+            paragraph.append(line)
+        i += 1
+    flush()
+    return blocks
+
+
+# Discourse cooked HTML -> quote, code and prose blocks
+def discourse_blocks(cooked, topic_id=None, indexed_posts=()):
+    """Quotes of a post in `indexed_posts` ((topic_id, post_number) pairs) are reduced to a
+    one-line reference, since that post's text is already a chunk of its own."""
+    soup = BeautifulSoup(cooked or "", "html.parser")
+    blocks = []
+    for element in soup.children:
+        if isinstance(element, NavigableString):
+            # Text sitting directly in the root, outside any element
+            if element.strip():
+                blocks.append(block(element.strip(), "prose"))
+        elif element.name == "aside" and "quote" in (element.get("class") or []):
+            quoted_topic = int(element.get("data-topic") or topic_id or 0)
+            quoted_post = int(element.get("data-post") or 0)
+            if (quoted_topic, quoted_post) in indexed_posts:
+                username = element.get("data-username")
+                blocks.append(block(f"(Replying to {f'@{username}, ' if username else ''}post {quoted_post})", "quote"))
+                continue
+            quote = element.find("blockquote")
+            text = (quote or element).get_text("\n", strip=True)
+            blocks.append(block("\n".join(f"> {line}" for line in text.splitlines()), "quote"))
+        elif element.name == "pre":
+            code_tag = element.find("code")
+            language = ""
+            if code_tag is not None:
+                language = next((c[5:] for c in code_tag.get("class") or [] if c.startswith("lang-")), "")
+            fence_language = "" if language in ("auto", "plaintext") else language
+            blocks.append(block(f"```{fence_language}\n{element.get_text().rstrip()}\n```", "code"))
+        else:
+            text = element.get_text("\n" if element.name in ("ul", "ol") else " ", strip=True)
+            if text:
+                blocks.append(block(text, "prose"))
+    return blocks
+
+
+# Break a block bigger than max_tokens: prose by sentence, code by line
+def split_block(item, max_tokens):
+    if item["kind"] == "code":
+        if count_tokens(item["text"]) <= MAX_CODE_BLOCK_TOKENS:
+            return [item]
+        units, joiner = item["text"].split("\n"), "\n"
+    else:
+        units, joiner = SENTENCE_END.split(item["text"]), " "
+    pieces, current = [], []
+    for unit in units:
+        while count_tokens(unit) > max_tokens:
+            head = truncate_to_tokens(unit, max_tokens)
+            pieces.append(head)
+            unit = unit[len(head):].lstrip()
+        if current and count_tokens(joiner.join(current + [unit])) > max_tokens:
+            pieces.append(joiner.join(current))
+            current = []
+        current.append(unit)
+    if current:
+        pieces.append(joiner.join(current))
+    if item["kind"] == "code":
+        # Each piece of a long code block stays a fenced block of its own
+        pieces = [piece if piece.lstrip().startswith(("```", "~~~")) else f"```\n{piece}" for piece in pieces]
+        pieces = [piece if piece.rstrip().endswith(("```", "~~~")) else f"{piece}\n```" for piece in pieces]
+    return [dict(item, text=piece) for piece in pieces if piece.strip()]
+
+
+def chunk_blocks(blocks, max_tokens=None, overlap_tokens=None, prefix_path=()):
+    """Pack blocks into chunks of about max_tokens.
+
+    A chunk ends at a top-level heading once it has CHUNK_MIN_TOKENS, and starts with its
+    heading path ("Doc > Section > Subsection") so it reads on its own. When a section
+    continues into the next chunk, up to overlap_tokens of its trailing prose is repeated.
+    Code blocks are never split below MAX_CODE_BLOCK_TOKENS.
+    """
+    max_tokens = CHUNK_MAX_TOKENS if max_tokens is None else max_tokens
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    chunks, current, current_tokens = [], [], 0
+
+    def full_path(path):
+        # The page title usually comes back as the first heading; don't repeat it
+        parts = [*prefix_path, *path]
+        return [part for i, part in enumerate(parts) if i == 0 or part != parts[i - 1]]
+
+    def header(path):
+        return " > ".join(full_path(path))
+
+    def emit():
+        body = [item for item in current if item["kind"] != "heading" or item is not current[0]]
+        if not any(item["kind"] != "heading" for item in body):
+            return
+        path = current[0]["path"]
+        text = "\n\n".join(item["text"] for item in body)
+        title = header(path)
+        chunks.append({"text": f"{title}\n\n{text}" if title else text, "path": full_path(path)})
+
+    def overlap_from(items):
+        carried, tokens = [], 0
+        for item in reversed(items):
+            if item["kind"] != "prose":
+                break
+            tokens += count_tokens(item["text"])
+            if tokens > overlap_tokens:
+                break
+            carried.insert(0, item)
+        return carried
+
+    for item in (piece for b in blocks for piece in split_block(b, max_tokens)):
+        tokens = count_tokens(item["text"])
+        starts_section = item["kind"] == "heading" and len(item["path"]) <= 2
+        if current and (current_tokens + tokens > max_tokens or (starts_section and current_tokens >= CHUNK_MIN_TOKENS)):
+            emit()
+            same_section = not starts_section and item["path"] == current[-1]["path"]
+            current = overlap_from(current) if same_section else []
+            current_tokens = sum(count_tokens(c["text"]) for c in current)
+            if current and current_tokens + tokens > max_tokens:
+                current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens + count_tokens(header(item["path"])) * (len(current) == 1)
+    if current:
+        emit()
+    for i, chunk in enumerate(chunks):
+        chunk["chunk_index"] = i
+    return chunks
+
+
+def chunk_markdown(text, max_tokens=None, overlap_tokens=None):
+    """Chunks of a scraped course page, headed by the page title: returns (front matter dict, chunks)."""
+    meta, body = split_front_matter(text)
+    prefix = (meta["title"],) if meta.get("title") else ()
+    return meta, chunk_blocks(markdown_blocks(body), max_tokens, overlap_tokens, prefix)
+
+
+def chunk_discourse_post(cooked, topic_title=None, topic_id=None, indexed_posts=(), max_tokens=None, overlap_tokens=None):
+    """Chunks of one post's cooked HTML, headed by the topic title."""
+    prefix = (topic_title,) if topic_title else ()
+    return chunk_blocks(discourse_blocks(cooked, topic_id, indexed_posts), max_tokens, overlap_tokens, prefix)
@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+import hashlib
+
+logger = logging.getLogger(__name__)
+
+
+# Constants
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 4000))  # Tokens of context sent to the LLM
+TOKENIZER_ENCODING = "o200k_base"  # gpt-4o-mini's encoding
+MIN_TRUNCATED_SPAN_TOKENS = 80  # Don't bother packing a truncated span smaller than this
+MAX_CHUNK_OVERLAP_CHARS = 1000  # Longest chunk overlap we look for when stitching neighbours
+
+
+_encoding = None
+_encoding_failed = False
+
+
+# Load the tokenizer once; fall back to a word/punctuation estimate if it isn't available offline
+def get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning(f"Tokenizer {TOKENIZER_ENCODING} unavailable, estimating token counts instead: {e}")
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    matches = list(re.finditer(r"\w+|[^\w\s]", text))
+    return text if len(matches) <= max_tokens else text[:matches[max_tokens].start()]
+
+
+# Join two consecutive chunks, dropping text the chunker repeated at the boundary
+def stitch_chunks(first, second):
+    max_overlap = min(len(first), len(second), MAX_CHUNK_OVERLAP_CHARS)
+    for size in range(max_overlap, 20, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+def source_key(result):
+    if result["source"] == "discourse":
+        return f"discourse_{result['post_id']}"
+    return f"markdown_{result['title']}"
+
+
+# Merge the retrieved chunks (and their neighbours) of each post/doc into contiguous spans
+def build_spans(results):
+    groups = {}
+    for rank, result in enumerate(results):
+        key = source_key(result)
+        group = groups.setdefault(key, {"result": result, "chunks": {}, "relevance": {}})
+        chunks = result.get("chunks") or {result["chunk_index"]: result["content"]}
+        for index, content in chunks.items():
+            group["chunks"].setdefault(index, content)
+            # A neighbour inherits the relevance of the hit that pulled it in
+            group["relevance"].setdefault(index, (result["similarity"], -rank))
+
+    spans = []
+    for group in groups.values():
+        indices = sorted(group["chunks"])
+        run = [indices[0]]
+        for index in indices[1:] + [None]:
+            if index is not None and index == run[-1] + 1:
+                run.append(index)
+                continue
+            text = group["chunks"][run[0]]
+            for i in run[1:]:
+                text = stitch_chunks(text, group["chunks"][i])
+            spans.append({
+                "result": group["result"],
+                "text": text,
+                "relevance": max(group["relevance"][i] for i in run),
+            })
+            if index is not None:
+                run = [index]
+    spans.sort(key=lambda span: span["relevance"], reverse=True)
+    return spans
+
+
+# Drop paragraphs already packed from another span (quoted replies, reposted answers)
+def remove_seen_paragraphs(text, seen):
+    kept = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        normalized = re.sub(r"\s+", " ", paragraph).strip().lower()
+        if not normalized:
+            continue
+        digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        kept.append(paragraph.strip())
+    return "\n\n".join(kept)
+
+
+# Pack the most relevant spans into the prompt context without exceeding the token budget
+def pack_context(results, token_budget=None):
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    seen_paragraphs = set()
+    blocks = []
+    used_tokens = 0
+    for span in build_spans(results):
+        text = remove_seen_paragraphs(span["text"], seen_paragraphs)
+        if not text:
+            continue
+        result = span["result"]
+        source_type = "Discourse post" if result["source"] == "discourse" else "Documentation"
+        urls = ", ".join([result["url"], *result.get("duplicate_urls", [])])
+        header = f"\n\n{source_type} (URL: {urls}):\n"
+        header_tokens = count_tokens(header)
+        text_tokens = count_tokens(text)
+        remaining = token_budget - used_tokens - header_tokens
+        if text_tokens > remaining:
+            if remaining >= MIN_TRUNCATED_SPAN_TOKENS:
+                blocks.append(header + truncate_to_tokens(text, remaining))
+                used_tokens += header_tokens + remaining
+            break
+        blocks.append(header + text)
+        used_tokens += header_tokens + text_tokens
+    return "".join(blocks), used_tokens
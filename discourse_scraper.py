@@ -1,6 +1,8 @@
+import argparse
 import requests
 import os
 import json
+import random
 import time
 from datetime import datetime, timezone
 from urllib.parse import urljoin
@@ -25,9 +27,79 @@ RAW_COOKIE_STRING = "_forum_session=PsRhrEwAr994SGsUvB%2F6C4tIq76hTZQTWZbO0nL1Da
 OUTPUT_DIR = "discourse_json"
 POST_ID_BATCH_SIZE = 50
 MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS = 5
+JOURNAL_FILE = "scrape_journal.jsonl"  # Kept in the output directory; lets an interrupted run --resume
+REQUEST_DELAY = 1.0  # Seconds between topics, to stay under the rate limit
+MAX_ATTEMPTS = 4  # Per request, for transient failures (429, 5xx, network)
+RETRY_BASE_DELAY = 2.0  # Backoff doubles from this after each failed attempt
+RETRY_MAX_DELAY = 60.0
 
 # ====================================
 
+class FetchError(Exception):
+    """A failed request. `reason` is the HTTP status ("403", "404", "429", "503", ...),
+    "network" or "json"; `transient` says whether trying again later may succeed."""
+
+    def __init__(self, reason, transient, detail="", retry_after=None):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.transient = transient
+        self.retry_after = retry_after
+
+
+class ScrapeJournal:
+    """Append-only JSON-lines record of a scrape: listing pages read, topics finished, and
+    failures with their reason.
+
+    Every entry is flushed and fsynced before the scraper moves on, so after a crash the
+    journal says exactly what was done. A torn last line, from dying mid-write, is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"Ignoring a torn journal line: {line[:80]!r}")
+
+    def reset(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        open(self.path, "w", encoding="utf-8").close()
+        self.entries = []
+
+    def append(self, event, **fields):
+        entry = {"event": event, "at": datetime.now(timezone.utc).isoformat(), **fields}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries.append(entry)
+
+    def listing_state(self):
+        """(last page read or None, topic ids so far, stale page count, whether the listing finished)."""
+        page, topic_ids, stale, done = None, [], 0, False
+        for entry in self.entries:
+            if entry["event"] == "listing_page":
+                page, stale = entry["page"], entry["stale"]
+                topic_ids.extend(entry["topic_ids"])
+            elif entry["event"] == "listing_done":
+                done = True
+        return page, topic_ids, stale, done
+
+    def finished_topics(self):
+        """{topic_id: outcome} for topics that need no more work: saved, skipped, or failed for good."""
+        finished = {}
+        for entry in self.entries:
+            if entry["event"] == "topic_done":
+                finished[entry["topic_id"]] = entry["status"]
+            elif entry["event"] == "topic_failed" and not entry["transient"] and entry["final"]:
+                finished[entry["topic_id"]] = f"failed ({entry['reason']})"
+        return finished
+
+
 def parse_cookie_string(raw_cookie_string):
     """Parses a raw cookie string into a dictionary."""
     cookies = {}
@@ -41,8 +113,53 @@ def parse_cookie_string(raw_cookie_string):
     return cookies
 
 
-def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date_str, cookies):
-    """Fetches topic IDs from a specific category within a date range."""
+def fetch_json(url, cookies, params=None, timeout=30):
+    """GET a JSON document, raising FetchError with the failure's reason."""
+    try:
+        response = requests.get(url, params=params, cookies=cookies, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        raise FetchError("network", True, str(e))
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After")
+        raise FetchError("429", True, "rate limited",
+                         float(retry_after) if retry_after and retry_after.isdigit() else None)
+    if response.status_code >= 500:
+        raise FetchError(str(response.status_code), True, "server error")
+    if response.status_code >= 400:
+        raise FetchError(str(response.status_code), False, response.reason or "")
+    try:
+        return response.json()
+    except ValueError:
+        # Usually an error page from a proxy in front of Discourse; worth another try
+        raise FetchError("json", True, f"not JSON: {response.text[:200]}")
+
+
+def with_retries(action, max_attempts, on_failure):
+    """Run `action`, retrying transient FetchErrors with exponential backoff and jitter.
+
+    `on_failure(error, attempt, final)` is called for every failed attempt; the last
+    error is re-raised once attempts run out or the failure is permanent.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return action()
+        except FetchError as e:
+            final = not e.transient or attempt == max_attempts
+            on_failure(e, attempt, final)
+            if final:
+                raise
+            delay = e.retry_after or min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            print(f"  Retrying in {delay:.1f}s (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(delay)
+
+
+def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date_str, cookies,
+                  journal=None, max_attempts=MAX_ATTEMPTS):
+    """Fetches topic IDs from a specific category within a date range.
+
+    With a journal, each page read is recorded and the listing carries on from the last
+    recorded page; a finished listing is not fetched again.
+    """
     url = urljoin(base_url, f"c/{category_slug}/{category_id}.json")
     topic_ids = []
     page = 0
@@ -52,33 +169,49 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
     end_dt_naive = datetime.fromisoformat(end_date_str + "T23:59:59.999999")
     end_dt = end_dt_naive.replace(tzinfo=timezone.utc)
 
+    consecutive_pages_with_no_new_unique_topics = 0
+
+    if journal is not None:
+        last_page, journaled_ids, stale, done = journal.listing_state()
+        if done:
+            print(f"Category listing already finished in the journal: {len(set(journaled_ids))} topics.")
+            return list(dict.fromkeys(journaled_ids))
+        if last_page is not None:
+            page, topic_ids, consecutive_pages_with_no_new_unique_topics = last_page + 1, journaled_ids, stale
+            print(f"Resuming category listing at page {page} with {len(set(topic_ids))} topics already found.")
+
     print(f"Fetching topic IDs from category between {start_dt} and {end_dt}...")
 
-    consecutive_pages_with_no_new_unique_topics = 0
-    last_known_unique_topic_count = 0
+    last_known_unique_topic_count = len(set(topic_ids))
+
+    def finish(reason):
+        print(reason)
+        if journal is not None:
+            journal.append("listing_done", reason=reason)
 
     while True:
         paginated_url = f"{url}?page={page}"
-        try:
-            response = requests.get(paginated_url, cookies=cookies, timeout=30)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to fetch page {page}: {e}")
-            break
+
+        def record_failure(error, attempt, final):
+            print(f"Failed to fetch page {page}: {error}")
+            if journal is not None:
+                journal.append("listing_failed", page=page, reason=error.reason, transient=error.transient,
+                               attempt=attempt, final=final)
 
         try:
-            data = response.json()
-        except json.JSONDecodeError:
-            print(f"Failed to decode JSON from page {page}. Content: {response.text[:200]}...")
+            data = with_retries(lambda: fetch_json(paginated_url, cookies), max_attempts, record_failure)
+        except FetchError:
+            # Not journaled as done, so --resume picks the listing up at this page
+            print(f"Giving up on the category listing at page {page}; continuing with the topics found so far.")
             break
 
         topics_on_page = data.get("topic_list", {}).get("topics", [])
 
         if not topics_on_page:
-            print(f"No more topics found on page {page} (API returned empty list).")
+            finish(f"No more topics found on page {page} (API returned empty list).")
             break
 
-        count_before_processing_page = len(set(topic_ids))
+        included_on_page = []
 
         for topic in topics_on_page:
             # Check both creation date and last activity date
@@ -107,8 +240,9 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
                     print(f"Warning: Could not parse last_posted_at date '{last_posted_at_str}' for topic ID {topic.get('id')}")
             
             if topic_should_be_included:
-                topic_ids.append(topic["id"])
+                included_on_page.append(topic["id"])
 
+        topic_ids.extend(included_on_page)
         current_unique_topic_count = len(set(topic_ids))
 
         if current_unique_topic_count == last_known_unique_topic_count and topics_on_page:
@@ -118,20 +252,23 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
             consecutive_pages_with_no_new_unique_topics = 0
 
         last_known_unique_topic_count = current_unique_topic_count
+        if journal is not None:
+            journal.append("listing_page", page=page, topic_ids=included_on_page,
+                           stale=consecutive_pages_with_no_new_unique_topics)
 
         if consecutive_pages_with_no_new_unique_topics >= MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS:
-            print(f"No new unique topics found for {MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS} consecutive pages. Assuming end of relevant category listing.")
+            finish(f"No new unique topics found for {MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS} consecutive pages. Assuming end of relevant category listing.")
             break
 
         more_topics_url = data.get("topic_list", {}).get("more_topics_url")
         if not more_topics_url:
-            print(f"No 'more_topics_url' indicated on page {page}. Assuming this is the last page of topics.")
+            finish(f"No 'more_topics_url' indicated on page {page}. Assuming this is the last page of topics.")
             break
         
         print(f"Fetched page {page}, {len(topics_on_page)} topics on page. Total unique topics found so far: {current_unique_topic_count}. Continuing...")
         page += 1
 
-    final_unique_topic_ids = list(set(topic_ids))
+    final_unique_topic_ids = list(dict.fromkeys(topic_ids))
     print(f"Total unique topics found in timeframe: {len(final_unique_topic_ids)}")
     return final_unique_topic_ids
 
@@ -195,39 +332,34 @@ def filter_posts_by_date_range(topic_data, start_date_str, end_date_str):
 
 
 def get_full_topic_json(base_url, topic_id, cookies):
-    """Fetches the full topic JSON, including all posts by handling pagination."""
+    """Fetches the full topic JSON, including all posts by handling pagination.
+
+    Raises FetchError if the topic or any batch of its posts cannot be fetched, rather
+    than returning a topic with posts missing.
+    """
     initial_topic_url = urljoin(base_url, f"t/{topic_id}.json")
     print(f"Fetching initial data for topic {topic_id}")
 
     try:
-        response = requests.get(initial_topic_url, cookies=cookies, timeout=30)
-        
+        topic_data = fetch_json(initial_topic_url, cookies)
+    except FetchError as e:
         # Add detailed error logging
-        if response.status_code == 403:
+        if e.reason == "403":
             print(f"✗ Topic {topic_id}: Access forbidden (403) - topic may be private or restricted")
-            return None
-        elif response.status_code == 404:
+        elif e.reason == "404":
             print(f"✗ Topic {topic_id}: Not found (404) - topic may have been deleted")
-            return None
-        elif response.status_code == 429:
+        elif e.reason == "429":
             print(f"✗ Topic {topic_id}: Rate limited (429) - too many requests")
-            return None
-        
-        response.raise_for_status()
-        topic_data = response.json()
-        
-    except requests.exceptions.RequestException as e:
-        print(f"✗ Topic {topic_id}: Network error - {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"✗ Topic {topic_id}: JSON decode error - {e}")
-        print(f"Response content: {response.text[:200]}...")
-        return None
+        elif e.reason == "network":
+            print(f"✗ Topic {topic_id}: Network error - {e}")
+        else:
+            print(f"✗ Topic {topic_id}: {e}")
+        raise
 
     post_stream = topic_data.get("post_stream")
     if not post_stream or "stream" not in post_stream or "posts" not in post_stream:
         print(f"✗ Topic {topic_id}: Invalid post_stream structure")
-        return None
+        raise FetchError("invalid", False, "no post_stream in the topic JSON")
 
     all_post_ids_in_stream = post_stream.get("stream", [])
     loaded_post_ids = {post["id"] for post in post_stream.get("posts", [])}
@@ -247,23 +379,19 @@ def get_full_topic_json(base_url, topic_id, cookies):
             print(f"Fetching batch of {len(batch_ids)} posts for topic {topic_id}")
 
             try:
-                batch_response = requests.get(posts_url, params=query_params, cookies=cookies, timeout=60)
-                batch_response.raise_for_status()
-                batch_data = batch_response.json()
-
-                if isinstance(batch_data, list):
-                    fetched_additional_posts.extend(batch_data)
-                elif "post_stream" in batch_data and "posts" in batch_data["post_stream"]:
-                    fetched_additional_posts.extend(batch_data["post_stream"]["posts"])
-                elif "posts" in batch_data and isinstance(batch_data["posts"], list):
-                    fetched_additional_posts.extend(batch_data["posts"])
-                else:
-                    print(f"Warning: Unexpected JSON structure for post batch in topic {topic_id}.")
-
-            except requests.exceptions.RequestException as e:
+                batch_data = fetch_json(posts_url, cookies, params=query_params, timeout=60)
+            except FetchError as e:
                 print(f"Failed to fetch post batch for topic {topic_id}: {e}")
-            except json.JSONDecodeError:
-                print(f"Failed to decode JSON for post batch in topic {topic_id}.")
+                raise
+
+            if isinstance(batch_data, list):
+                fetched_additional_posts.extend(batch_data)
+            elif "post_stream" in batch_data and "posts" in batch_data["post_stream"]:
+                fetched_additional_posts.extend(batch_data["post_stream"]["posts"])
+            elif "posts" in batch_data and isinstance(batch_data["posts"], list):
+                fetched_additional_posts.extend(batch_data["posts"])
+            else:
+                print(f"Warning: Unexpected JSON structure for post batch in topic {topic_id}.")
 
         if fetched_additional_posts:
             existing_posts_in_topic_data = {post['id']: post for post in topic_data["post_stream"]["posts"]}
@@ -284,103 +412,180 @@ def get_full_topic_json(base_url, topic_id, cookies):
 
 
 def save_topic_json(topic_id, json_data, output_dir):
-    """Saves the topic JSON data to a file."""
+    """Saves the topic JSON data to a file.
+
+    Writes a temp file and renames it over the target, so a crash leaves either the old
+    file or the new one, never a truncated one.
+    """
     os.makedirs(output_dir, exist_ok=True)
     filepath = os.path.join(output_dir, f"topic_{topic_id}.json")
-    try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
-    except IOError as e:
-        print(f"Error saving topic {topic_id} to {filepath}: {e}")
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(json_data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, filepath)
 
 
-def test_single_topic(topic_id):
+def test_single_topic(topic_id, base_url=DISCOURSE_BASE_URL):
     """Test downloading a single topic for debugging."""
     cookies = parse_cookie_string(RAW_COOKIE_STRING)
-    topic_data = get_full_topic_json(DISCOURSE_BASE_URL, topic_id, cookies)
-    
-    if topic_data:
-        print(f"✓ Successfully fetched topic {topic_id}")
-        if has_posts_in_date_range(topic_data, POST_START_DATE, POST_END_DATE):
-            print(f"✓ Topic {topic_id} has posts in date range")
+    try:
+        topic_data = get_full_topic_json(base_url, topic_id, cookies)
+    except FetchError:
+        print(f"✗ Failed to fetch topic {topic_id}")
+        return
+
+    print(f"✓ Successfully fetched topic {topic_id}")
+    if has_posts_in_date_range(topic_data, POST_START_DATE, POST_END_DATE):
+        print(f"✓ Topic {topic_id} has posts in date range")
+    else:
+        print(f"✗ Topic {topic_id} has no posts in date range")
+
+
+def process_topic(base_url, topic_id, cookies, output_dir, journal, max_attempts):
+    """Download, filter and save one topic, journaling the outcome.
+
+    Returns "saved", "skipped", "failed" for a permanent failure, or "retry" when the
+    attempts ran out on transient errors.
+    """
+
+    def record_failure(error, attempt, final):
+        journal.append("topic_failed", topic_id=topic_id, reason=error.reason, transient=error.transient,
+                       attempt=attempt, final=final, detail=str(error)[:200])
+
+    try:
+        topic_json_data = with_retries(lambda: get_full_topic_json(base_url, topic_id, cookies),
+                                       max_attempts, record_failure)
+    except FetchError as e:
+        print(f"✗ Failed to get complete data for topic {topic_id}")
+        return "retry" if e.transient else "failed"
+
+    status = "skipped"
+    post_count = 0
+    # Check if this topic has posts within our target date range
+    if has_posts_in_date_range(topic_json_data, POST_START_DATE, POST_END_DATE):
+        # Filter posts to only include those within our date range
+        filtered_data, post_count = filter_posts_by_date_range(
+            topic_json_data, POST_START_DATE, POST_END_DATE
+        )
+        
+        if post_count > 0:
+            save_topic_json(topic_id, filtered_data, output_dir)
+            status = "saved"
+            print(f"✓ Topic {topic_id} saved with {post_count} relevant posts")
         else:
-            print(f"✗ Topic {topic_id} has no posts in date range")
+            print(f"✗ Topic {topic_id} has no posts in target date range after filtering")
     else:
-        print(f"✗ Failed to fetch topic {topic_id}")
+        print(f"✗ Topic {topic_id} has no posts within target date range - skipping")
+    # Journaled only once the file is in place, so a "saved" entry always has its file
+    journal.append("topic_done", topic_id=topic_id, status=status, posts=post_count)
+    return status
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download the TDS Discourse category into topic JSON files.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the journal of an interrupted run instead of starting over")
+    parser.add_argument("--base-url", default=DISCOURSE_BASE_URL,
+                        help="Discourse site; point it at a mock server to test")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--delay", type=float, default=REQUEST_DELAY, help="Seconds between topics")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help="Attempts per request for transient failures (429, 5xx, network)")
+    parser.add_argument("--retry-wait", type=float, default=RETRY_MAX_DELAY,
+                        help="Seconds to wait before the final round of retries")
+    parser.add_argument("--topic", type=int, help="Only fetch this topic and report on it, for debugging")
+    return parser.parse_args()
 
 
 def main():
     """Main function to orchestrate the downloading process."""
+    args = parse_args()
+    if args.topic is not None:
+        test_single_topic(args.topic, args.base_url)
+        return
+
     print("Script started.")
     print(f"Topic fetch date range: {TOPIC_FETCH_START_DATE} to {TOPIC_FETCH_END_DATE}")
     print(f"Post filter date range: {POST_START_DATE} to {POST_END_DATE}")
     
     cookies = parse_cookie_string(RAW_COOKIE_STRING)
-    if not cookies and DISCOURSE_BASE_URL != "https://meta.discourse.org/":
+    if not cookies and args.base_url != "https://meta.discourse.org/":
         print("Warning: Running without cookies. This may fail for private forums or specific content.")
 
+    journal = ScrapeJournal(os.path.join(args.output_dir, JOURNAL_FILE))
+    if not args.resume:
+        journal.reset()
+    elif not journal.entries:
+        print(f"No journal at {journal.path}; starting from scratch.")
+    journal.append("run_started", resume=args.resume, base_url=args.base_url)
+
     # Fetch topics using the extended date range
     topic_ids = get_topic_ids(
-        DISCOURSE_BASE_URL,
+        args.base_url,
         CATEGORY_SLUG,
         CATEGORY_ID,
         TOPIC_FETCH_START_DATE,  # Extended range to catch older topics
         TOPIC_FETCH_END_DATE,
-        cookies
+        cookies,
+        journal,
+        args.max_attempts,
     )
 
     if not topic_ids:
         print("No topic IDs found for the given criteria. Exiting.")
         return
 
+    finished = journal.finished_topics()
+    pending = [topic_id for topic_id in topic_ids if topic_id not in finished]
     total_topics = len(topic_ids)
-    success_downloads = 0
-    failed_topic_ids = []
-    topics_with_relevant_posts = 0
+    outcomes = {"saved": 0, "skipped": 0, "failed": 0}
 
-    print(f"\nStarting download of {total_topics} topics...\n")
-
-    for i, topic_id in enumerate(topic_ids, 1):
-        print(f"--- [{i}/{total_topics}] Processing topic ID: {topic_id} ---")
-        
-        # Add delay to prevent rate limiting
-        if i > 1:  # Don't delay on first request
-            time.sleep(1)  # 1 second delay between requests
-        
-        topic_json_data = get_full_topic_json(DISCOURSE_BASE_URL, topic_id, cookies)
-        
-        if topic_json_data:
-            # Check if this topic has posts within our target date range
-            if has_posts_in_date_range(topic_json_data, POST_START_DATE, POST_END_DATE):
-                # Filter posts to only include those within our date range
-                filtered_data, post_count = filter_posts_by_date_range(
-                    topic_json_data, POST_START_DATE, POST_END_DATE
-                )
-                
-                if post_count > 0:
-                    save_topic_json(topic_id, filtered_data, OUTPUT_DIR)
-                    success_downloads += 1
-                    topics_with_relevant_posts += 1
-                    print(f"✓ Topic {topic_id} saved with {post_count} relevant posts")
-                else:
-                    print(f"✗ Topic {topic_id} has no posts in target date range after filtering")
+    def download(round_topic_ids):
+        """Process topics in order; returns those that ran out of attempts on transient errors."""
+        retry_topic_ids = []
+        for i, topic_id in enumerate(round_topic_ids, 1):
+            print(f"--- [{i}/{len(round_topic_ids)}] Processing topic ID: {topic_id} ---")
+            
+            # Add delay to prevent rate limiting
+            if i > 1:  # Don't delay on first request
+                time.sleep(args.delay)
+            
+            status = process_topic(args.base_url, topic_id, cookies, args.output_dir, journal, args.max_attempts)
+            if status == "retry":
+                retry_topic_ids.append(topic_id)
             else:
-                print(f"✗ Topic {topic_id} has no posts within target date range - skipping")
-        else:
-            print(f"✗ Failed to get complete data for topic {topic_id}")
-            failed_topic_ids.append(topic_id)
-
+                outcomes[status] += 1
+        return retry_topic_ids
+
+    if args.resume:
+        print(f"\nResuming: {total_topics - len(pending)} of {total_topics} topics already finished.")
+    print(f"\nStarting download of {len(pending)} topics...\n")
+    retry_topic_ids = download(pending)
+    if retry_topic_ids:
+        # One more round at the end, once the rest have given the server time to recover
+        print(f"\nRetrying {len(retry_topic_ids)} topics that failed with transient errors in {args.retry_wait:.0f}s...\n")
+        time.sleep(args.retry_wait)
+        retry_topic_ids = download(retry_topic_ids)
+    journal.append("run_finished", **outcomes, retry=len(retry_topic_ids))
+
+    permanent_failures = {topic_id: outcome for topic_id, outcome in journal.finished_topics().items()
+                          if outcome.startswith("failed")}
     print("\n========= SUMMARY =========")
     print(f"Total topics fetched from category: {total_topics}")
-    print(f"Topics with posts in target date range: {topics_with_relevant_posts}")
-    print(f"Successfully downloaded and filtered: {success_downloads} topics")
-    print(f"Failed to download/process: {len(failed_topic_ids)} topics")
-    if failed_topic_ids:
-        print("Failed topic IDs:", failed_topic_ids)
-    print(f"Downloaded files are in: {os.path.abspath(OUTPUT_DIR)}")
+    print(f"Finished in earlier runs: {total_topics - len(pending)}")
+    print(f"Successfully downloaded and filtered: {outcomes['saved']} topics")
+    print(f"No posts in target date range: {outcomes['skipped']} topics")
+    print(f"Failed for good (403/404/...): {len(permanent_failures)} topics")
+    if permanent_failures:
+        print("Failed topic IDs:", permanent_failures)
+    if retry_topic_ids:
+        print(f"Still failing with transient errors: {retry_topic_ids}; run again with --resume to retry them")
+    print(f"Downloaded files are in: {os.path.abspath(args.output_dir)}")
+    print(f"Journal: {os.path.abspath(journal.path)}")
     print("Script finished.")
 
 
 if __name__ == "__main__":
     main()
-
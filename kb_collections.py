@@ -0,0 +1,189 @@
+import logging
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Parse "name=path,name=path" into an ordered {name: path} dict
+def parse_collections(spec):
+    collections = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, separator, path = entry.partition("=")
+        if not separator or not name.strip() or not path.strip():
+            raise ValueError(f"Collection entries look like name=path/to/knowledge_base.db, got {entry!r}")
+        collections[name.strip()] = path.strip()
+    return collections
+
+
+def array_bytes(*arrays):
+    return sum(array.nbytes for array in arrays if isinstance(array, np.ndarray))
+
+
+class Collection:
+    """One knowledge base (say a course term): its database and what is loaded from it.
+
+    The loaded state is the vector index, the database signature it was loaded at, and the
+    optional sharded searcher, local embedder, chunk store and precomputed answer table;
+    `unload` drops all of it. Requests being served hold the collection through `in_use`:
+    what `unload` drops is only closed once every request that started before it has
+    finished, since those may still be reading the chunk store or searching the workers.
+    `stats` counts index lookups that found it loaded (hits) or had to load it (misses).
+    """
+
+    def __init__(self, name, db_path):
+        self.name = name
+        self.db_path = db_path
+        self.vector_index = None
+        self.signature = None
+        self.sharded_searcher = None
+        self.local_embedder = None
+        self.chunk_store = None
+        self.answer_table = None
+        self.corpus = {}
+        self.generation = 0  # Bumped by every unload
+        self.users = Counter()  # Requests in flight, by the generation they started in
+        self.retired = {}  # {generation: closers of what was unloaded at its end, not run yet}
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "load_seconds": 0.0, "last_load_seconds": None}
+
+    @property
+    def loaded(self):
+        return self.vector_index is not None
+
+    def memory_bytes(self):
+        """Bytes of the arrays this collection holds: index, coarse matrix, columns, sections, local embedder.
+
+        Memory-mapped matrices count in full: they are what a scan pages in.
+        """
+        total = 0
+        index = self.vector_index
+        if index is not None:
+            total += array_bytes(index.embeddings, index.coarse, index.sources, index.row_ids, index.group_ids,
+                                 index.topic_ids, index.created_at, index.likes, index.merged_rows,
+                                 index.merged_sources, index.merged_row_ids)
+            if index.sections is not None:
+                sections = index.sections
+                total += array_bytes(sections.centroids, sections.maxima, sections.order, sections.offsets,
+                                     sections.section_ids)
+        if self.local_embedder is not None:
+            total += array_bytes(self.local_embedder.embeddings, self.local_embedder.idf)
+        if self.answer_table is not None:
+            total += array_bytes(self.answer_table.embeddings)
+        return total
+
+    def record_load(self, seconds):
+        self.stats["loads"] += 1
+        self.stats["load_seconds"] += seconds
+        self.stats["last_load_seconds"] = round(seconds, 4)
+
+    @contextmanager
+    def in_use(self):
+        generation = self.generation
+        self.users[generation] += 1
+        try:
+            yield self
+        finally:
+            self.users[generation] -= 1
+            if not self.users[generation]:
+                del self.users[generation]
+            self.close_retired()
+
+    def unload(self):
+        closers = []
+        if self.sharded_searcher is not None:
+            closers.append(self.sharded_searcher.retire)  # Shuts the workers down in the background
+        if self.chunk_store is not None:
+            closers.append(self.chunk_store.close)
+        if self.answer_table is not None:
+            closers.append(self.answer_table.close)
+        if closers:
+            self.retired[self.generation] = closers
+        self.generation += 1
+        self.vector_index = self.signature = self.sharded_searcher = self.local_embedder = self.chunk_store = None
+        self.answer_table = None
+        self.close_retired()
+
+    def close_retired(self):
+        # What was unloaded at the end of generation g may be in use by requests started in g or earlier
+        oldest = min(self.users, default=self.generation)
+        for generation in [generation for generation in self.retired if generation < oldest]:
+            for close in self.retired.pop(generation):
+                close()
+
+    def snapshot(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "db_path": self.db_path,
+            "loaded": self.loaded,
+            "memory_bytes": self.memory_bytes(),
+            **self.stats,
+            "load_seconds": round(self.stats["load_seconds"], 4),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+        }
+
+
+class CollectionRegistry:
+    """Named collections, loaded on first use and evicted least recently used first.
+
+    `touch` marks a collection as just used; `enforce_budget` then unloads the least
+    recently used others until the loaded collections fit in `memory_budget` bytes (0 for
+    no limit). The collection being served is never evicted, even if it alone is over.
+    """
+
+    def __init__(self, paths, default, memory_budget=0):
+        if default not in paths:
+            raise ValueError(f"Default collection {default!r} is not one of {list(paths)}")
+        self.collections = {name: Collection(name, path) for name, path in paths.items()}
+        self.default = default
+        self.memory_budget = memory_budget
+        self.recent = OrderedDict()  # Loaded collection names, least recently used first
+
+    def __contains__(self, name):
+        return name in self.collections
+
+    def __iter__(self):
+        return iter(self.collections.values())
+
+    def get(self, name=None):
+        """The named collection, or the default one; KeyError if there is no such collection."""
+        return self.collections[self.default if name is None else name]
+
+    def register(self, name, db_path):
+        """Add a collection, or point an existing one at another database (unloading it)."""
+        if name in self.collections:
+            self.collections[name].unload()
+            self.recent.pop(name, None)
+        self.collections[name] = Collection(name, db_path)
+        return self.collections[name]
+
+    def touch(self, collection):
+        self.recent[collection.name] = None
+        self.recent.move_to_end(collection.name)
+
+    def resident_bytes(self):
+        return sum(collection.memory_bytes() for collection in self.collections.values() if collection.loaded)
+
+    def enforce_budget(self, keep):
+        if not self.memory_budget:
+            return
+        for name in list(self.recent):
+            if self.resident_bytes() <= self.memory_budget:
+                break
+            if name == keep.name:
+                continue
+            collection = self.collections[name]
+            freed = collection.memory_bytes()
+            collection.unload()
+            collection.stats["evictions"] += 1
+            del self.recent[name]
+            logger.info(f"Evicted collection {name} ({freed / 1024 / 1024:.1f} MB) to stay under the index memory budget")
+
+    def snapshot(self):
+        return {
+            "default": self.default,
+            "memory_budget_bytes": self.memory_budget,
+            "resident_bytes": self.resident_bytes(),
+            "collections": {name: collection.snapshot() for name, collection in self.collections.items()},
+        }
@@ -0,0 +1,100 @@
+import logging
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+# Hash unigrams and bigrams into buckets with a stable hash (Python's hash() is salted per process)
+def hashed_terms(text, n_buckets):
+    words = TOKEN_PATTERN.findall(text.lower())
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not terms:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    buckets = np.fromiter((zlib.crc32(term.encode("utf-8")) for term in terms), dtype=np.int64, count=len(terms))
+    buckets, counts = np.unique(buckets % n_buckets, return_counts=True)
+    return buckets, counts.astype(np.float32)
+
+
+class LocalEmbedder:
+    """A network-free stand-in for the remote embedding model: hashed TF-IDF over word
+    unigrams and bigrams, randomly projected to `dim` dense dimensions.
+
+    It is fitted on the chunk corpus when the vector index is built. `embeddings` holds
+    the corpus in this space, row-aligned with the VectorIndex, so retrieval can fall back
+    to it when the embeddings endpoint is unavailable. Its scores are not comparable with
+    remote cosine similarities and need their own threshold.
+    """
+
+    def __init__(self, idf, embeddings, dim=256, seed=0):
+        self.idf = idf
+        self.embeddings = embeddings
+        self.dim = dim
+        self.seed = seed
+        # Gaussian projection, regenerated from the seed rather than stored
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal((len(idf), dim), dtype=np.float32) / np.sqrt(dim)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @classmethod
+    def fit(cls, texts, dim=256, n_buckets=2 ** 14, seed=0):
+        started = time.perf_counter()
+        terms = [hashed_terms(text or "", n_buckets) for text in texts]
+        document_frequency = np.zeros(n_buckets, dtype=np.float64)
+        for buckets, _ in terms:
+            document_frequency[buckets] += 1
+        idf = (np.log((1 + len(terms)) / (1 + document_frequency)) + 1).astype(np.float32)
+        embedder = cls(idf, np.zeros((0, dim), dtype=np.float32), dim, seed)
+        if terms:
+            embedder.embeddings = np.vstack([embedder.project(buckets, counts) for buckets, counts in terms])
+        logger.info(f"Fitted local embedder on {len(terms)} chunks in {time.perf_counter() - started:.2f}s")
+        return embedder
+
+    def project(self, buckets, counts):
+        weights = (1 + np.log(counts)) * self.idf[buckets]
+        vector = weights @ self.projection[buckets]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def encode(self, text):
+        return self.project(*hashed_terms(text, len(self.idf)))
+
+    def similarities(self, query_vector, rows=None):
+        """Cosine similarity of every corpus row to an encoded query, -inf for unselected rows."""
+        if rows is None:
+            return self.embeddings @ query_vector
+        similarities = np.full(len(self), -np.inf, dtype=np.float32)
+        similarities[rows] = self.embeddings[rows] @ query_vector
+        return similarities
+
+    def save(self, path, signature):
+        """Write the corpus vectors and IDF weights next to the database, tagged with `signature`."""
+        for suffix, write in (
+            (".local.npy", lambda f: np.save(f, self.embeddings)),
+            (".local.npz", lambda f: np.savez(
+                f, idf=self.idf, dim=self.dim, seed=self.seed, signature=np.asarray(signature, dtype=np.float64),
+            )),
+        ):
+            # Write to a temp file and rename, so a crash never leaves a truncated file
+            with open(f"{path}{suffix}.tmp", "wb") as f:
+                write(f)
+            os.replace(f"{path}{suffix}.tmp", f"{path}{suffix}")
+
+    @classmethod
+    def load(cls, path, signature):
+        """Map a saved embedder, or return None if it is missing or was fitted on another database state."""
+        if not (os.path.exists(f"{path}.local.npz") and os.path.exists(f"{path}.local.npy")):
+            return None
+        with np.load(f"{path}.local.npz") as params:
+            if not np.array_equal(params["signature"], np.asarray(signature, dtype=np.float64)):
+                return None
+            return cls(params["idf"], np.load(f"{path}.local.npy", mmap_mode="r"), int(params["dim"]), int(params["seed"]))
@@ -0,0 +1,109 @@
+import logging
+import re
+import time
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MINHASH_PRIME = (1 << 31) - 1  # Keeps a * x + b inside int64 for 31-bit a, b and x
+
+
+# Hash the overlapping word n-grams of a text; a text shorter than n words is one shingle
+def shingles(text, size=3):
+    words = TOKEN_PATTERN.findall((text or "").lower())
+    if not words:
+        return np.zeros(0, dtype=np.int64)
+    grams = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+    hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.int64, count=len(grams))
+    return np.unique(hashes % MINHASH_PRIME)
+
+
+class MinHasher:
+    """MinHash signatures: the minimum of `num_perm` random universal hashes over a text's shingles.
+
+    The fraction of positions on which two signatures agree estimates the Jaccard similarity
+    of the shingle sets. `candidate_pairs` bands the signatures (locality-sensitive hashing)
+    so only texts agreeing on a whole band are compared: with `bands` bands of
+    num_perm / bands rows, pairs above roughly (1 / bands) ** (bands / num_perm) Jaccard
+    similarity are found with high probability.
+    """
+
+    def __init__(self, num_perm=128, bands=16, shingle_size=3, seed=0):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.int64)
+        self.b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.int64)
+
+    def signature(self, text):
+        hashes = shingles(text, self.shingle_size)
+        if not len(hashes):
+            # Empty texts agree with nothing, not with each other
+            return np.full(self.num_perm, -1, dtype=np.int64)
+        return ((np.outer(hashes, self.a) + self.b) % MINHASH_PRIME).min(axis=0)
+
+    def signatures(self, texts):
+        return np.vstack([self.signature(text) for text in texts]) if texts else np.zeros((0, self.num_perm), np.int64)
+
+    def candidate_pairs(self, signatures):
+        """Row pairs (i < j) whose signatures are identical on at least one band."""
+        pairs = set()
+        rows_per_band = self.num_perm // self.bands
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            columns = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            for row, key in enumerate(map(bytes, columns)):
+                buckets[key].append(row)
+            for members in buckets.values():
+                if 1 < len(members):
+                    pairs.update((i, j) for n, i in enumerate(members) for j in members[n + 1:])
+        return pairs
+
+
+def find_near_duplicates(texts, embeddings, sources, preference, min_jaccard=0.8, min_similarity=0.95, hasher=None):
+    """For every row, the row it duplicates, or -1 if it is kept.
+
+    Rows are near-duplicates when they come from the same source table, their estimated
+    shingle Jaccard similarity is at least `min_jaccard` and the cosine similarity of
+    their (normalized) embeddings is at least `min_similarity`. Rows are visited in
+    `preference` order and each row not yet claimed keeps itself and claims its unclaimed
+    duplicates, so a group is every row close to its representative, never a chain of
+    rows each close only to the next.
+    """
+    started = time.perf_counter()
+    hasher = hasher or MinHasher()
+    signatures = hasher.signatures(texts)
+    neighbours = defaultdict(list)
+    for i, j in hasher.candidate_pairs(signatures):
+        if sources[i] != sources[j] or signatures[i, 0] < 0:
+            continue
+        if np.mean(signatures[i] == signatures[j]) < min_jaccard:
+            continue
+        if float(embeddings[i] @ embeddings[j]) < min_similarity:
+            continue
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+
+    duplicate_of = np.full(len(texts), -1, dtype=np.int64)
+    claimed = np.zeros(len(texts), dtype=bool)
+    for row in preference:
+        if claimed[row] or row not in neighbours:
+            continue
+        claimed[row] = True
+        for other in neighbours[row]:
+            if not claimed[other]:
+                claimed[other] = True
+                duplicate_of[other] = row
+    logger.info(
+        f"Found {np.count_nonzero(duplicate_of >= 0)} near-duplicate chunks of {len(texts)} "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return duplicate_of
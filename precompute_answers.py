@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+
+import app
+from answer_table import AnswerTable, canonical_questions, results_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Answer canonical questions (Discourse topic titles, course-page headings) ahead of time, "
+                    "so /api can serve them from a table. Re-run after rebuilding the knowledge base: only "
+                    "answers whose retrieved chunks changed are regenerated."
+    )
+    parser.add_argument("--collection", default=None, help="Knowledge-base collection to precompute for (default: the default one)")
+    parser.add_argument("--discourse-dir", default="discourse_json")
+    parser.add_argument("--pages-dir", default="tds_pages_md")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions answered at once")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N canonical questions, for a trial run")
+    return parser.parse_args()
+
+
+async def refresh(table, questions, conn, concurrency):
+    """Bring the table in line with `questions`: embed new ones, answer those whose chunks changed, drop the rest."""
+    embeddings = table.stored_embeddings()
+    missing = [question for question in questions if question not in embeddings]
+    if missing:
+        logger.info(f"Embedding {len(missing)} new canonical questions")
+        embeddings.update(zip(missing, await app.get_embeddings(missing)))
+    fingerprints = table.fingerprints()
+    keep, counts = set(), Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def precompute(question, origin):
+        async with semaphore:
+            results = await app.find_similar_content(embeddings[question], conn)
+            if not results:
+                counts["no_results"] += 1
+                return
+            fingerprint = results_fingerprint(results)
+            if fingerprints.get(question) == fingerprint:
+                counts["unchanged"] += 1
+                keep.add(question)
+                return
+            try:
+                answer = await app.answer_from_results(question, results, conn)
+            except Exception as e:
+                # The old answer, if any, was generated from chunks that changed, so it is dropped
+                counts["failed"] += 1
+                logger.error(f"Could not answer '{question[:50]}': {e}")
+                return
+            table.put(question, origin, embeddings[question], answer["answer"], answer["links"], fingerprint)
+            counts["updated" if question in fingerprints else "added"] += 1
+            keep.add(question)
+            done = counts["added"] + counts["updated"]
+            if done % 25 == 0:
+                logger.info(f"Answered {done} questions")
+
+    await asyncio.gather(*(precompute(question, origin) for question, origin in questions.items()))
+    counts["removed"] = table.retain(keep)
+    return counts
+
+
+async def main():
+    args = parse_args()
+    if not app.API_KEY:
+        sys.exit("API_KEY environment variable not set")
+    if args.collection is not None and args.collection not in app.collections:
+        sys.exit(f"Unknown collection: {args.collection}")
+    app.collection_name.set(args.collection)
+    kb = app.current_collection()
+
+    questions = canonical_questions(args.discourse_dir, args.pages_dir)
+    if args.limit is not None:
+        questions = dict(list(questions.items())[:args.limit])
+    logger.info(f"{len(questions)} canonical questions from {args.discourse_dir} and {args.pages_dir}")
+
+    conn = app.get_db_connection()
+    table = AnswerTable.open(f"{kb.db_path}.answers", create=True)
+    try:
+        # Taken before answering: if the database changes mid-run, the table is stamped stale
+        signature = app.database_signature(kb.db_path)
+        app.get_vector_index(conn)
+        started = time.perf_counter()
+        counts = await refresh(table, questions, conn, args.concurrency)
+        table.stamp(signature)
+        logger.info(f"Refreshed {table.path} in {time.perf_counter() - started:.1f}s: {dict(counts)}")
+    finally:
+        table.close()
+        conn.close()
+        if app.http_session is not None:
+            await app.http_session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
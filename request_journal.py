@@ -0,0 +1,71 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+DIGEST_CHARS = 16  # 64 bits of HMAC: enough to tell repeats apart, too short to be worth brute-forcing
+
+
+class RequestJournal:
+    """Append-only JSONL log of /api requests, for replaying production traffic offline.
+
+    Each line is one request: when it arrived, what it asked and how long each stage took.
+    Question text is only written when `record_text` is set; otherwise the question is
+    kept as a keyed hash and its length, so repeats of the same question are still
+    recognisable without the text being readable. Images are never written, only their
+    decoded size and a keyed hash of the payload. Nothing about the client (address,
+    headers) is recorded. The key is random per process unless one is given, in which
+    case hashes also match across restarts and replicas that share it.
+    """
+
+    def __init__(self, path, record_text=False, key=None):
+        self.path = path
+        self.record_text = record_text
+        self.key = key.encode("utf-8") if key else secrets.token_bytes(32)
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def digest(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return hmac.new(self.key, data, hashlib.sha256).hexdigest()[:DIGEST_CHARS]
+
+    def question_fields(self, question):
+        if self.record_text:
+            return {"question": question}
+        return {"question_hash": self.digest(question), "question_chars": len(question)}
+
+    def record(self, entry):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        # One write per line, flushed, so a crash loses at most the request in flight
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+# Entries of a journal, oldest first; a line torn by a crash mid-write is skipped
+def read_journal(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping unreadable journal line {number} of {path}")
+    return entries
@@ -0,0 +1,113 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import shutil
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]+$")
+ARTIFACTS = {
+    "cpu.prof": "application/octet-stream",  # pstats dump, for snakeviz or pstats.Stats
+    "cpu.txt": "text/plain",
+    "alloc.txt": "text/plain",
+    "meta.json": "application/json",
+}
+
+
+class RequestProfiler:
+    """CPU profile (cProfile) and allocation snapshot (tracemalloc) of a single request.
+
+    Both tools are process-wide, so one request is profiled at a time and others arriving
+    meanwhile run unprofiled. On the event loop the CPU profile also sees whatever other
+    requests ran while this one was awaiting; the allocation snapshot only counts memory
+    still held when the request finished. Each profile is a directory of ARTIFACTS under
+    `directory`, which keeps only the newest `max_profiles`.
+    """
+
+    def __init__(self, directory, max_profiles=20, top=40, traceback_frames=10):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.top = top
+        self.traceback_frames = traceback_frames
+        self.profiler = None
+        self.profile_id = None
+        self.started = 0.0
+
+    @property
+    def busy(self):
+        return self.profiler is not None
+
+    def start(self):
+        """Begin profiling and return the new profile's id; None if another request is already being profiled."""
+        if self.busy or tracemalloc.is_tracing():
+            return None
+        self.profile_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+        self.profiler = cProfile.Profile()
+        tracemalloc.start(self.traceback_frames)
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self.profile_id
+
+    def stop(self, label):
+        """Stop profiling, write the artifacts and return the profile id; None if nothing was being profiled."""
+        if not self.busy:
+            return None
+        self.profiler.disable()
+        elapsed = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profiler, self.profiler = self.profiler, None
+        profile_id = self.profile_id
+
+        path = os.path.join(self.directory, profile_id)
+        os.makedirs(path, exist_ok=True)
+        profiler.dump_stats(os.path.join(path, "cpu.prof"))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(self.top)
+        with open(os.path.join(path, "cpu.txt"), "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        with open(os.path.join(path, "alloc.txt"), "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"id": profile_id, "label": label, "seconds": round(elapsed, 4)}, f)
+        self.evict()
+        logger.info(f"Profiled {label} in {elapsed:.2f}s as {profile_id}")
+        return profile_id
+
+    # Drop the oldest profiles beyond max_profiles; ids sort by creation time
+    def evict(self):
+        profile_ids = self.list_ids()
+        for profile_id in profile_ids[:max(0, len(profile_ids) - self.max_profiles)]:
+            shutil.rmtree(os.path.join(self.directory, profile_id), ignore_errors=True)
+
+    def list_ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if PROFILE_ID_PATTERN.match(name))
+
+    def list(self):
+        profiles = []
+        for profile_id in reversed(self.list_ids()):
+            try:
+                with open(os.path.join(self.directory, profile_id, "meta.json"), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def artifact_path(self, profile_id, artifact):
+        """Path of one artifact, or None if the id or artifact name is not valid or not on disk."""
+        if not PROFILE_ID_PATTERN.match(profile_id) or artifact not in ARTIFACTS:
+            return None
+        path = os.path.join(self.directory, profile_id, artifact)
+        return path if os.path.exists(path) else None
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import aiohttp
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """A non-200 upstream response. 429 and 5xx are worth retrying, other 4xx are not."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        return self.status == 429 or self.status >= 500
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"Upstream {name} is unavailable, failing fast for another {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# Failures that say something about the upstream's health, and may succeed on another try
+def is_retryable(error):
+    if isinstance(error, UpstreamError):
+        return error.retryable
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails calls fast for
+    `reset_timeout` seconds, then lets a single probe through (half-open): the breaker
+    closes if the probe succeeds and opens again if it fails."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def before_call(self, name):
+        if self.state == "open":
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout:
+                raise CircuitOpenError(name, self.reset_timeout - waited)
+            self.state = "half_open"
+            logger.info(f"Circuit for {name} half-open, sending a probe")
+        if self.state == "half_open":
+            if self.probing:
+                raise CircuitOpenError(name, 1)
+            self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    # An attempt that ended without telling us anything about the upstream (cancelled, deadline)
+    def release(self):
+        self.probing = False
+
+
+class RetryBudget:
+    """Retries and hedges spend a token each; every call earns `ratio` of a token. Extra
+    load on the upstream is capped at `ratio` of the call rate, plus a burst of `max_tokens`."""
+
+    def __init__(self, ratio=0.2, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful attempts."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        if len(self.samples) < self.min_samples:
+            return None
+        return float(np.percentile(self.samples, q))
+
+
+class UpstreamEndpoint:
+    """Breaker, retry budget and latency window for one upstream endpoint.
+
+    `call` runs an attempt (a coroutine function doing one HTTP request) and retries
+    retryable failures with full-jitter exponential backoff while the budget allows. With
+    `hedge` set, an attempt still running after the observed p95 latency gets a duplicate
+    and the first success wins; only use it for idempotent requests.
+    """
+
+    def __init__(self, name, max_attempts=3, base_delay=1.0, max_delay=8.0, hedge=False,
+                 failure_threshold=5, reset_timeout=30.0, retry_ratio=0.2, retry_burst=10.0):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.budget = RetryBudget(retry_ratio, retry_burst)
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+
+    def backoff(self, attempt_number):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt_number))
+
+    async def run_attempt(self, attempt):
+        try:
+            self.breaker.before_call(self.name)
+        except CircuitOpenError:
+            self.stats["rejected"] += 1
+            raise
+        started = time.monotonic()
+        try:
+            result = await attempt()
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                self.stats["failures"] += 1
+                self.breaker.record_failure()
+            elif isinstance(e, UpstreamError):
+                # The upstream answered; the request itself was bad
+                self.breaker.record_success()
+            else:
+                self.breaker.release()
+            raise
+        self.latency.record(time.monotonic() - started)
+        self.breaker.record_success()
+        return result
+
+    async def hedged_attempt(self, attempt):
+        delay = self.latency.percentile(95) if self.hedge else None
+        if delay is None:
+            return await self.run_attempt(attempt)
+        first = asyncio.ensure_future(self.run_attempt(attempt))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or self.breaker.state != "closed" or not self.budget.withdraw():
+            return await first
+        self.stats["hedges"] += 1
+        second = asyncio.ensure_future(self.run_attempt(attempt))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+            raise first.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, attempt, sleep=asyncio.sleep, max_attempts=None):
+        """Run `attempt` until it succeeds, fails for good, or attempts or budget run out.
+
+        `sleep` waits out the backoff; pass one that refuses to sleep past a deadline.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        self.stats["calls"] += 1
+        self.budget.deposit()
+        for attempt_number in range(max_attempts):
+            try:
+                return await self.hedged_attempt(attempt)
+            except Exception as e:
+                if not is_retryable(e) or attempt_number + 1 >= max_attempts:
+                    raise
+                if not self.budget.withdraw():
+                    logger.warning(f"Retry budget for {self.name} exhausted, not retrying: {e}")
+                    raise
+                delay = self.backoff(attempt_number)
+                logger.warning(f"{self.name} attempt {attempt_number + 1}/{max_attempts} failed, "
+                               f"retrying in {delay:.2f}s: {e!r}")
+                self.stats["retries"] += 1
+                await sleep(delay)
+
+    def snapshot(self):
+        p95 = self.latency.percentile(95)
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "p95_latency": round(p95, 4) if p95 is not None else None,
+            "retry_tokens": round(self.budget.tokens, 2),
+            **self.stats,
+        }
@@ -0,0 +1,115 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # Without it only BLAS builds that read the variables lazily (OpenMP) are capped
+    threadpool_limits = None
+
+logger = logging.getLogger(__name__)
+
+
+# State of a worker process: the embedding matrix, attached from shared memory
+_worker = {}
+
+
+BLAS_THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def _attach_worker(shm_name, shape, dtype, blas_threads):
+    # Set in the worker only; numpy is already imported here, so a loaded BLAS is capped through threadpoolctl
+    for variable in BLAS_THREAD_VARIABLES:
+        os.environ[variable] = str(blas_threads)
+    if threadpool_limits is not None:
+        _worker["blas_limits"] = threadpool_limits(limits=blas_threads, user_api="blas")
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["embeddings"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _search_shard(start, stop, query, threshold, k):
+    scores = _worker["embeddings"][start:stop] @ query
+    candidates = np.flatnonzero(scores >= threshold)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates + start, scores[candidates]
+
+
+class ShardedSearcher:
+    """Exact top-k search with the embedding matrix split across a persistent process pool.
+
+    The matrix is copied once into shared memory; `embeddings` is a view of that copy, so
+    the parent can drop its own and every worker reads the same pages. A query scores each
+    contiguous shard in a worker, keeps the shard's top k above the threshold, and the
+    shard results are merged into the global top k. Each worker runs BLAS on one thread:
+    the shards are the parallelism.
+    """
+
+    def __init__(self, embeddings, n_shards):
+        self.n_shards = n_shards
+        self.shape = embeddings.shape
+        self.shm = shared_memory.SharedMemory(create=True, size=max(embeddings.nbytes, 1))
+        self.embeddings = np.ndarray(embeddings.shape, dtype=embeddings.dtype, buffer=self.shm.buf)
+        self.embeddings[:] = embeddings
+        bounds = np.linspace(0, embeddings.shape[0], n_shards + 1).astype(int)
+        self.shards = list(zip(bounds[:-1], bounds[1:]))
+        self.closing = threading.Lock()  # retire's thread and atexit may both close
+        self.pool = ProcessPoolExecutor(
+            max_workers=n_shards,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach_worker,
+            initargs=(self.shm.name, embeddings.shape, embeddings.dtype, 1),
+        )
+        atexit.register(self.close)
+        logger.info(f"Started sharded search over {embeddings.shape[0]} chunks with {n_shards} shards")
+
+    def warm_up(self):
+        """Spawn and attach every worker now rather than on the first query; returns the futures without waiting."""
+        query = np.zeros(self.shape[1], dtype=self.embeddings.dtype)
+        return [self.pool.submit(_search_shard, start, stop, query, np.inf, 1) for start, stop in self.shards]
+
+    async def search(self, query, threshold, k):
+        """Rows and scores of the top k rows scoring at least `threshold`, best first."""
+        query = np.asarray(query, dtype=self.embeddings.dtype)
+        futures = [
+            asyncio.wrap_future(self.pool.submit(_search_shard, start, stop, query, threshold, k))
+            for start, stop in self.shards
+        ]
+        shard_results = await asyncio.gather(*futures)
+        rows = np.concatenate([rows for rows, _ in shard_results])
+        scores = np.concatenate([scores for _, scores in shard_results])
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def retire(self):
+        """Close in a background thread once the searches already submitted have finished.
+
+        For a searcher replaced or evicted while serving: other requests may still be
+        awaiting its workers, and shutting the pool down must not block the event loop.
+        """
+        threading.Thread(target=self.close, name="retire-sharded-searcher").start()
+
+    def close(self):
+        with self.closing:
+            pool, self.pool = self.pool, None
+        if pool is None:
+            return
+        # Nothing left to clean up at exit; don't keep a retired searcher referenced until then
+        atexit.unregister(self.close)
+        # Queued searches still run; only new submissions are refused
+        pool.shutdown(wait=True)
+        self.embeddings = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # An index still holds a view; the mapping is released when that view goes away
+            pass
+        self.shm.unlink()
@@ -1,58 +1,146 @@
 import os
 import json
 import re
+import time
+import asyncio
+import argparse
+import hashlib
+import posixpath
 from datetime import datetime
-from urllib.parse import urljoin
+from urllib.parse import urlparse
 from markdownify import markdownify as md
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 
 BASE_URL = "https://tds.s-anand.net/#/2025-01/"
-BASE_ORIGIN = "https://tds.s-anand.net"
 OUTPUT_DIR = "tds_pages_md"
 METADATA_FILE = "metadata.json"
+# Content hash of every saved page, so re-crawls can skip pages that haven't changed
+MANIFEST_FILE = "crawl_manifest.json"
+
+# Number of browser pages pulling from the shared crawl queue
+CONCURRENCY = 4
+
+# docsify renders every route into this element; it is our readiness signal
+ARTICLE_SELECTOR = "article.markdown-section#main"
+NAVIGATION_TIMEOUT_MS = 10000
+
+# Resource types the article text never depends on
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
 
 visited = set()
 metadata = []
+manifest = {}
+seen_hashes = {}
 
 def sanitize_filename(title):
     return re.sub(r'[\\/*?:"<>|]', "_", title).strip().replace(" ", "_")
 
-def extract_all_internal_links(page):
-    links = page.eval_on_selector_all("a[href]", "els => els.map(el => el.href)")
+def origin_of(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+def canonicalize_url(url):
+    """Collapse docsify hash routes that render the same page onto one URL.
+
+    `#/../live-session` resolves to `#/live-session`, and the `?id=` section anchor
+    only scrolls within a page, so both are normalized away before visiting.
+    """
+    base, sep, route = url.partition("#")
+    if not sep:
+        return url
+    route = route.split("?", 1)[0] or "/"
+    trailing_slash = route.endswith("/")
+    route = posixpath.normpath("/" + route.lstrip("/"))
+    # normpath keeps a leading "//" and drops the trailing slash docsify uses for folder readmes
+    route = "/" + route.lstrip("/")
+    if trailing_slash and route != "/":
+        route += "/"
+    return f"{base}#{route}"
+
+def content_hash(html):
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"⚠️  Ignoring unreadable manifest {MANIFEST_FILE}: {e}")
+        return {}
+
+async def extract_all_internal_links(page, base_origin):
+    links = await page.eval_on_selector_all("a[href]", "els => els.map(el => el.href)")
     return list(set(
-        link for link in links
-        if BASE_ORIGIN in link and '/#/' in link
+        canonicalize_url(link) for link in links
+        if link.startswith(base_origin) and '/#/' in link
     ))
 
-def wait_for_article_and_get_html(page):
-    page.wait_for_selector("article.markdown-section#main", timeout=10000)
-    return page.inner_html("article.markdown-section#main")
+async def block_unneeded_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
 
-def crawl_page(page, url):
-    if url in visited:
-        return
-    visited.add(url)
+async def wait_for_article_and_get_html(page):
+    # docsify re-renders the same <article> on hash navigation, so wait until it has
+    # children again (it is cleared before every goto) instead of sleeping
+    await page.wait_for_selector(f"{ARTICLE_SELECTOR} > *", timeout=NAVIGATION_TIMEOUT_MS)
+    return await page.inner_html(ARTICLE_SELECTOR)
 
+async def crawl_page(page, url, queue, base_origin):
     print(f"📄 Visiting: {url}")
     try:
-        page.goto(url, wait_until="domcontentloaded")
-        page.wait_for_timeout(1000)
-        html = wait_for_article_and_get_html(page)
+        # Clear the previous route's article so a same-document navigation can't be read stale
+        await page.evaluate(
+            "sel => { const el = document.querySelector(sel); if (el) el.innerHTML = ''; }",
+            ARTICLE_SELECTOR,
+        )
+        await page.goto(url, wait_until="domcontentloaded")
+        html = await wait_for_article_and_get_html(page)
     except Exception as e:
         print(f"❌ Error loading page: {url}\n{e}")
         return
 
+    # Queue every internal link found on the page (not just main content), breadth-first
+    links = await extract_all_internal_links(page, base_origin)
+    for link in links:
+        if link not in visited:
+            visited.add(link)
+            queue.put_nowait(link)
+
+    # Skip pages whose rendered article we've already converted under another URL
+    digest = content_hash(html)
+    if digest in seen_hashes:
+        print(f"↩️  Duplicate of {seen_hashes[digest]}, skipping: {url}")
+        return
+    seen_hashes[digest] = url
+
+    # Skip pages that haven't changed since the last crawl
+    previous = manifest.get(url)
+    if previous and previous["content_hash"] == digest and os.path.exists(os.path.join(OUTPUT_DIR, previous["filename"])):
+        print(f"⏭️  Unchanged since {previous['downloaded_at']}, skipping: {url}")
+        metadata.append({
+            "title": previous["title"],
+            "filename": previous["filename"],
+            "original_url": url,
+            "downloaded_at": previous["downloaded_at"]
+        })
+        return
+
     # Extract title and save markdown
-    title = page.title().split(" - ")[0].strip() or f"page_{len(visited)}"
+    title = (await page.title()).split(" - ")[0].strip() or f"page_{len(visited)}"
     filename = sanitize_filename(title)
     filepath = os.path.join(OUTPUT_DIR, f"{filename}.md")
+    downloaded_at = datetime.now().isoformat()
 
     markdown = md(html)
     with open(filepath, "w", encoding="utf-8") as f:
         f.write(f"---\n")
         f.write(f"title: \"{title}\"\n")
         f.write(f"original_url: \"{url}\"\n")
-        f.write(f"downloaded_at: \"{datetime.now().isoformat()}\"\n")
+        f.write(f"downloaded_at: \"{downloaded_at}\"\n")
         f.write(f"---\n\n")
         f.write(markdown)
 
@@ -60,30 +148,71 @@ def crawl_page(page, url):
         "title": title,
         "filename": f"{filename}.md",
         "original_url": url,
-        "downloaded_at": datetime.now().isoformat()
+        "downloaded_at": downloaded_at
     })
-
-    # Recursively crawl all links found on the page (not just main content)
-    links = extract_all_internal_links(page)
-    for link in links:
-        if link not in visited:
-            crawl_page(page, link)
+    manifest[url] = {
+        "title": title,
+        "filename": f"{filename}.md",
+        "content_hash": digest,
+        "downloaded_at": downloaded_at
+    }
+
+async def crawl_worker(page, queue, base_origin):
+    while True:
+        url = await queue.get()
+        try:
+            await crawl_page(page, url, queue, base_origin)
+        except Exception as e:
+            # A page that breaks after loading must not take its worker down, or queue.join() never returns
+            print(f"❌ Error crawling page: {url}\n{e}")
+        finally:
+            queue.task_done()
+
+async def crawl(base_url, concurrency):
+    base_url = canonicalize_url(base_url)
+    base_origin = origin_of(base_url)
+    queue = asyncio.Queue()
+    visited.add(base_url)
+    queue.put_nowait(base_url)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+        await context.route("**/*", block_unneeded_resources)
+        pages = [await context.new_page() for _ in range(concurrency)]
+
+        workers = [asyncio.create_task(crawl_worker(page, queue, base_origin)) for page in pages]
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        await browser.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl the TDS course website into markdown files.")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help="Start URL; point it at a locally served copy of the site to benchmark")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="Number of browser pages crawling in parallel")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    global visited, metadata
+    manifest.update(load_manifest())
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-        crawl_page(page, BASE_URL)
+    started = time.perf_counter()
+    asyncio.run(crawl(args.base_url, max(1, args.concurrency)))
+    elapsed = time.perf_counter() - started
 
-        with open(METADATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
+    with open(METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
 
-        print(f"\n✅ Completed. {len(metadata)} pages saved.")
-        browser.close()
+    print(f"\n✅ Completed. {len(metadata)} pages saved.")
+    print(f"⏱️  {elapsed:.1f}s with {args.concurrency} pages, {len(metadata) / elapsed if elapsed else 0:.2f} pages/sec")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,452 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+SOURCE_DISCOURSE = 0
+SOURCE_MARKDOWN = 1
+SOURCE_NAMES = {SOURCE_DISCOURSE: "discourse", SOURCE_MARKDOWN: "markdown"}
+
+
+# Decode an embedding column value (JSON text, or raw float32 bytes)
+def decode_embedding(value):
+    if isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:1]) != b"[":
+        return np.frombuffer(value, dtype=np.float32)
+    return np.asarray(json.loads(value), dtype=np.float32)
+
+
+# Parse a Discourse ISO timestamp into a UTC epoch, NaN if missing or malformed
+def to_epoch(value):
+    if not value:
+        return np.nan
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return np.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class VectorIndex:
+    """Every chunk embedding in one L2-normalized float32 matrix, plus per-row columns.
+
+    Row i of `embeddings` belongs to the chunk `row_ids[i]` of table `sources[i]`, and
+    `group_ids[i]` identifies its post (discourse) or document (markdown), which is what
+    results are grouped and capped by. The columnar metadata (`topic_ids`, `created_at`
+    as a UTC epoch, `likes`) lets a query mask rows before scoring them; markdown rows
+    carry -1 / NaN there since documents have no topic, date or likes.
+
+    `coarse`, when built, holds the first few dimensions of every embedding, renormalized:
+    text-embedding-3 vectors are trained so that such a prefix still ranks well, which lets
+    a query scan the compact matrix and only rescore a shortlist at full dimension.
+    `sections`, when built, is the SectionSummaries used for two-level search.
+
+    Near-duplicate chunks may have been collapsed into one representative row; the chunks
+    folded into row `merged_rows[i]` are (`merged_sources[i]`, `merged_row_ids[i]`), sorted
+    by row, so results can still link to every copy.
+    """
+
+    def __init__(self, embeddings, sources, row_ids, group_ids, group_names, topic_ids, created_at, likes):
+        self.embeddings = embeddings
+        self.coarse = None
+        self.sections = None
+        self.sources = sources
+        self.row_ids = row_ids
+        self.group_ids = group_ids
+        self.group_names = group_names
+        self.topic_ids = topic_ids
+        self.created_at = created_at
+        self.likes = likes
+        self.merged_rows = np.zeros(0, dtype=np.int64)
+        self.merged_sources = np.zeros(0, dtype=np.int8)
+        self.merged_row_ids = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    @classmethod
+    def from_db(cls, conn):
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        vectors, sources, row_ids, group_ids = [], [], [], []
+        topic_ids, created_at, likes = [], [], []
+        group_lookup = {}
+
+        def group_id(name):
+            if name not in group_lookup:
+                group_lookup[name] = len(group_lookup)
+            return group_lookup[name]
+
+        cursor.execute('''
+        SELECT id, post_id, topic_id, created_at, likes, embedding
+        FROM discourse_chunks WHERE embedding IS NOT NULL
+        ''')
+        for row in cursor:
+            vectors.append(decode_embedding(row[5]))
+            sources.append(SOURCE_DISCOURSE)
+            row_ids.append(row[0])
+            group_ids.append(group_id(f"discourse_{row[1]}"))
+            topic_ids.append(row[2] if row[2] is not None else -1)
+            created_at.append(to_epoch(row[3]))
+            likes.append(row[4] or 0)
+
+        cursor.execute("SELECT id, doc_title, embedding FROM markdown_chunks WHERE embedding IS NOT NULL")
+        for row in cursor:
+            vectors.append(decode_embedding(row[2]))
+            sources.append(SOURCE_MARKDOWN)
+            row_ids.append(row[0])
+            group_ids.append(group_id(f"markdown_{row[1]}"))
+            topic_ids.append(-1)
+            created_at.append(np.nan)
+            likes.append(-1)
+
+        embeddings = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # Zero vectors keep similarity 0 with everything, as cosine_similarity did
+        embeddings = np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+
+        index = cls(
+            embeddings,
+            np.asarray(sources, dtype=np.int8),
+            np.asarray(row_ids, dtype=np.int64),
+            np.asarray(group_ids, dtype=np.int32),
+            list(group_lookup),
+            np.asarray(topic_ids, dtype=np.int64),
+            np.asarray(created_at, dtype=np.float64),
+            np.asarray(likes, dtype=np.int32),
+        )
+        logger.info(f"Loaded vector index with {len(index)} chunks in {time.perf_counter() - started:.2f}s")
+        return index
+
+    def select_rows(self, source=None, topic_id=None, created_after=None, created_before=None, min_likes=None):
+        """Row positions matching every given filter, or None when no filter is set.
+
+        Dates are UTC epochs. Date and likes filters only match discourse rows.
+        """
+        mask = None
+
+        def restrict(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        if source is not None:
+            restrict(self.sources == (SOURCE_DISCOURSE if source == "discourse" else SOURCE_MARKDOWN))
+        if topic_id is not None:
+            restrict(self.topic_ids == topic_id)
+        # NaN compares False, so undated rows fall out of any date window
+        if created_after is not None:
+            restrict(self.created_at >= created_after)
+        if created_before is not None:
+            restrict(self.created_at <= created_before)
+        if min_likes is not None:
+            restrict(self.likes >= min_likes)
+        return None if mask is None else np.flatnonzero(mask)
+
+    def representative_order(self):
+        """Rows in the order they are preferred as a duplicate group's representative:
+        earliest post first (the original, not the repost), then most liked, then index order."""
+        created_at = np.where(np.isnan(self.created_at), np.inf, self.created_at)
+        return np.lexsort((np.arange(len(self)), -self.likes, created_at))
+
+    def collapse(self, duplicate_of):
+        """A copy without the rows whose `duplicate_of` entry is set, each recorded against its representative."""
+        keep = duplicate_of < 0
+        if keep.all():
+            return self
+        position = np.cumsum(keep) - 1
+        folded = np.flatnonzero(~keep)
+        merged_rows = position[duplicate_of[folded]]
+        order = np.argsort(merged_rows, kind="stable")
+        index = VectorIndex(
+            np.ascontiguousarray(self.embeddings[keep]), self.sources[keep], self.row_ids[keep],
+            self.group_ids[keep], self.group_names, self.topic_ids[keep], self.created_at[keep], self.likes[keep],
+        )
+        index.merged_rows = merged_rows[order]
+        index.merged_sources = self.sources[folded][order]
+        index.merged_row_ids = self.row_ids[folded][order]
+        logger.info(f"Collapsed {len(folded)} near-duplicate chunks, {len(index)} of {len(self)} rows remain")
+        return index
+
+    def merged_chunks(self, row):
+        """(source, row_id) of each chunk folded into `row`."""
+        start, end = np.searchsorted(self.merged_rows, [row, row + 1])
+        return list(zip(self.merged_sources[start:end].tolist(), self.merged_row_ids[start:end].tolist()))
+
+    def build_coarse(self, dim):
+        """Keep a `dim`-dimensional truncated copy of the embeddings; a no-op unless that is smaller."""
+        if 0 < dim < self.embeddings.shape[1]:
+            self.coarse = truncate_embeddings(self.embeddings, dim)
+
+    def save(self, path, signature):
+        """Write the index next to the database: .npy matrices that can be memory-mapped,
+        and the columns plus the database `signature` it was built from in an .npz."""
+        writers = [
+            (".embeddings.npy", lambda f: np.save(f, self.embeddings)),
+            (".columns.npz", lambda f: np.savez(
+                f, sources=self.sources, row_ids=self.row_ids, group_ids=self.group_ids,
+                group_names=np.asarray(self.group_names, dtype=str), topic_ids=self.topic_ids,
+                created_at=self.created_at, likes=self.likes, merged_rows=self.merged_rows,
+                merged_sources=self.merged_sources, merged_row_ids=self.merged_row_ids,
+                signature=np.asarray(signature, dtype=np.float64),
+            )),
+        ]
+        if self.coarse is not None:
+            # Written first, so a current .columns.npz always comes with a current coarse matrix
+            writers.insert(0, (".coarse.npy", lambda f: np.save(f, self.coarse)))
+        elif os.path.exists(f"{path}.coarse.npy"):
+            # A stale coarse matrix must never be mapped alongside this index
+            os.remove(f"{path}.coarse.npy")
+        for suffix, write in writers:
+            # Write to a temp file and rename, so a crash never leaves a truncated index
+            with open(f"{path}{suffix}.tmp", "wb") as f:
+                write(f)
+            os.replace(f"{path}{suffix}.tmp", f"{path}{suffix}")
+
+    @classmethod
+    def load(cls, path, signature, coarse_dim=0):
+        """Map a saved index, or return None if it is missing or was built from another database state.
+
+        The saved coarse matrix is mapped if it has `coarse_dim` columns, and rebuilt otherwise.
+        """
+        if not (os.path.exists(f"{path}.columns.npz") and os.path.exists(f"{path}.embeddings.npy")):
+            return None
+        started = time.perf_counter()
+        with np.load(f"{path}.columns.npz") as columns:
+            if not np.array_equal(columns["signature"], np.asarray(signature, dtype=np.float64)):
+                return None
+            index = cls(
+                np.load(f"{path}.embeddings.npy", mmap_mode="r"),
+                columns["sources"], columns["row_ids"], columns["group_ids"],
+                columns["group_names"].tolist(), columns["topic_ids"], columns["created_at"], columns["likes"],
+            )
+            if "merged_rows" in columns:
+                index.merged_rows = columns["merged_rows"]
+                index.merged_sources = columns["merged_sources"]
+                index.merged_row_ids = columns["merged_row_ids"]
+        if coarse_dim and os.path.exists(f"{path}.coarse.npy"):
+            coarse = np.load(f"{path}.coarse.npy", mmap_mode="r")
+            if coarse.shape == (len(index), coarse_dim):
+                index.coarse = coarse
+        if coarse_dim and index.coarse is None:
+            index.build_coarse(coarse_dim)
+        logger.info(f"Mapped saved vector index with {len(index)} chunks in {time.perf_counter() - started:.2f}s")
+        return index
+
+    @staticmethod
+    def normalize_query(query_embedding):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def similarities(self, query_embedding, rows=None):
+        """Cosine similarity of every row to the query; only `rows` are scored if given.
+
+        Unscored rows get -inf, so the cost scales with the selection, not the corpus.
+        """
+        query = self.normalize_query(query_embedding)
+        if len(self) == 0:
+            # Nothing embedded yet; the (0, 0) matrix can't be multiplied by a query
+            return np.zeros(0, dtype=np.float32)
+        if rows is None:
+            return self.embeddings @ query
+        similarities = np.full(len(self), -np.inf, dtype=np.float32)
+        similarities[rows] = self.embeddings[rows] @ query
+        return similarities
+
+
+class SectionSummaries:
+    """The chunks of each Discourse topic or course page, summarized for two-level search.
+
+    A section is a topic (discourse rows, by `topic_ids`) or a document (markdown rows, and
+    discourse rows without a topic, by `group_ids`). Each has two unit vectors: the
+    centroid of its chunk embeddings, which matches what the section is mostly about, and
+    their element-wise max, which keeps a trace of every chunk so that one on-topic reply
+    in a long thread still pulls its topic up. A section scores the better of the two.
+    `order` lists rows section by section, section s being order[offsets[s]:offsets[s + 1]].
+    """
+
+    def __init__(self, section_ids, centroids, maxima, order, offsets):
+        self.section_ids = section_ids
+        self.centroids = centroids
+        self.maxima = maxima
+        self.order = order
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, index):
+        started = time.perf_counter()
+        # Topics keep their (non-negative) id; documents and topicless posts get -(group id + 1)
+        keys = np.where(
+            (index.sources == SOURCE_DISCOURSE) & (index.topic_ids >= 0),
+            index.topic_ids, -(index.group_ids.astype(np.int64) + 1),
+        )
+        _, section_ids = np.unique(keys, return_inverse=True)
+        section_ids = section_ids.astype(np.int32)
+        order = np.argsort(section_ids, kind="stable")
+        offsets = np.searchsorted(section_ids[order], np.arange(section_ids.max() + 2 if len(order) else 1))
+
+        # One small reduction per section; ufunc.reduceat over rows is far slower on wide matrices
+        sums = np.zeros((len(offsets) - 1, index.embeddings.shape[1]), dtype=np.float32)
+        maxima = np.zeros_like(sums)
+        for section in range(len(sums)):
+            vectors = index.embeddings[order[offsets[section]:offsets[section + 1]]]
+            sums[section] = vectors.sum(axis=0)
+            maxima[section] = vectors.max(axis=0)
+        summaries = cls(section_ids, normalize_rows(sums), normalize_rows(maxima), order, offsets)
+        logger.info(f"Summarized {len(index)} chunks into {len(sums)} sections in {time.perf_counter() - started:.2f}s")
+        return summaries
+
+    def top_sections(self, query, n):
+        """The n best sections for a normalized query, best first, with their scores."""
+        scores = np.maximum(self.centroids @ query, self.maxima @ query)
+        if n < len(scores):
+            top = np.argpartition(-scores, n - 1)[:n]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+    def rows(self, sections):
+        """Row positions of every chunk in the given sections, in ascending order."""
+        if len(sections) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.order[self.offsets[s]:self.offsets[s + 1]] for s in sections]))
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+# Matryoshka truncation: the first `dim` components of each row, renormalized
+def truncate_embeddings(embeddings, dim):
+    return normalize_rows(np.array(embeddings[:, :dim], dtype=np.float32))
+
+
+# Walk candidates (sorted best first) keeping at most `per_group` rows per post/doc
+def select_top_grouped(candidates, group_ids, k, per_group):
+    selected = []
+    group_counts = {}
+    for position, row in enumerate(candidates):
+        group = group_ids[row]
+        if group_counts.get(group, 0) >= per_group:
+            continue
+        group_counts[group] = group_counts.get(group, 0) + 1
+        selected.append(position)
+        if len(selected) == k:
+            break
+    return np.asarray(selected, dtype=np.int64)
+
+
+# Maximal marginal relevance over the candidates' embedding submatrix
+def mmr_select(vectors, relevance, k, lambda_mult, group_ids=None, per_group=None):
+    """Greedily pick k rows maximizing lambda * relevance - (1 - lambda) * redundancy.
+
+    Redundancy is a row's highest cosine similarity to anything already picked; it is
+    updated with one matrix-vector product per pick, so the cost is O(k * n * d) with no
+    per-pair Python loop. Returns positions into `vectors`, in pick order.
+    """
+    n = len(relevance)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    redundancy = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    group_counts = {}
+    selected = []
+    for _ in range(min(k, n)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not available[best]:
+            break
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        if group_ids is not None:
+            group = group_ids[best]
+            group_counts[group] = group_counts.get(group, 0) + 1
+            if group_counts[group] >= per_group:
+                available &= group_ids != group
+    return np.asarray(selected, dtype=np.int64)
+
+
+# Per-query top k rows scoring at least `threshold`, from one matrix-matrix product per block of queries
+def batch_top_k(embeddings, queries, threshold, k, rows=None, block_size=64):
+    """Returns a (rows, scores) pair per query, best first.
+
+    `queries` are normalized row vectors. Scoring `block_size` queries at a time bounds the
+    score matrix at block_size x corpus floats. If `rows` is given only those are scored.
+    """
+    matrix = embeddings if rows is None else embeddings[rows]
+    if len(matrix) == 0:
+        return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(len(queries))]
+    results = []
+    for start in range(0, len(queries), block_size):
+        scores = np.asarray(queries[start:start + block_size], dtype=np.float32) @ matrix.T
+        for query_scores in scores:
+            candidates = np.flatnonzero(query_scores >= threshold)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-query_scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-query_scores[candidates], kind="stable")]
+            selected = candidates if rows is None else rows[candidates]
+            results.append((selected, query_scores[candidates]))
+    return results
+
+
+# Per-query top k as batch_top_k, but shortlisted on the coarse matrix and rescored at full dimension
+def two_stage_top_k(embeddings, coarse, queries, threshold, k, shortlist, rows=None, block_size=64):
+    """Returns a (rows, scores) pair per query, best first, with full-dimension scores.
+
+    The first pass keeps each query's `shortlist` best rows by coarse score, ignoring the
+    threshold since coarse scores are on a different scale; only those rows of `embeddings`
+    are read again. A row outside the shortlist is never returned, so recall depends on
+    `shortlist` being comfortably larger than k.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    shortlist = max(shortlist, k)
+    n = len(embeddings) if rows is None else len(rows)
+    if n == 0 or n <= shortlist:
+        # The shortlist would be everything (or there is nothing); score exactly
+        return batch_top_k(embeddings, queries, threshold, k, rows, block_size)
+    coarse_queries = truncate_embeddings(queries, coarse.shape[1])
+    matrix = coarse if rows is None else coarse[rows]
+    results = []
+    for start in range(0, len(queries), block_size):
+        coarse_scores = coarse_queries[start:start + block_size] @ matrix.T
+        for query, query_coarse in zip(queries[start:start + block_size], coarse_scores):
+            positions = np.argpartition(-query_coarse, shortlist - 1)[:shortlist]
+            candidates = np.sort(positions if rows is None else rows[positions])
+            scores = embeddings[candidates] @ query
+            keep = np.flatnonzero(scores >= threshold)
+            if len(keep) > k:
+                keep = keep[np.argpartition(-scores[keep], k - 1)[:k]]
+            keep = keep[np.argsort(-scores[keep], kind="stable")]
+            results.append((candidates[keep], scores[keep]))
+    return results
+
+
+# Two-level search: score the section summaries, then only the chunks of the best sections
+def hierarchical_top_k(embeddings, sections, query, threshold, k, n_sections, min_section_score):
+    """Top k rows of one normalized query as (rows, scores, number of chunks scored), best first.
+
+    Returns None instead when the best section scores below `min_section_score` or none of
+    the chunks in the chosen sections reaches `threshold`: the query matches no section
+    well, and the caller should search exhaustively.
+    """
+    top, section_scores = sections.top_sections(query, n_sections)
+    if len(top) == 0 or section_scores[0] < min_section_score:
+        return None
+    rows = sections.rows(top)
+    candidates, scores = batch_top_k(embeddings, query[None, :], threshold, k, rows)[0]
+    if len(candidates) == 0:
+        return None
+    return candidates, scores, len(rows)